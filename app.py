@@ -1,10 +1,31 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
 from dotenv import load_dotenv
 import os
-import requests
+import json
+import hashlib
+import time
+import providers
+from cache import Cache, make_key, cache_stats
+from geocode_cache import (geocode_cache, geocode_key, get_autocomplete, set_autocomplete, normalize_query,
+                           GEOCODE_NOT_FOUND_TTL)
 from geopy.geocoders import Nominatim
 from openai import OpenAI
-import pandas as pd
+from lga_crime import get_lga_crime_table, LgaCrimeDataError
+from lga_boundaries import get_lga_index, LgaBoundariesError
+from crime_records import (FORMATS as CRIME_RECORD_FORMATS, CrimeRecordsError, find_crime_data_file,
+                           get_crime_records, parse_period)
+from osm_tiles import (KINDS as OSM_KINDS, THIN_DISTANCES, get_tile_store, kinds_in_bbox, parse_bbox,
+                       thin_by_distance, tile_store_stats, tiles_for_bbox)
+from point_clusters import REGION_ZOOM, clusters_in_bbox, cluster_stats
+from vector_tiles import CONTENT_TYPE as VECTOR_TILE_TYPE, VectorTileError, available_layers, vector_tiles
+from lighting import LampIndex, routes_bbox, DEFAULT_LAMP_BUFFER, MAX_LAMP_BUFFER
+from place_merge import PlaceMerger
+from walking_graph import WalkingGraphError, get_walking_graph, walking_duration
+from route_geometry import POLYLINE_PRECISION, format_route, select_distinct_routes, tolerance_for_zoom
+from place_store import place_store, bounds_bbox, radius_bbox
+from conversations import conversations
+from crime_answers import answer_question, fast_path_stats
+from chat_cache import get_cached_reply, set_cached_reply
 
 # Load environment variables
 load_dotenv()
@@ -13,7 +34,7 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'development-key')
 
 # Initialize geocoder
-geocoder = Nominatim(user_agent="route_app")
+geocoder = Nominatim(user_agent="route_app", timeout=providers.nominatim.timeout[1])
 
 # API keys
 MAPBOX_TOKEN = os.getenv('MAPBOX_TOKEN', '')
@@ -24,6 +45,12 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 if not OPENAI_API_KEY:
     print("WARNING: No OpenAI API key found in environment variables. Chat functionality will be limited.")
 
+# Route results, keyed by coordinates snapped to ~10 m (4 decimal places)
+ROUTE_CACHE_PRECISION = 4
+ROUTE_CACHE_TTL = 6 * 60 * 60
+route_cache = Cache('routes', ttl=ROUTE_CACHE_TTL, max_entries=2000, max_bytes=32 * 1024 * 1024,
+                    db_path=os.getenv('ROUTE_CACHE_DB'))
+
 # Initialize OpenAI client only if API key is available
 openai_client = None
 if OPENAI_API_KEY:
@@ -33,55 +60,242 @@ if OPENAI_API_KEY:
 def index():
     return render_template('index.html', mapbox_token=MAPBOX_TOKEN)
 
+CHAT_MODEL = "gpt-4o-mini"
+CHAT_MAX_TOKENS = 1000
+CHAT_UNAVAILABLE_MESSAGE = "I'm sorry, but the chat service is currently unavailable due to missing API credentials. Please set up your OpenAI API key in the environment variables."
+
 @app.route('/chat', methods=['POST'])
 def chat():
-    """Handle chat messages using OpenAI API"""
+    """Handle chat messages using OpenAI API.
+    
+    Without a session_id field, messages is the whole conversation. With one
+    (null to start a session), messages holds only the turns added since the
+    last call, and the server keeps the rest; see session_chat_messages.
+    """
     data = request.json
     messages = data.get('messages', [])
+    stream = data.get('stream', False)  # Stream tokens as NDJSON as they are generated
     
     if not messages:
         return jsonify({'success': False, 'error': 'No messages provided'})
     
+    conversation = None
+    session_fields = {}
+    if 'session_id' in data:
+        conversation, created = conversations.get(data['session_id'])
+        if created and data['session_id']:
+            # The server restarted or the session expired; the client has to resend its history
+            conversations.delete(conversation.session_id)
+            return jsonify({'success': False, 'error': 'Chat session expired', 'session_expired': True})
+        messages = session_chat_messages(conversation, data)
+        session_fields = {'session_id': conversation.session_id}
+    
+    def on_reply(reply):
+        if conversation is not None:
+            with conversation.lock:
+                conversation.add('assistant', reply)
+                conversations.save(conversation)
+    
+    # Structured crime questions are answered from the crime table without calling the model
+    answer = crime_table_answer(data.get('messages', []))
+    if answer is not None:
+        on_reply(answer)
+        if stream:
+            return Response(stream_chat_text(answer, {'source': 'crime_table', **session_fields}),
+                            mimetype='application/x-ndjson')
+        return jsonify({'success': True, 'message': answer, 'source': 'crime_table', **session_fields})
+    
+    # Repeated standalone questions with the same context reuse the earlier reply
+    cached = get_cached_reply(messages)
+    if cached is not None:
+        on_reply(cached)
+        if stream:
+            return Response(stream_chat_text(cached, {'source': 'cache', **session_fields}),
+                            mimetype='application/x-ndjson')
+        return jsonify({'success': True, 'message': cached, 'source': 'cache', **session_fields})
+    
+    def on_model_reply(reply):
+        on_reply(reply)
+        set_cached_reply(messages, reply)
+    
+    if stream:
+        return Response(stream_with_context(stream_chat(messages, on_model_reply, session_fields)),
+                        mimetype='application/x-ndjson')
+    
     # Check if OpenAI client is initialized
     if not openai_client:
         return jsonify({
             'success': True,
-            'message': "I'm sorry, but the chat service is currently unavailable due to missing API credentials. Please set up your OpenAI API key in the environment variables."
+            'message': CHAT_UNAVAILABLE_MESSAGE,
+            **session_fields
         })
     
     try:
         response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
+            model=CHAT_MODEL,
             messages=messages,
             temperature=0.7,
-            max_tokens=1000
+            max_tokens=CHAT_MAX_TOKENS
         )
+        reply = response.choices[0].message.content
+        on_model_reply(reply)
         
         return jsonify({
             'success': True,
-            'message': response.choices[0].message.content
+            'message': reply,
+            **session_fields
         })
     except Exception as e:
-        error_message = str(e)
-        
-        # Check for quota exceeded error
-        if "insufficient_quota" in error_message or "exceeded your current quota" in error_message:
-            return jsonify({
-                'success': True,
-                'message': "I'm sorry, but the OpenAI API quota has been exceeded. Please update your API key or billing information. In the meantime, I can provide basic assistance with route planning and safety information based on available data."
-            })
-        # Handle rate limiting
-        elif "rate limit" in error_message.lower() or "rate_limit" in error_message:
-            return jsonify({
-                'success': True,
-                'message': "I'm processing too many requests right now. Please try again in a moment."
-            })
-        # General error
+        return jsonify({**chat_error_response(e), **session_fields})
+
+@app.route('/chat/<session_id>', methods=['DELETE'])
+def delete_chat_session(session_id):
+    """Forget a server-side conversation"""
+    return jsonify({'success': conversations.delete(session_id)})
+
+def session_chat_messages(conversation, data):
+    """Add a request's new turns to its conversation and build the messages for the model.
+    
+    Request fields: system (the system prompt, needed once per session),
+    messages (new user/assistant turns), context (system messages for this
+    turn only) and lga (an LGA name whose crime statistics are attached
+    from the server's table instead of being sent by the client).
+    """
+    context = [item['content'] if isinstance(item, dict) else item for item in data.get('context', [])]
+    if data.get('lga'):
+        lga_context = lga_context_message(data['lga'])
+        if lga_context:
+            context.append(lga_context)
+    
+    with conversation.lock:
+        if data.get('system'):
+            conversation.system = data['system']
+        for message in data.get('messages', []):
+            if message.get('role') in ('user', 'assistant') and message.get('content'):
+                conversation.add(message['role'], message['content'])
+        conversations.trim(conversation)
+        conversations.save(conversation)
+        return conversation.messages(context)
+
+def crime_table_answer(messages):
+    """Reply from the crime table when the latest user message is a structured crime question, else None"""
+    question = next((m.get('content') for m in reversed(messages) if m.get('role') == 'user'), None)
+    if not question:
+        return None
+    try:
+        table = get_lga_crime_table()
+    except LgaCrimeDataError as e:
+        print(f"Error loading LGA crime data: {e}")
+        return None
+    return answer_question(table, question)
+
+def lga_context_message(lga_name):
+    """Compact latest-period crime statistics for an LGA, as system message text, or None"""
+    try:
+        table = get_lga_crime_table()
+    except LgaCrimeDataError as e:
+        print(f"Error loading LGA crime data: {e}")
+        return None
+    summary = table.summary(lga_name)
+    if summary is None:
+        return None
+    
+    lines = [f"NSW crime statistics for {summary['name']} LGA, {summary['period']}: "
+             f"{summary['crimeCount']} incidents across all offences, combined rate {summary['crimeRate']} per 100,000 "
+             f"(rank {summary['rank']} of {summary['totalLgas']} LGAs, 1 = highest). "
+             f"Most common offence: {summary['mostCommonCrime']}. By offence (incidents, rate per 100,000, rank):"]
+    for stat in table.offence_stats(lga_name):
+        if stat['incidents'] is not None:
+            lines.append(f"- {stat['offence']}: {stat['incidents']}, {stat['rate']}, {stat['rank']}")
+    return "\n".join(lines)
+
+def chat_error_response(e):
+    """Map an OpenAI error to the response /chat sends: a friendly message for quota and rate limits"""
+    error_message = str(e)
+    
+    # Check for quota exceeded error
+    if "insufficient_quota" in error_message or "exceeded your current quota" in error_message:
+        return {
+            'success': True,
+            'message': "I'm sorry, but the OpenAI API quota has been exceeded. Please update your API key or billing information. In the meantime, I can provide basic assistance with route planning and safety information based on available data."
+        }
+    # Handle rate limiting
+    elif "rate limit" in error_message.lower() or "rate_limit" in error_message:
+        return {
+            'success': True,
+            'message': "I'm processing too many requests right now. Please try again in a moment."
+        }
+    # General error
+    else:
+        return {
+            'success': False, 
+            'error': f"Error communicating with AI service: {error_message}"
+        }
+
+def stream_chat_text(reply, extra):
+    """NDJSON lines for a reply that is already complete"""
+    yield json.dumps({'type': 'token', 'content': reply}) + "\n"
+    yield json.dumps({'type': 'done', 'message': reply, **extra}) + "\n"
+
+def stream_chat(messages, on_reply=None, extra=None):
+    """Yield NDJSON lines: a 'token' line per chunk of the reply, then 'done' with the full message.
+    
+    Quota and rate-limit errors become the same friendly message as the
+    non-streamed reply; other errors end the stream with an 'error' line.
+    """
+    def line(payload):
+        return json.dumps(payload) + "\n"
+    
+    extra = extra or {}
+    if not openai_client:
+        yield from stream_chat_text(CHAT_UNAVAILABLE_MESSAGE, extra)
+        return
+    
+    completion = None
+    parts = []
+    try:
+        completion = openai_client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=CHAT_MAX_TOKENS,
+            stream=True
+        )
+        for chunk in completion:
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if content:
+                parts.append(content)
+                yield line({'type': 'token', 'content': content})
+        reply = ''.join(parts)
+        if on_reply is not None:
+            on_reply(reply)
+        yield line({'type': 'done', 'message': reply, **extra})
+    except GeneratorExit:
+        # Client went away; closing the response stops the generation upstream
+        if completion is not None:
+            completion.close()
+        raise
+    except Exception as e:
+        reply = chat_error_response(e)
+        if reply['success'] and not parts:
+            yield from stream_chat_text(reply['message'], extra)
         else:
-            return jsonify({
-                'success': False, 
-                'error': f"Error communicating with AI service: {error_message}"
-            })
+            yield line({'type': 'error', 'error': reply.get('error') or reply['message'], **extra})
+
+@app.route('/provider_stats')
+def provider_stats():
+    """Latency and error counters for each upstream provider"""
+    return jsonify({'success': True, 'providers': providers.provider_stats()})
+
+@app.route('/cache_stats')
+def get_cache_stats():
+    """Hit/miss counters for the response caches"""
+    return jsonify({'success': True, 'caches': cache_stats(), 'osm_tiles': tile_store_stats(),
+                    'places': place_store.stats(), 'conversations': conversations.stats(),
+                    'chat_fast_path': fast_path_stats(), 'clusters': cluster_stats(),
+                    'vector_tiles': vector_tiles.stats()})
 
 @app.route('/geocode', methods=['POST'])
 def geocode_address():
@@ -89,17 +303,30 @@ def geocode_address():
     data = request.json
     address = data.get('address')
     
+    if not address:
+        return jsonify({'success': False, 'error': 'Address not found'})
+    
     try:
-        location = geocoder.geocode(address)
-        if location:
-            return jsonify({
-                'success': True,
-                'lat': location.latitude,
-                'lng': location.longitude,
-                'address': location.address
-            })
-        else:
+        key = geocode_key(address)
+        result = geocode_cache.get(key)
+        if result is None:
+            with providers.nominatim.track():
+                location = geocoder.geocode(address)
+            if location:
+                result = {
+                    'lat': location.latitude,
+                    'lng': location.longitude,
+                    'address': location.address
+                }
+                geocode_cache.set(key, result)
+            else:
+                # Remember misses too, but not for long
+                result = {'not_found': True}
+                geocode_cache.set(key, result, ttl=GEOCODE_NOT_FOUND_TTL)
+        
+        if result.get('not_found'):
             return jsonify({'success': False, 'error': 'Address not found'})
+        return jsonify({'success': True, **result})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -112,16 +339,39 @@ def get_route():
     waypoints = data.get('waypoints', [])
     alternatives = data.get('alternatives', False)
     use_mapbox = data.get('use_mapbox', True)  # Default to using Mapbox for better alternatives
+    geometry_format = data.get('format', 'geojson')  # 'geojson', 'polyline' or 'polyline6'
     
     if not start_coords or not end_coords:
         return jsonify({"success": False, "error": "Missing coordinates"})
+    if geometry_format != 'geojson' and geometry_format not in POLYLINE_PRECISION:
+        return jsonify({"success": False, "error": f"Unknown route format: {geometry_format}"})
     
+    # Optional simplification, in meters or as the detail visible at a map zoom
+    tolerance = data.get('tolerance')
     try:
+        if tolerance is None and data.get('zoom') is not None:
+            tolerance = tolerance_for_zoom(float(data['zoom']), float(start_coords[1]))
+        tolerance = round(float(tolerance), 1) if tolerance else None
+    except (TypeError, ValueError, IndexError):
+        return jsonify({"success": False, "error": "Invalid tolerance, zoom or start coordinates"})
+    
+    try:
+        # The offline walking graph answers first if configured as the primary router
+        if OFFLINE_ROUTING == 'primary':
+            try:
+                key = route_cache_key('offline', start_coords, end_coords, mode, waypoints, alternatives)
+                return jsonify(cached_route(key, lambda: get_route_offline(start_coords, end_coords, mode, waypoints, alternatives),
+                                            geometry_format, tolerance))
+            except WalkingGraphError as e:
+                print(f"Offline routing unavailable: {e}, falling back to online routing")
+        
         # Always use diverse_routes function when alternatives are requested
         # This gives us the best real route options
         if alternatives:
             try:
-                return get_diverse_routes(start_coords, end_coords, mode, waypoints)
+                key = route_cache_key('diverse', start_coords, end_coords, mode, waypoints, True)
+                return jsonify(cached_route(key, lambda: get_diverse_routes(start_coords, end_coords, mode, waypoints),
+                                            geometry_format, tolerance))
             except Exception as e:
                 print(f"Error generating diverse routes: {e}, falling back to standard routing")
         
@@ -129,145 +379,149 @@ def get_route():
         # Try Mapbox Directions API first for better alternatives
         if use_mapbox and MAPBOX_TOKEN:
             try:
-                return get_route_mapbox(start_coords, end_coords, mode, waypoints, alternatives)
+                key = route_cache_key('mapbox', start_coords, end_coords, mode, waypoints, alternatives)
+                return jsonify(cached_route(key, lambda: get_route_mapbox(start_coords, end_coords, mode, waypoints, alternatives),
+                                            geometry_format, tolerance))
             except Exception as e:
                 print(f"Mapbox API error: {e}, falling back to OSRM")
                 # Fall back to OSRM if Mapbox fails
                 pass
         
         # OSRM fallback - still a real route
-        return get_route_osrm(start_coords, end_coords, mode, waypoints, alternatives)
+        key = route_cache_key('osrm', start_coords, end_coords, mode, waypoints, alternatives)
+        try:
+            route = cached_route(key, lambda: get_route_osrm(start_coords, end_coords, mode, waypoints, alternatives),
+                                 geometry_format, tolerance)
+        except Exception as e:
+            if OFFLINE_ROUTING != 'fallback':
+                raise
+            print(f"OSRM error: {e}, falling back to offline routing")
+            route = {"success": False, "error": str(e)}
+        
+        # Last resort: the offline walking graph, if one has been built
+        if not route.get('success') and OFFLINE_ROUTING == 'fallback':
+            try:
+                key = route_cache_key('offline', start_coords, end_coords, mode, waypoints, alternatives)
+                route = cached_route(key, lambda: get_route_offline(start_coords, end_coords, mode, waypoints, alternatives),
+                                     geometry_format, tolerance)
+            except WalkingGraphError as e:
+                print(f"Offline routing unavailable: {e}")
+        return jsonify(route)
     except Exception as e:
         print(f"Error calculating route: {e}")
         return jsonify({"success": False, "error": str(e)})
 
+def route_cache_key(kind, start_coords, end_coords, mode, waypoints, alternatives):
+    """Cache key with coordinates snapped to a ~10 m grid"""
+    def snap(coords):
+        return [round(float(c), ROUTE_CACHE_PRECISION) for c in coords]
+    return make_key(kind, mode, snap(start_coords), snap(end_coords),
+                    [snap(wp) for wp in waypoints or []], bool(alternatives))
+
+def cached_route(key, compute, geometry_format='geojson', tolerance=None):
+    """Serve a route from the cache, computing and caching it on a miss.
+
+    Simplified or polyline-encoded versions are cached alongside the full route.
+    """
+    should_cache = lambda route: route.get('success')
+    if geometry_format == 'geojson' and not tolerance:
+        return route_cache.get_or_compute(key, compute, should_cache=should_cache)
+    return route_cache.get_or_compute(
+        make_key(key, geometry_format, tolerance),
+        lambda: format_route(cached_route(key, compute), geometry_format, tolerance),
+        should_cache=should_cache)
+
+# Local walking graph: 'primary' routes with it first, 'fallback' only when OSRM fails, 'off' never
+OFFLINE_ROUTING = os.getenv('OFFLINE_ROUTING', 'fallback')
+
+# Overall time budget for the diverse-routes fan-out; slower providers are dropped
+DIVERSE_ROUTES_DEADLINE = 8.0
+MAX_ALTERNATIVES = 3
+
+def fetch_mapbox_routes(start_coords, end_coords):
+    """Mapbox walking routes (optimal route plus its alternatives)"""
+    mapbox_response = providers.mapbox.get(
+        f"https://api.mapbox.com/directions/v5/mapbox/walking/{start_coords[0]},{start_coords[1]};{end_coords[0]},{end_coords[1]}",
+        params={
+            "access_token": MAPBOX_TOKEN,
+            "geometries": "geojson",
+            "alternatives": "true",
+            "overview": "full"
+        }
+    )
+
+    routes = []
+    if mapbox_response.status_code == 200:
+        mapbox_data = mapbox_response.json()
+        for route in mapbox_data.get('routes') or []:
+            routes.append({
+                "path": route['geometry']['coordinates'],
+                "distance": route['distance'],
+                "duration": route['duration'],
+                "source": "mapbox"
+            })
+    return routes
+
+def fetch_osrm_routes(start_coords, end_coords, scenic=False):
+    """OSRM walking routes; the scenic variant asks for a slower walking speed"""
+    start_str = f"{start_coords[0]},{start_coords[1]}"
+    end_str = f"{end_coords[0]},{end_coords[1]}"
+
+    params = {
+        "overview": "full",
+        "geometries": "geojson",
+        "alternatives": "true"
+    }
+    if scenic:
+        params["approaches"] = "curb;curb"
+        params["walking_speed"] = "1.0"  # Slower walking speed for more scenic routes
+
+    osrm_response = providers.osrm.get(
+        f"https://router.project-osrm.org/route/v1/walking/{start_str};{end_str}",
+        params=params
+    )
+
+    routes = []
+    if osrm_response.status_code == 200:
+        osrm_data = osrm_response.json()
+        walking_speed_m_per_s = 1.0 if scenic else 1.38  # 5 km/h, or slower for scenic
+        source = "osrm-scenic" if scenic else "osrm-fast"
+
+        for route in osrm_data.get('routes') or []:
+            distance = route['distance']
+            routes.append({
+                "path": route['geometry']['coordinates'],
+                "distance": distance,
+                "duration": distance / walking_speed_m_per_s * 1.1,
+                "source": source
+            })
+    return routes
+
 def get_diverse_routes(start_coords, end_coords, mode, waypoints):
     """Get maximally diverse route options by combining results from multiple routing approaches"""
-    all_routes = []
-    route_sources = []
-    
-    # Try Mapbox (optimal route)
+    # Query every provider at once; the list order is the merge priority
+    calls = []
     if MAPBOX_TOKEN:
-        try:
-            mapbox_response = requests.get(
-                f"https://api.mapbox.com/directions/v5/mapbox/walking/{start_coords[0]},{start_coords[1]};{end_coords[0]},{end_coords[1]}",
-                params={
-                    "access_token": MAPBOX_TOKEN,
-                    "geometries": "geojson",
-                    "alternatives": "true",
-                    "overview": "full"
-                }
-            )
-            
-            if mapbox_response.status_code == 200:
-                mapbox_data = mapbox_response.json()
-                if mapbox_data.get('routes'):
-                    for route in mapbox_data['routes']:
-                        all_routes.append({
-                            "path": route['geometry']['coordinates'],
-                            "distance": route['distance'],
-                            "duration": route['duration'],
-                            "source": "mapbox"
-                        })
-                        route_sources.append("mapbox")
-        except Exception as e:
-            print(f"Mapbox routing error: {e}")
-    
-    # Try OSRM (fastest route)
-    try:
-        start_str = f"{start_coords[0]},{start_coords[1]}"
-        end_str = f"{end_coords[0]},{end_coords[1]}"
-        
-        osrm_response = requests.get(
-            f"https://router.project-osrm.org/route/v1/walking/{start_str};{end_str}",
-            params={
-                "overview": "full",
-                "geometries": "geojson",
-                "alternatives": "true"
-            }
-        )
-        
-        if osrm_response.status_code == 200:
-            osrm_data = osrm_response.json()
-            if osrm_data.get('routes'):
-                walking_speed_m_per_s = 1.38  # 5 km/h
-                
-                for route in osrm_data['routes']:
-                    path = route['geometry']['coordinates']
-                    distance = route['distance']
-                    duration = distance / walking_speed_m_per_s * 1.1
-                    
-                    all_routes.append({
-                        "path": path,
-                        "distance": distance,
-                        "duration": duration,
-                        "source": "osrm-fast"
-                    })
-                    route_sources.append("osrm-fast")
-    except Exception as e:
-        print(f"OSRM routing error: {e}")
-    
-    # Try OSRM with different parameters (scenic route)
-    try:
-        osrm_scenic_response = requests.get(
-            f"https://router.project-osrm.org/route/v1/walking/{start_str};{end_str}",
-            params={
-                "overview": "full",
-                "geometries": "geojson",
-                "alternatives": "true",
-                "approaches": "curb;curb",
-                "walking_speed": "1.0"  # Slower walking speed for more scenic routes
-            }
-        )
-        
-        if osrm_scenic_response.status_code == 200:
-            osrm_data = osrm_scenic_response.json()
-            if osrm_data.get('routes'):
-                walking_speed_m_per_s = 1.0  # Slower speed
-                
-                for route in osrm_data['routes']:
-                    path = route['geometry']['coordinates']
-                    distance = route['distance']
-                    duration = distance / walking_speed_m_per_s * 1.1
-                    
-                    all_routes.append({
-                        "path": path,
-                        "distance": distance,
-                        "duration": duration,
-                        "source": "osrm-scenic"
-                    })
-                    route_sources.append("osrm-scenic")
-    except Exception as e:
-        print(f"OSRM scenic routing error: {e}")
+        calls.append(("Mapbox routing", lambda: fetch_mapbox_routes(start_coords, end_coords)))
+    calls.append(("OSRM routing", lambda: fetch_osrm_routes(start_coords, end_coords)))
+    calls.append(("OSRM scenic routing", lambda: fetch_osrm_routes(start_coords, end_coords, scenic=True)))
+
+    all_routes = []
+    for routes in providers.fan_out(calls, DIVERSE_ROUTES_DEADLINE):
+        if routes:
+            all_routes.extend(routes)
     
     # If we have at least one route, return the results
     if all_routes:
         # Select the primary (fastest) route
         primary_route = all_routes[0]
         
-        # Filter alternatives to ensure they're significantly different
-        filtered_alternatives = []
-        paths_to_compare = [primary_route["path"]]
-        
-        for i in range(1, len(all_routes)):
-            alternative = all_routes[i]
-            is_unique = True
-            
-            # Compare with all previously selected paths
-            for existing_path in paths_to_compare:
-                if not is_significantly_different(existing_path, alternative["path"]):
-                    is_unique = False
-                    break
-            
-            if is_unique:
-                filtered_alternatives.append(alternative)
-                paths_to_compare.append(alternative["path"])
-                
-                # Limit to max 3 alternatives for simplicity
-                if len(filtered_alternatives) >= 3:
-                    break
+        # Keep alternatives that don't mostly retrace the primary route or each other
+        # (max 3 alternatives for simplicity)
+        kept = select_distinct_routes([route["path"] for route in all_routes], MAX_ALTERNATIVES + 1)
+        filtered_alternatives = [all_routes[i] for i in kept[1:]]
         
-        return jsonify({
+        return {
             "success": True,
             "path": primary_route["path"],
             "distance": primary_route["distance"],
@@ -275,37 +529,36 @@ def get_diverse_routes(start_coords, end_coords, mode, waypoints):
             "alternatives": filtered_alternatives,
             "source": primary_route["source"],
             "all_real": True
-        })
+        }
     
     # If we couldn't get any routes, return an error instead of falling back to simulated routes
-    return jsonify({"success": False, "error": "No routes found for this journey. Please try a different destination or starting point."})
-
-def is_significantly_different(path1, path2):
-    """Check if two paths are significantly different from each other"""
-    # If path lengths are very different, they're different routes
-    if abs(len(path1) - len(path2)) > min(len(path1), len(path2)) * 0.2:
-        return True
-    
-    # Sample points along the routes and check for differences
-    num_points = min(10, min(len(path1), len(path2)) // 2)
-    if num_points < 3:
-        return False
-    
-    different_points = 0
-    for i in range(num_points):
-        idx = int(i * (min(len(path1), len(path2)) - 1) / (num_points - 1))
-        p1 = path1[idx]
-        p2 = path2[idx]
-        
-        # Calculate distance between points
-        dist = ((p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2) ** 0.5
-        
-        # If points are more than 100m apart (roughly 0.001 degrees), they're different
-        if dist > 0.001:
-            different_points += 1
+    return {"success": False, "error": "No routes found for this journey. Please try a different destination or starting point."}
+
+def get_route_offline(start_coords, end_coords, mode, waypoints, alternatives):
+    """Get a walking route from the local OSM walking graph (see walking_graph.py)"""
+    if mode != 'walking':
+        raise WalkingGraphError(f"The offline graph only has walking routes, not {mode}")
+    graph = get_walking_graph()
+    
+    # Snap the ends to the graph but keep the exact start and end points in the path
+    points = [start_coords] + list(waypoints or []) + [end_coords]
+    routes = graph.route(points, alternatives)
+    kept = select_distinct_routes([path for path, _ in routes], MAX_ALTERNATIVES + 1)
+    
+    results = []
+    for path, distance in (routes[i] for i in kept):
+        path = [list(start_coords)] + path + [list(end_coords)]
+        results.append({"path": path, "distance": distance, "duration": walking_duration(distance)})
     
-    # If more than 50% of sampled points are different, it's a different route
-    return different_points > num_points * 0.5
+    primary_route = results[0]
+    return {
+        "success": True,
+        "path": primary_route["path"],
+        "distance": primary_route["distance"],
+        "duration": primary_route["duration"],
+        "alternatives": results[1:],
+        "source": "offline"
+    }
 
 def get_route_mapbox(start_coords, end_coords, mode, waypoints, alternatives):
     """Get route using Mapbox Directions API"""
@@ -341,7 +594,7 @@ def get_route_mapbox(start_coords, end_coords, mode, waypoints, alternatives):
         params["alternatives"] = "true"
     
     # Make request to Mapbox
-    response = requests.get(mapbox_url, params=params)
+    response = providers.mapbox.get(mapbox_url, params=params)
     
     if response.status_code != 200:
         raise Exception(f"Mapbox API error: {response.status_code}")
@@ -375,14 +628,14 @@ def get_route_mapbox(start_coords, end_coords, mode, waypoints, alternatives):
                 "duration": alt_route['duration']
             })
     
-    return jsonify({
+    return {
         "success": True,
         "path": path,
         "distance": distance,
         "duration": duration,
         "alternatives": alternatives_data,
         "source": "mapbox"
-    })
+    }
 
 def get_route_osrm(start_coords, end_coords, mode, waypoints, alternatives):
     """Get route using OSRM API (open-source fallback)"""
@@ -418,12 +671,12 @@ def get_route_osrm(start_coords, end_coords, mode, waypoints, alternatives):
     if params:
         osrm_url += "&" + "&".join(params)
     
-    response = requests.get(osrm_url)
+    response = providers.osrm.get(osrm_url)
     route_data = response.json()
     
     # Check for valid route
     if route_data.get('code') != 'Ok' or not route_data.get('routes'):
-        return jsonify({"success": False, "error": "No route found"})
+        return {"success": False, "error": "No route found"}
     
     # Extract route geometry from the first route (primary)
     route = route_data['routes'][0]
@@ -452,14 +705,14 @@ def get_route_osrm(start_coords, end_coords, mode, waypoints, alternatives):
                 "duration": alt_duration
             })
     
-    return jsonify({
+    return {
         "success": True,
         "path": path,
         "distance": distance,
         "duration": duration,
         "alternatives": alternatives_data,
         "source": "osrm"
-    })
+    }
 
 @app.route('/points_of_interest', methods=['POST'])
 def get_points_of_interest():
@@ -506,15 +759,21 @@ def get_points_of_interest():
         if keyword:
             params['keyword'] = keyword
         
-        response = requests.get(url, params=params)
+        # Answer from the local place store when this area was searched recently
+        category = ('nearby', google_type, normalize_query(keyword))
+        stored = place_store.lookup_radius(category, center_lat, center_lng, radius)
+        if stored is not None:
+            pois = [dict(place, id=str(i + 1)) for i, place in enumerate(stored[:10])]  # Limit to 10 results
+            return jsonify({'success': True, 'pois': pois})
+        
+        response = providers.google_places.get(url, params=params)
         data = response.json()
         
         if data['status'] == 'OK':
             # Format POIs
-            pois = []
-            for i, place in enumerate(data['results'][:10]):  # Limit to 10 results
-                pois.append({
-                    'id': str(i + 1),
+            places = []
+            for place in data['results']:
+                places.append({
                     'name': place['name'],
                     'lat': place['geometry']['location']['lat'],
                     'lng': place['geometry']['location']['lng'],
@@ -522,7 +781,10 @@ def get_points_of_interest():
                     'rating': place.get('rating', None),
                     'address': place.get('vicinity', '')
                 })
+            place_store.store(category, *radius_bbox(center_lat, center_lng, radius), places,
+                              [place.get('place_id') for place in data['results']], is_truncated(data))
             
+            pois = [dict(place, id=str(i + 1)) for i, place in enumerate(places[:10])]  # Limit to 10 results
             return jsonify({'success': True, 'pois': pois})
         else:
             # If API call fails, use mock data as fallback
@@ -561,17 +823,24 @@ def search_places():
         }
         
         # Add location bias if provided
+        category = ('text', normalize_query(query))
         if location:
             params['location'] = f"{location[0]},{location[1]}"
             params['radius'] = 50000  # 50km radius
+            
+            # Answer from the local place store when this area was searched recently
+            stored = place_store.lookup_radius(category, location[0], location[1], params['radius'])
+            if stored is not None:
+                places = [dict(place, id=f"search-{i + 1}") for i, place in enumerate(stored[:10])]  # Limit to 10 results
+                return jsonify({'success': True, 'places': places})
         
-        response = requests.get(url, params=params)
+        response = providers.google_places.get(url, params=params)
         data = response.json()
         
         if data['status'] == 'OK':
             # Format results
             places = []
-            for i, place in enumerate(data['results'][:10]):  # Limit to 10 results
+            for place in data['results']:
                 place_type = 'custom'
                 if 'types' in place:
                     if 'restaurant' in place['types']:
@@ -580,7 +849,6 @@ def search_places():
                         place_type = 'park'
                 
                 places.append({
-                    'id': f"search-{i + 1}",
                     'name': place['name'],
                     'lat': place['geometry']['location']['lat'],
                     'lng': place['geometry']['location']['lng'],
@@ -588,7 +856,11 @@ def search_places():
                     'rating': place.get('rating', None),
                     'address': place.get('formatted_address', '')
                 })
+            if location:
+                place_store.store(category, *radius_bbox(location[0], location[1], params['radius']), places,
+                                  [place.get('place_id') for place in data['results']], is_truncated(data))
             
+            places = [dict(place, id=f"search-{i + 1}") for i, place in enumerate(places[:10])]  # Limit to 10 results
             return jsonify({'success': True, 'places': places})
         else:
             return jsonify({'success': False, 'error': f"Google Places API error: {data['status']}"})
@@ -608,57 +880,80 @@ def adjust_route():
         return jsonify({'success': False, 'error': 'Start and end points are required'})
     
     try:
-        # Map our travel mode to Mapbox profile
-        mapbox_profile = 'mapbox/driving'
-        if mode == 'walking':
-            mapbox_profile = 'mapbox/walking'
-        
-        # Format coordinates string with waypoints
-        coordinates = f"{start[0]},{start[1]};"
-        
-        # Add waypoints
-        for waypoint in waypoints:
-            coordinates += f"{waypoint[0]},{waypoint[1]};"
-        
-        # Add end point
-        coordinates += f"{end[0]},{end[1]}"
+        key = route_cache_key('adjust', start, end, mode, waypoints, False)
+        return jsonify(cached_route(key, lambda: get_adjusted_route(start, end, waypoints, mode)))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def get_adjusted_route(start, end, waypoints, mode):
+    """Route from start to end through the given waypoints using Mapbox"""
+    # Map our travel mode to Mapbox profile
+    mapbox_profile = 'mapbox/driving'
+    if mode == 'walking':
+        mapbox_profile = 'mapbox/walking'
+    
+    # Format coordinates string with waypoints
+    coordinates = f"{start[0]},{start[1]};"
+    
+    # Add waypoints
+    for waypoint in waypoints:
+        coordinates += f"{waypoint[0]},{waypoint[1]};"
+    
+    # Add end point
+    coordinates += f"{end[0]},{end[1]}"
+    
+    url = f"https://api.mapbox.com/directions/v5/{mapbox_profile}/{coordinates}"
+    
+    params = {
+        'access_token': MAPBOX_TOKEN,
+        'geometries': 'geojson',
+        'overview': 'full'
+    }
+    
+    response = providers.mapbox.get(url, params=params)
+    data = response.json()
+    
+    if 'routes' in data and len(data['routes']) > 0:
+        # Extract the route coordinates
+        route_coordinates = data['routes'][0]['geometry']['coordinates']
+        distance = data['routes'][0]['distance']
         
-        url = f"https://api.mapbox.com/directions/v5/{mapbox_profile}/{coordinates}"
+        # Recalculate duration based on realistic walking speed (5 km/h = 1.38 m/s)
+        # This overrides the API's duration which can sometimes be unrealistic
+        if mode == 'walking':
+            walking_speed_m_per_s = 1.38  # 5 km/h in meters per second
+            duration = distance / walking_speed_m_per_s  # in seconds
+            # Add extra time for elevation changes, intersections, etc. (about 10%)
+            duration = duration * 1.1
+        else:
+            duration = data['routes'][0]['duration']  # Use API duration for driving
         
-        params = {
-            'access_token': MAPBOX_TOKEN,
-            'geometries': 'geojson',
-            'overview': 'full'
+        return {
+            'success': True,
+            'path': route_coordinates,
+            'distance': distance,
+            'duration': duration
         }
-        
-        response = requests.get(url, params=params)
-        data = response.json()
-        
-        if 'routes' in data and len(data['routes']) > 0:
-            # Extract the route coordinates
-            route_coordinates = data['routes'][0]['geometry']['coordinates']
-            distance = data['routes'][0]['distance']
-            
-            # Recalculate duration based on realistic walking speed (5 km/h = 1.38 m/s)
-            # This overrides the API's duration which can sometimes be unrealistic
-            if mode == 'walking':
-                walking_speed_m_per_s = 1.38  # 5 km/h in meters per second
-                duration = distance / walking_speed_m_per_s  # in seconds
-                # Add extra time for elevation changes, intersections, etc. (about 10%)
-                duration = duration * 1.1
-            else:
-                duration = data['routes'][0]['duration']  # Use API duration for driving
-            
-            return jsonify({
-                'success': True,
-                'path': route_coordinates,
-                'distance': distance,
-                'duration': duration
-            })
-        else:
-            return jsonify({'success': False, 'error': 'No route found'})
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+    else:
+        return {'success': False, 'error': 'No route found'}
+
+# Google requires a short delay before a next_page_token becomes valid
+NEXT_PAGE_DELAY = 1.5
+MAX_PLACE_RESULTS = 60
+PLACES_PAGE_SIZE = 20
+
+# Generic terms that also get a Nearby Search, which often returns more results
+# than text search; value is the Google place type to ask for
+NEARBY_SEARCH_TYPES = {
+    'cafe': 'cafe',
+    'bar': 'bar',
+    'park': 'park',
+    'museum': 'museum',
+    'hotel': 'lodging',
+    'store': 'store',
+    'shop': 'store'
+}
+CUISINES = ['chinese', 'indian', 'italian', 'japanese']
 
 @app.route('/proxy_place_search', methods=['POST'])
 def proxy_place_search():
@@ -667,330 +962,55 @@ def proxy_place_search():
     query = data.get('query')
     location = data.get('location')  # [lat, lng]
     bounds = data.get('bounds')      # [[sw_lng, sw_lat], [ne_lng, ne_lat]]
-    place_type = data.get('type')    # Optional place type for filtering
+    stream = data.get('stream', False)  # Stream pages as NDJSON as they arrive
     
     if not query:
         return jsonify({'success': False, 'error': 'Search query is required'})
     
+    if stream:
+        return Response(stream_with_context(stream_place_search(query, location, bounds)),
+                        mimetype='application/x-ndjson')
+    
     try:
         print(f"DEBUG API: Searching for '{query}' with bounds: {bounds}")
+        merger = stored_place_search(query, location, bounds)
+        if merger is not None:
+            print(f"DEBUG API: Answered from place store: {len(merger)} places")
+            return jsonify({'success': True, 'places': merger.ranked()})
         
-        # Build Google Places API URL for text search
-        url = 'https://maps.googleapis.com/maps/api/place/textsearch/json'
-        params = {
-            'query': query,
-            'key': GOOGLE_MAPS_API_KEY,
-            'radius': 50000  # 50km max radius to get more results
-        }
-        
-        # Add location bias if provided
-        if location:
-            params['location'] = f"{location[0]},{location[1]}"
-        
-        # Add viewport bounds if provided - this is crucial for map-constrained search
-        if bounds and len(bounds) == 2:
-            sw = bounds[0]  # [lng, lat]
-            ne = bounds[1]  # [lng, lat]
-            params['bounds'] = f"{sw[1]},{sw[0]}|{ne[1]},{ne[0]}"  # Format: sw_lat,sw_lng|ne_lat,ne_lng
-        
-        # Make the API request
-        response = requests.get(url, params=params)
-        data = response.json()
-        print(f"DEBUG API: Places API returned status: {data['status']}, results: {len(data.get('results', []))}")
-        
-        # For certain generic queries like 'restaurant', also try the nearby search API
-        # which often returns more results than text search for generic terms
-        if query.lower() in ['restaurant', 'cafe', 'bar', 'park', 'museum', 'hotel', 'store', 'shop'] or 'restaurant' in query.lower():
-            print(f"DEBUG API: Using Nearby Search API for generic term: {query}")
-            nearby_url = 'https://maps.googleapis.com/maps/api/place/nearbysearch/json'
-            nearby_params = {
-                'key': GOOGLE_MAPS_API_KEY,
-                'radius': 50000
-            }
-            
-            if location:
-                nearby_params['location'] = f"{location[0]},{location[1]}"
-                
-            # Set type for nearby search
-            if query.lower() == 'restaurant' or 'restaurant' in query.lower():
-                nearby_params['type'] = 'restaurant'
-                if 'chinese' in query.lower():
-                    nearby_params['keyword'] = 'chinese'
-                elif 'indian' in query.lower():
-                    nearby_params['keyword'] = 'indian'
-                elif 'italian' in query.lower():
-                    nearby_params['keyword'] = 'italian'
-                elif 'japanese' in query.lower():
-                    nearby_params['keyword'] = 'japanese'
-                # Add more cuisine types as needed
-            elif query.lower() == 'cafe':
-                nearby_params['type'] = 'cafe'
-            elif query.lower() == 'bar':
-                nearby_params['type'] = 'bar'
-            elif query.lower() == 'park':
-                nearby_params['type'] = 'park'
-            elif query.lower() == 'museum':
-                nearby_params['type'] = 'museum'
-            elif query.lower() == 'hotel':
-                nearby_params['type'] = 'lodging'
-            elif query.lower() in ['store', 'shop']:
-                nearby_params['type'] = 'store'
-            
-            nearby_response = requests.get(nearby_url, nearby_params)
-            nearby_data = nearby_response.json()
-            
-            # Merge results
-            if nearby_data['status'] == 'OK':
-                print(f"DEBUG API: Nearby Search returned {len(nearby_data.get('results', []))} results")
-                if data['status'] == 'OK':
-                    # Add nearby results to text search results
-                    data['results'].extend(nearby_data['results'])
-                else:
-                    data = nearby_data
+        data = search_places_first_page(query, location, bounds)
         
         if data['status'] == 'OK':
-            # Collect all places
-            all_places = []
-            page_count = 1
+            merger = PlaceMerger(expand_bounds(bounds))
+            truncated = is_truncated(data)
             
             # Process the first page of results
+            page_count = 1
             print(f"DEBUG API: Processing page {page_count} with {len(data['results'])} results")
-            
-            # Create a more flexible bounds check - expand the bounds slightly to avoid
-            # missing places that are just on the edge
-            bounds_expanded = None
-            if bounds and len(bounds) == 2:
-                sw_lat, sw_lng = bounds[0][1], bounds[0][0]
-                ne_lat, ne_lng = bounds[1][1], bounds[1][0]
-                
-                # Expand bounds by 10%
-                lat_diff = abs(ne_lat - sw_lat) * 0.1
-                lng_diff = abs(ne_lng - sw_lng) * 0.1
-                
-                bounds_expanded = {
-                    'sw_lat': sw_lat - lat_diff,
-                    'sw_lng': sw_lng - lng_diff,
-                    'ne_lat': ne_lat + lat_diff,
-                    'ne_lng': ne_lng + lng_diff
-                }
-            
-            for i, place in enumerate(data['results']):
-                place_type = 'custom'
-                if 'types' in place:
-                    if 'restaurant' in place['types']:
-                        place_type = 'restaurant'
-                    elif 'park' in place['types'] or 'natural_feature' in place['types']:
-                        place_type = 'park'
-                    elif 'cafe' in place['types'] or 'bakery' in place['types']:
-                        place_type = 'cafe'
-                    elif 'bar' in place['types'] or 'night_club' in place['types']:
-                        place_type = 'bar'
-                
-                # Determine cuisine type if available
-                cuisine_type = ''
-                if 'chinese' in query.lower() and place_type == 'restaurant':
-                    cuisine_type = 'Chinese'
-                elif 'indian' in query.lower() and place_type == 'restaurant':
-                    cuisine_type = 'Indian'
-                elif 'italian' in query.lower() and place_type == 'restaurant':
-                    cuisine_type = 'Italian'
-                elif 'japanese' in query.lower() and place_type == 'restaurant':
-                    cuisine_type = 'Japanese'
-                
-                # Include this in the description if available
-                place_description = ''
-                if cuisine_type:
-                    place_description = f"{cuisine_type} restaurant"
-                
-                # Check if the place is within bounds (with expanded bounds)
-                if bounds_expanded:
-                    lat = place['geometry']['location']['lat']
-                    lng = place['geometry']['location']['lng']
-                    
-                    # Use expanded bounds for checking
-                    if not (bounds_expanded['sw_lat'] <= lat <= bounds_expanded['ne_lat'] and 
-                            bounds_expanded['sw_lng'] <= lng <= bounds_expanded['ne_lng']):
-                        # For restaurants, we'll be less strict with bounds to find more options
-                        if 'restaurant' in query.lower() and place_type == 'restaurant':
-                            # For restaurants, check if it's within a larger radius (2x expanded bounds)
-                            if ((bounds_expanded['sw_lat'] - lat_diff) <= lat <= (bounds_expanded['ne_lat'] + lat_diff) and 
-                                (bounds_expanded['sw_lng'] - lng_diff) <= lng <= (bounds_expanded['ne_lng'] + lng_diff)):
-                                # Include but mark as outside immediate view
-                                place_description = (place_description + " (slightly outside current view)").strip()
-                            else:
-                                continue
-                        else:
-                            continue  # Skip this place as it's outside the bounds
-                
-                all_places.append({
-                    'id': f"search-{len(all_places) + 1}",
-                    'name': place['name'],
-                    'lat': place['geometry']['location']['lat'],
-                    'lng': place['geometry']['location']['lng'],
-                    'type': place_type,
-                    'rating': place.get('rating', None),
-                    'address': place.get('formatted_address', '') or place.get('vicinity', ''),
-                    'description': place_description
-                })
+            merge_search_places(merger, data['results'], query)
             
             # If there's a next page token and we've got fewer than 60 places, fetch the next page
-            while 'next_page_token' in data and len(all_places) < 60:
-                page_token = data['next_page_token']
-                
-                # Google requires a short delay before using a next_page_token
-                import time
-                time.sleep(1.5)  # Reduced from 2 seconds to speed up searching
-                
-                # Fetch next page
-                next_page_url = f"https://maps.googleapis.com/maps/api/place/textsearch/json?pagetoken={page_token}&key={GOOGLE_MAPS_API_KEY}"
-                next_page_response = requests.get(next_page_url)
-                data = next_page_response.json()
+            # This response needs every page, so it waits out each token delay in this thread
+            while 'next_page_token' in data and len(merger) < MAX_PLACE_RESULTS:
+                time.sleep(NEXT_PAGE_DELAY)
+                data = get_next_places_page(data['next_page_token'])
                 
                 if data['status'] == 'OK':
                     page_count += 1
                     print(f"DEBUG API: Processing page {page_count} with {len(data['results'])} results")
-                    
-                    for place in data['results']:
-                        place_type = 'custom'
-                        if 'types' in place:
-                            if 'restaurant' in place['types']:
-                                place_type = 'restaurant'
-                            elif 'park' in place['types'] or 'natural_feature' in place['types']:
-                                place_type = 'park'
-                            elif 'cafe' in place['types'] or 'bakery' in place['types']:
-                                place_type = 'cafe'
-                            elif 'bar' in place['types'] or 'night_club' in place['types']:
-                                place_type = 'bar'
-                        
-                        # Determine cuisine type if available
-                        cuisine_type = ''
-                        if 'chinese' in query.lower() and place_type == 'restaurant':
-                            cuisine_type = 'Chinese'
-                        elif 'indian' in query.lower() and place_type == 'restaurant':
-                            cuisine_type = 'Indian'
-                        elif 'italian' in query.lower() and place_type == 'restaurant':
-                            cuisine_type = 'Italian'
-                        elif 'japanese' in query.lower() and place_type == 'restaurant':
-                            cuisine_type = 'Japanese'
-                        
-                        # Include this in the description if available
-                        place_description = ''
-                        if cuisine_type:
-                            place_description = f"{cuisine_type} restaurant"
-                        
-                        # Check bounds with the expanded bounds
-                        if bounds_expanded:
-                            lat = place['geometry']['location']['lat']
-                            lng = place['geometry']['location']['lng']
-                            
-                            # Use expanded bounds for checking
-                            if not (bounds_expanded['sw_lat'] <= lat <= bounds_expanded['ne_lat'] and 
-                                    bounds_expanded['sw_lng'] <= lng <= bounds_expanded['ne_lng']):
-                                # For restaurants, we'll be less strict with bounds to find more options
-                                if 'restaurant' in query.lower() and place_type == 'restaurant':
-                                    # For restaurants, check if it's within a larger radius (2x expanded bounds)
-                                    if ((bounds_expanded['sw_lat'] - lat_diff) <= lat <= (bounds_expanded['ne_lat'] + lat_diff) and 
-                                        (bounds_expanded['sw_lng'] - lng_diff) <= lng <= (bounds_expanded['ne_lng'] + lng_diff)):
-                                        # Include but mark as outside immediate view
-                                        place_description = (place_description + " (slightly outside current view)").strip()
-                                    else:
-                                        continue
-                                else:
-                                    continue
-                        
-                        all_places.append({
-                            'id': f"search-{len(all_places) + 1}",
-                            'name': place['name'],
-                            'lat': place['geometry']['location']['lat'],
-                            'lng': place['geometry']['location']['lng'],
-                            'type': place_type,
-                            'rating': place.get('rating', None),
-                            'address': place.get('formatted_address', '') or place.get('vicinity', ''),
-                            'description': place_description
-                        })
+                    merge_search_places(merger, data['results'], query)
                 else:
                     # If we get an error with the next page, just stop paginating
                     print(f"DEBUG API: Error fetching next page: {data['status']}")
                     break
             
             # If it's a restaurant query with cuisine type and we have few results, try a keyword search
-            if 'restaurant' in query.lower() and len(all_places) < 5:
-                cuisine_keywords = []
-                if 'chinese' in query.lower():
-                    cuisine_keywords.append('chinese food')
-                    cuisine_keywords.append('chinese restaurant')
-                if 'indian' in query.lower():
-                    cuisine_keywords.append('indian food')
-                    cuisine_keywords.append('indian restaurant')
-                if 'italian' in query.lower():
-                    cuisine_keywords.append('italian food')
-                    cuisine_keywords.append('italian restaurant')
-                if 'japanese' in query.lower():
-                    cuisine_keywords.append('japanese food')
-                    cuisine_keywords.append('japanese restaurant')
-                
-                for keyword in cuisine_keywords:
-                    # Try a direct keyword search
-                    keyword_url = 'https://maps.googleapis.com/maps/api/place/nearbysearch/json'
-                    keyword_params = {
-                        'key': GOOGLE_MAPS_API_KEY,
-                        'keyword': keyword,
-                        'radius': 50000
-                    }
-                    
-                    if location:
-                        keyword_params['location'] = f"{location[0]},{location[1]}"
-                    
-                    print(f"DEBUG API: Trying keyword search for: {keyword}")
-                    keyword_response = requests.get(keyword_url, keyword_params)
-                    keyword_data = keyword_response.json()
-                    
-                    if keyword_data['status'] == 'OK':
-                        print(f"DEBUG API: Keyword search found {len(keyword_data.get('results', []))} results")
-                        for place in keyword_data['results']:
-                            # Extract cuisine type from keyword
-                            cuisine_type = keyword.split()[0].capitalize()
-                            place_description = f"{cuisine_type} restaurant"
-                            
-                            # Check if it's a duplicate
-                            is_duplicate = False
-                            for existing_place in all_places:
-                                if (existing_place['name'] == place['name'] and 
-                                    abs(existing_place['lat'] - place['geometry']['location']['lat']) < 0.0001 and
-                                    abs(existing_place['lng'] - place['geometry']['location']['lng']) < 0.0001):
-                                    is_duplicate = True
-                                    break
-                            
-                            if not is_duplicate:
-                                # Check bounds with more flexibility for restaurants
-                                if bounds_expanded:
-                                    lat = place['geometry']['location']['lat']
-                                    lng = place['geometry']['location']['lng']
-                                    
-                                    # Use expanded bounds for checking
-                                    if not (bounds_expanded['sw_lat'] <= lat <= bounds_expanded['ne_lat'] and 
-                                            bounds_expanded['sw_lng'] <= lng <= bounds_expanded['ne_lng']):
-                                        # For restaurants, use even larger bounds
-                                        if ((bounds_expanded['sw_lat'] - lat_diff*2) <= lat <= (bounds_expanded['ne_lat'] + lat_diff*2) and 
-                                            (bounds_expanded['sw_lng'] - lng_diff*2) <= lng <= (bounds_expanded['ne_lng'] + lng_diff*2)):
-                                            # Include but mark as outside immediate view
-                                            place_description = f"{cuisine_type} restaurant (slightly outside current view)"
-                                        else:
-                                            continue
-                                
-                                all_places.append({
-                                    'id': f"search-{len(all_places) + 1}",
-                                    'name': place['name'],
-                                    'lat': place['geometry']['location']['lat'],
-                                    'lng': place['geometry']['location']['lng'],
-                                    'type': 'restaurant',
-                                    'rating': place.get('rating', None),
-                                    'address': place.get('vicinity', ''),
-                                    'description': place_description
-                                })
+            if 'restaurant' in query.lower() and len(merger) < 5:
+                search_cuisine_keywords(merger, query, location)
             
-            print(f"DEBUG API: Total places found: {len(all_places)}")
-            return jsonify({'success': True, 'places': all_places})
+            store_place_search(query, location, bounds, merger, truncated)
+            print(f"DEBUG API: Total places found: {len(merger)}")
+            return jsonify({'success': True, 'places': merger.ranked()})
         else:
             error_message = f"Google Places API error: {data['status']}"
             print(f"DEBUG API: {error_message}")
@@ -1000,122 +1020,333 @@ def proxy_place_search():
         print(f"DEBUG API: Exception: {error_message}")
         return jsonify({'success': False, 'error': error_message})
 
-@app.route('/crime_data')
-def crime_data():
-    """Serve the crime data CSV file"""
-    import os
-    from flask import send_from_directory, send_file
-    
-    # Check for the CSV in the route_app directory first
-    if os.path.exists('CrimeData.csv'):
-        return send_file('CrimeData.csv')
-    
-    # Then check for file in CODE3234 project
-    code3234_path = r'C:\Users\SD\Desktop\CODE3234 - W2 - 2025'
-    crime_data_file = os.path.join(code3234_path, 'CrimeData.csv')
-    if os.path.exists(crime_data_file):
-        return send_file(crime_data_file)
-    
-    # Finally, use our placeholder
-    return send_from_directory('static/data', 'CrimeData.csv')
-
-@app.route('/lga_crime_data')
-def lga_crime_data():
-    """Return crime data from the LgaRankings_27_Offences.xlsx file"""
-    import pandas as pd
-    import numpy as np
-    import json
-    import os
+def stream_place_search(query, location, bounds):
+    """Yield NDJSON lines: each page of places as soon as it arrives, then a summary line"""
+    def line(payload):
+        return json.dumps(payload) + "\n"
     
+    pending = None
     try:
-        # Path to the Excel file
-        excel_file = 'static/data/LgaRankings_27_Offences.xlsx'
+        merger = stored_place_search(query, location, bounds)
+        if merger is not None:
+            yield line({'type': 'page', 'page': 1, 'places': merger.ranked()})
+            yield line({'type': 'done', 'total': len(merger), 'pages': 1})
+            return
         
-        if not os.path.exists(excel_file):
-            return jsonify({'success': False, 'error': f'Excel file not found: {excel_file}'})
+        data = search_places_first_page(query, location, bounds)
+        if data['status'] != 'OK':
+            yield line({'type': 'error', 'error': f"Google Places API error: {data['status']}"})
+            return
         
-        # First, extract the offense type from the first few rows
-        offense_df = pd.read_excel(excel_file, header=None, nrows=3)
-        offense_type = None
-        for i in range(3):
-            val = offense_df.iloc[i, 0]
-            if isinstance(val, str) and 'incident' in val.lower():
-                offense_type = val
-                break
+        merger = PlaceMerger(expand_bounds(bounds))
+        truncated = is_truncated(data)
         
-        if not offense_type:
-            offense_type = "Domestic violence related assault incidents"
-            
-        # Read all rows from the file to manually process
-        raw_df = pd.read_excel(excel_file, header=None)
+        def schedule_next(data):
+            # The token delay runs on the provider scheduler while this page is being sent
+            if 'next_page_token' in data and len(merger) < MAX_PLACE_RESULTS:
+                return fetch_next_places_page(data['next_page_token'])
+            return None
         
-        # Find the header row (containing "Local Government Area")
-        header_row_idx = None
-        for i in range(raw_df.shape[0]):
-            if isinstance(raw_df.iloc[i, 0], str) and 'local government area' in raw_df.iloc[i, 0].lower():
-                header_row_idx = i
-                break
+        page_count = 1
+        places = merge_search_places(merger, data['results'], query)
+        pending = schedule_next(data)
+        yield line({'type': 'page', 'page': page_count, 'places': places})
         
-        if header_row_idx is None:
-            return jsonify({'success': False, 'error': 'Could not find the header row containing LGA information'})
+        while pending is not None:
+            data = pending.result()
+            pending = None
+            if data['status'] != 'OK':
+                print(f"DEBUG API: Error fetching next page: {data['status']}")
+                break
+            page_count += 1
+            places = merge_search_places(merger, data['results'], query)
+            pending = schedule_next(data)
+            yield line({'type': 'page', 'page': page_count, 'places': places})
         
-        # Extract header information
-        headers = raw_df.iloc[header_row_idx].tolist()
-        headers = [str(h).strip() if not pd.isna(h) else f"Column_{i}" for i, h in enumerate(headers)]
+        if 'restaurant' in query.lower() and len(merger) < 5:
+            places = search_cuisine_keywords(merger, query, location)
+            if places:
+                page_count += 1
+                yield line({'type': 'page', 'page': page_count, 'places': places})
         
-        # Get data rows (everything after the header)
-        data_rows = raw_df.iloc[header_row_idx+1:].copy()
-        data_rows.columns = range(data_rows.shape[1])  # Reset column names to indexes
+        store_place_search(query, location, bounds, merger, truncated)
+        yield line({'type': 'done', 'total': len(merger), 'pages': page_count})
+    except GeneratorExit:
+        # Client went away while a page was being sent; don't fetch the next one
+        if pending is not None:
+            pending.cancel()
+        raise
+    except Exception as e:
+        print(f"DEBUG API: Exception: {e}")
+        yield line({'type': 'error', 'error': str(e)})
+
+def search_places_first_page(query, location, bounds):
+    """Text search (plus Nearby Search for generic terms), merged into one Places response"""
+    # Build Google Places API URL for text search
+    url = 'https://maps.googleapis.com/maps/api/place/textsearch/json'
+    params = {
+        'query': query,
+        'key': GOOGLE_MAPS_API_KEY,
+        'radius': 50000  # 50km max radius to get more results
+    }
+    
+    # Add location bias if provided
+    if location:
+        params['location'] = f"{location[0]},{location[1]}"
+    
+    # Add viewport bounds if provided - this is crucial for map-constrained search
+    if bounds and len(bounds) == 2:
+        sw = bounds[0]  # [lng, lat]
+        ne = bounds[1]  # [lng, lat]
+        params['bounds'] = f"{sw[1]},{sw[0]}|{ne[1]},{ne[0]}"  # Format: sw_lat,sw_lng|ne_lat,ne_lng
+    
+    # Make the API request
+    response = providers.google_places.get(url, params=params)
+    data = response.json()
+    print(f"DEBUG API: Places API returned status: {data['status']}, results: {len(data.get('results', []))}")
+    
+    # For certain generic queries like 'restaurant', also try the nearby search API
+    # which often returns more results than text search for generic terms
+    query_lower = query.lower()
+    if query_lower in ['restaurant'] + list(NEARBY_SEARCH_TYPES) or 'restaurant' in query_lower:
+        print(f"DEBUG API: Using Nearby Search API for generic term: {query}")
+        nearby_url = 'https://maps.googleapis.com/maps/api/place/nearbysearch/json'
+        nearby_params = {
+            'key': GOOGLE_MAPS_API_KEY,
+            'radius': 50000
+        }
         
-        # Process rows into a clean format
-        crime_data = []
-        for i in range(data_rows.shape[0]):
-            row = data_rows.iloc[i]
-            lga_name = row[0]
-            
-            # Skip invalid or non-LGA rows
-            if not isinstance(lga_name, str) or pd.isna(lga_name) or lga_name.strip() == '':
-                continue
-                
-            # Skip footnotes, headers, etc.
-            if any(x in str(lga_name).lower() for x in ['note:', 'acknowledgement', 'total nsw', 'excludes', 'rates calculated']):
-                continue
-            
-            # Create LGA record
-            lga_data = {
-                "lga": lga_name,
-                "offense": offense_type,
-                "metrics": {}
-            }
-            
-            # Extract number, rate, and rank from columns 1-3 if available
-            # Column 1 should be Number
-            if len(row) > 1 and not pd.isna(row[1]) and row[1] != '':
-                lga_data["metrics"]["incidents"] = str(row[1])
-            
-            # Column 2 should be Rate
-            if len(row) > 2 and not pd.isna(row[2]) and row[2] != '':
-                lga_data["metrics"]["rate"] = str(row[2])
-                
-            # Column 3 should be Rank
-            if len(row) > 3 and not pd.isna(row[3]) and row[3] != '':
-                lga_data["metrics"]["rank"] = str(row[3])
+        if location:
+            nearby_params['location'] = f"{location[0]},{location[1]}"
             
-            crime_data.append(lga_data)
+        # Set type for nearby search
+        if 'restaurant' in query_lower:
+            nearby_params['type'] = 'restaurant'
+            for cuisine in CUISINES:
+                if cuisine in query_lower:
+                    nearby_params['keyword'] = cuisine
+                    break
+        else:
+            nearby_params['type'] = NEARBY_SEARCH_TYPES[query_lower]
+        
+        nearby_response = providers.google_places.get(nearby_url, nearby_params)
+        nearby_data = nearby_response.json()
         
-        # Sort by LGA name
-        crime_data.sort(key=lambda x: x['lga'])
+        # Merge results
+        if nearby_data['status'] == 'OK':
+            print(f"DEBUG API: Nearby Search returned {len(nearby_data.get('results', []))} results")
+            if data['status'] == 'OK':
+                # Add nearby results to text search results
+                data['results'].extend(nearby_data['results'])
+            else:
+                data = nearby_data
+    
+    return data
+
+def is_truncated(data):
+    """Whether Google may have cut a Places response off at its page size"""
+    return 'next_page_token' in data or len(data.get('results', [])) >= PLACES_PAGE_SIZE
+
+def place_search_area(query, location, bounds):
+    """Place store category and searched bbox for a place search, or None if it has no area"""
+    if bounds and len(bounds) == 2:
+        return ('search', normalize_query(query)), bounds_bbox(bounds)
+    if location:
+        return ('search', normalize_query(query)), radius_bbox(location[0], location[1], 50000)
+    return None
+
+def stored_place_search(query, location, bounds):
+    """PlaceMerger filled from the place store if this search's area is covered, else None"""
+    area = place_search_area(query, location, bounds)
+    if area is None:
+        return None
+    category, bbox = area
+    # Places may be kept up to two 10% steps beyond the 10% expanded bounds
+    stored = place_store.lookup_bbox(category, *bbox, grow=0.3 if bounds else 0.0)
+    if stored is None:
+        return None
+    
+    merger = PlaceMerger(expand_bounds(bounds))
+    merger.add(stored, [place.pop('place_id') for place in stored], [place.pop('max_margin') for place in stored])
+    return merger
+
+def store_place_search(query, location, bounds, merger, truncated):
+    """Save the places a search kept, with the bounds leeway each one was given"""
+    area = place_search_area(query, location, bounds)
+    if area is None:
+        return
+    category, bbox = area
+    places = [dict(place, place_id=place_id, max_margin=max_margin) for place, place_id, max_margin in merger.accepted]
+    place_store.store(category, *bbox, places, [place_id for _, place_id, _ in merger.accepted], truncated)
+
+def get_next_places_page(page_token):
+    """Next page of a text search; the token must already be valid"""
+    next_page_url = f"https://maps.googleapis.com/maps/api/place/textsearch/json?pagetoken={page_token}&key={GOOGLE_MAPS_API_KEY}"
+    return providers.google_places.get(next_page_url).json()
+
+def fetch_next_places_page(page_token):
+    """Future for the next page of a text search, fetched once the token becomes valid"""
+    return providers.call_later(NEXT_PAGE_DELAY, lambda: get_next_places_page(page_token))
+
+def expand_bounds(bounds):
+    """Viewport bounds grown by 10% so places just on the edge aren't missed, or None"""
+    if not bounds or len(bounds) != 2:
+        return None
+    sw_lat, sw_lng = bounds[0][1], bounds[0][0]
+    ne_lat, ne_lng = bounds[1][1], bounds[1][0]
+    
+    # Expand bounds by 10%
+    lat_diff = abs(ne_lat - sw_lat) * 0.1
+    lng_diff = abs(ne_lng - sw_lng) * 0.1
+    
+    return {
+        'sw_lat': sw_lat - lat_diff,
+        'sw_lng': sw_lng - lng_diff,
+        'ne_lat': ne_lat + lat_diff,
+        'ne_lng': ne_lng + lng_diff,
+        'lat_diff': lat_diff,
+        'lng_diff': lng_diff
+    }
+
+def merge_search_places(merger, results, query):
+    """Format Places search results and merge them; returns the places that were new"""
+    query_lower = query.lower()
+    places = []
+    margins = []
+    for place in results:
+        place_type = 'custom'
+        if 'types' in place:
+            if 'restaurant' in place['types']:
+                place_type = 'restaurant'
+            elif 'park' in place['types'] or 'natural_feature' in place['types']:
+                place_type = 'park'
+            elif 'cafe' in place['types'] or 'bakery' in place['types']:
+                place_type = 'cafe'
+            elif 'bar' in place['types'] or 'night_club' in place['types']:
+                place_type = 'bar'
         
-        # Sample data for debugging
-        sample_data = crime_data[:5] if crime_data else []
+        # Include the cuisine type in the description if available
+        place_description = ''
+        if place_type == 'restaurant':
+            for cuisine in CUISINES:
+                if cuisine in query_lower:
+                    place_description = f"{cuisine.capitalize()} restaurant"
+                    break
         
-        return jsonify({
-            'success': True,
-            'offense': offense_type,
-            'crime_data': crime_data,
-            'sample': sample_data
+        places.append({
+            'name': place['name'],
+            'lat': place['geometry']['location']['lat'],
+            'lng': place['geometry']['location']['lng'],
+            'type': place_type,
+            'rating': place.get('rating', None),
+            'address': place.get('formatted_address', '') or place.get('vicinity', ''),
+            'description': place_description
         })
+        # For restaurants, we'll be less strict with bounds to find more options
+        margins.append(1 if 'restaurant' in query_lower and place_type == 'restaurant' else 0)
+    
+    return merger.add(places, [place.get('place_id') for place in results], margins)
+
+def search_cuisine_keywords(merger, query, location):
+    """Keyword searches for the cuisines named in a restaurant query; returns the places that were new"""
+    cuisine_keywords = []
+    for cuisine in CUISINES:
+        if cuisine in query.lower():
+            cuisine_keywords.append(f'{cuisine} food')
+            cuisine_keywords.append(f'{cuisine} restaurant')
+    
+    added = []
+    for keyword in cuisine_keywords:
+        # Try a direct keyword search
+        keyword_url = 'https://maps.googleapis.com/maps/api/place/nearbysearch/json'
+        keyword_params = {
+            'key': GOOGLE_MAPS_API_KEY,
+            'keyword': keyword,
+            'radius': 50000
+        }
+        
+        if location:
+            keyword_params['location'] = f"{location[0]},{location[1]}"
+        
+        print(f"DEBUG API: Trying keyword search for: {keyword}")
+        keyword_response = providers.google_places.get(keyword_url, keyword_params)
+        keyword_data = keyword_response.json()
         
+        if keyword_data['status'] == 'OK':
+            print(f"DEBUG API: Keyword search found {len(keyword_data.get('results', []))} results")
+            # Extract cuisine type from keyword
+            cuisine_type = keyword.split()[0].capitalize()
+            places = [{
+                'name': place['name'],
+                'lat': place['geometry']['location']['lat'],
+                'lng': place['geometry']['location']['lng'],
+                'type': 'restaurant',
+                'rating': place.get('rating', None),
+                'address': place.get('vicinity', ''),
+                'description': f"{cuisine_type} restaurant"
+            } for place in keyword_data['results']]
+            # Even larger bounds for keyword matches
+            added.extend(merger.add(places, [place.get('place_id') for place in keyword_data['results']], 2))
+    return added
+
+@app.route('/crime_data')
+def crime_data():
+    """Crime incidents from CrimeData.csv.
+
+    With no query string the CSV file itself is served. Otherwise the records
+    are filtered by bbox (south,west,north,east), offence (a category or
+    subcategory, repeatable) and from/to (YYYY or YYYY-MM) and returned as
+    JSON, column by column (format=columns, the default) or as GeoJSON
+    (format=geojson), gzipped when the client accepts it.
+    """
+    if not request.args:
+        path = find_crime_data_file()
+        if path is None:
+            return jsonify({'success': False, 'error': 'Crime data file not found: CrimeData.csv'}), 404
+        return send_file(os.path.abspath(path))
+
+    output_format = request.args.get('format', 'columns')
+    if output_format not in CRIME_RECORD_FORMATS:
+        return jsonify({'success': False, 'error': f"Unknown format (one of {', '.join(CRIME_RECORD_FORMATS)})"}), 400
+    try:
+        bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        period_from = parse_period(request.args['from']) if request.args.get('from') else None
+        period_to = parse_period(request.args['to'], end=True) if request.args.get('to') else None
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'Invalid bbox or date range: {e}'}), 400
+    offences = sorted({o.strip().lower() for o in request.args.getlist('offence') if o.strip()})
+
+    try:
+        records = get_crime_records()
+    except CrimeRecordsError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+
+    compress = 'gzip' in request.headers.get('Accept-Encoding', '')
+    query_key = make_key('crime_data', [round(v, 6) for v in bbox] if bbox else None, offences, period_from, period_to)
+    etag = hashlib.sha1(f'{records.etag}:{query_key}:{output_format}:{compress}'.encode()).hexdigest()
+
+    # Revalidations are answered before any filtering or serializing
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        body = records.body(query_key, lambda: records.query(bbox, offences, period_from, period_to),
+                            output_format, compress)
+        response = Response(body, mimetype='application/json')
+        if compress:
+            response.content_encoding = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.last_modified = records.last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/lga_crime_data')
+def lga_crime_data():
+    """Return crime data from the LgaRankings_27_Offences.xlsx file"""
+    try:
+        table = get_lga_crime_table()
+    except LgaCrimeDataError as e:
+        return jsonify({'success': False, 'error': str(e)})
     except Exception as e:
         import traceback
         return jsonify({
@@ -1124,6 +1355,77 @@ def lga_crime_data():
             'traceback': traceback.format_exc()
         })
 
+    # Serve the pre-serialized body; repeat clients revalidate and get a 304
+    response = Response(table.body, mimetype='application/json')
+    response.set_etag(table.etag)
+    response.last_modified = table.last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def _lga_info(table, name):
+    """LGA name plus its crime summary, for /lga_for_coordinates"""
+    info = {'lga': name, 'name': name}
+    summary = table.summary(name) if table else None
+    if summary:
+        info.update(summary)
+    return info
+
+@app.route('/lga_for_coordinates', methods=['GET', 'POST'])
+def lga_for_coordinates():
+    """Find the LGA containing a point (GET lat/lng) or each of many points (POST points)"""
+    try:
+        index = get_lga_index()
+    except LgaBoundariesError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+
+    try:
+        table = get_lga_crime_table()
+    except LgaCrimeDataError:
+        table = None
+
+    if request.method == 'POST':
+        data = request.json or {}
+        points = data.get('points')  # [[lng, lat], ...]
+        if not points:
+            return jsonify({'success': False, 'error': 'Points are required'}), 400
+        try:
+            names = index.lookup_many(points)
+        except (TypeError, ValueError, IndexError):
+            return jsonify({'success': False, 'error': 'Points must be [lng, lat] pairs'}), 400
+
+        # One entry per distinct LGA, in route order, with how many points fall in it
+        summary = {}
+        for name in names:
+            if name is None:
+                continue
+            if name not in summary:
+                summary[name] = _lga_info(table, name)
+                summary[name]['points'] = 0
+            summary[name]['points'] += 1
+
+        return jsonify({
+            'success': True,
+            'lgas': names,
+            'summary': list(summary.values())
+        })
+
+    try:
+        lat = float(request.args.get('lat'))
+        lng = float(request.args.get('lng'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'lat and lng are required'}), 400
+
+    name = index.lookup(lng, lat)
+    if name is None:
+        return jsonify({'success': False, 'error': 'No LGA found for these coordinates'}), 404
+
+    info = _lga_info(table, name)
+    info['success'] = True
+    return jsonify(info)
+
+# Suggestions requested per autocomplete call
+AUTOCOMPLETE_LIMIT = 5
+
 @app.route('/geocode_autocomplete', methods=['POST'])
 def geocode_autocomplete():
     data = request.json
@@ -1136,6 +1438,13 @@ def geocode_autocomplete():
         return jsonify({'success': False, 'error': 'No query provided'})
     
     try:
+        cached = get_autocomplete(query, country, region, location, AUTOCOMPLETE_LIMIT)
+        if cached is not None:
+            return jsonify({
+                'success': True,
+                'suggestions': cached
+            })
+        
         # Construct parameters for Mapbox geocoding API
         params = {
             'access_token': os.environ.get('MAPBOX_TOKEN'),
@@ -1143,7 +1452,7 @@ def geocode_autocomplete():
             'country': country,
             'proximity': f'{location[1]},{location[0]}',  # lng,lat format for Mapbox
             'types': 'address,place,poi',
-            'limit': 5
+            'limit': AUTOCOMPLETE_LIMIT
         }
         
         # Add region bias if provided
@@ -1151,7 +1460,7 @@ def geocode_autocomplete():
             params['region'] = region
             
         # Make request to Mapbox geocoding API
-        response = requests.get(
+        response = providers.mapbox.get(
             f'https://api.mapbox.com/geocoding/v5/mapbox.places/{query}.json',
             params=params
         )
@@ -1171,6 +1480,8 @@ def geocode_autocomplete():
                 'id': feature.get('id', '')
             })
         
+        set_autocomplete(query, country, region, location, AUTOCOMPLETE_LIMIT, suggestions)
+        
         return jsonify({
             'success': True,
             'suggestions': suggestions
@@ -1180,45 +1491,157 @@ def geocode_autocomplete():
         app.logger.error(f"Autocomplete error: {str(e)}")
         return jsonify({'success': False, 'error': str(e)})
 
+# Converted feature layers, keyed by kinds, bbox and thinning distance
+OSM_FEATURES_TTL = 15 * 60
+osm_feature_cache = Cache('osm_features', ttl=OSM_FEATURES_TTL, max_entries=500, max_bytes=32 * 1024 * 1024)
+
+@app.route('/osm_features', methods=['GET'])
+def get_osm_features():
+    """OpenStreetMap point features of one or more kinds in a bounding box, as GeoJSON per kind"""
+    kinds = [kind for kind in request.args.get('kind', '').split(',') if kind]
+    bbox = request.args.get('bbox')  # "south,west,north,east"
+    proximity = request.args.get('proximity')  # meters; overrides THIN_DISTANCES
+    
+    if not kinds:
+        return jsonify({"success": False, "error": f"Missing kind (one or more of {', '.join(OSM_KINDS)})"})
+    unknown = [kind for kind in kinds if kind not in OSM_KINDS]
+    if unknown:
+        return jsonify({"success": False, "error": f"Unknown kind: {', '.join(unknown)}"})
+    if not bbox:
+        return jsonify({"success": False, "error": "Missing bounding box"})
+    
+    try:
+        south, west, north, east = parse_bbox(bbox)
+        proximity = float(proximity) if proximity is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "Invalid bounding box or proximity"})
+    
+    try:
+        key = make_key('osm_features', sorted(set(kinds)), [round(v, 5) for v in (south, west, north, east)], proximity)
+        result = osm_feature_cache.get_or_compute(
+            key, lambda: osm_feature_collections(kinds, south, west, north, east, proximity))
+        return jsonify({"success": True, **result})
+    except Exception as e:
+        print(f"Error fetching OSM features: {e}")
+        return jsonify({"success": False, "error": str(e)})
+
+def osm_feature_collections(kinds, south, west, north, east, proximity):
+    """GeoJSON FeatureCollection per kind, thinned by proximity, from one batched tile lookup"""
+    found = kinds_in_bbox(kinds, south, west, north, east)
+    data, counts, unfiltered_counts = {}, {}, {}
+    for kind in kinds:
+        elements = sorted(found[kind], key=lambda element: (element.get('type', 'node'), element['id']))
+        distance = proximity if proximity is not None else THIN_DISTANCES.get(kind, 0)
+        features = [osm_feature(element) for element in thin_by_distance(elements, distance)]
+        data[kind] = {"type": "FeatureCollection", "features": features}
+        counts[kind] = len(features)
+        unfiltered_counts[kind] = len(elements)
+    return {"data": data, "counts": counts, "unfiltered_counts": unfiltered_counts}
+
+def osm_feature(element):
+    properties = {"id": element['id'], "osm_type": element.get('type', 'node'), "tags": element['tags']}
+    if element['tags'].get('name'):
+        properties["name"] = element['tags']['name']
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [element['lon'], element['lat']]},
+        "properties": properties
+    }
+
+# Each region is one clustering dataset (and up to 256 tiles to fetch the first time)
+MAX_CLUSTER_REGIONS = 9
+# Regions clustered for the first time per request; the rest are reported as pending
+MAX_CLUSTER_BUILDS = 1
+
+@app.route('/osm_clusters', methods=['GET'])
+def get_osm_clusters():
+    """Clustered OpenStreetMap points of one kind for a map viewport at a zoom level"""
+    kind = request.args.get('kind', '')
+    bbox = request.args.get('bbox')  # "south,west,north,east"
+    
+    if kind not in OSM_KINDS:
+        return jsonify({"success": False, "error": f"Unknown kind: {kind}"})
+    if not bbox or request.args.get('zoom') is None:
+        return jsonify({"success": False, "error": "Missing bounding box or zoom"})
+    
+    try:
+        south, west, north, east = parse_bbox(bbox)
+        zoom = float(request.args['zoom'])
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "Invalid bounding box or zoom"})
+    
+    regions = len(tiles_for_bbox(south, west, north, east, REGION_ZOOM))
+    if regions > MAX_CLUSTER_REGIONS:
+        return jsonify({"success": False, "error": f"Bounding box too large ({regions} regions, max {MAX_CLUSTER_REGIONS})"})
+    
+    try:
+        features, pending = clusters_in_bbox(kind, south, west, north, east, zoom, MAX_CLUSTER_BUILDS)
+        return jsonify({
+            "success": True,
+            "count": len(features),
+            "pending": pending,
+            "data": {"type": "FeatureCollection", "features": features}
+        })
+    except Exception as e:
+        print(f"Error clustering {kind}: {e}")
+        return jsonify({"success": False, "error": str(e)})
+
+@app.route('/tiles/layers')
+def vector_tile_layers():
+    """Vector tile layers the server can render, so the map only offers those"""
+    return jsonify({"success": True, "layers": available_layers()})
+
+@app.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>.mvt')
+def vector_tile(layer, z, x, y):
+    """Mapbox Vector Tile of a safety overlay: street_lamps, traffic_signals, hospitals, police or lga_crime"""
+    try:
+        data = vector_tiles.get(layer, z, x, y)
+    except VectorTileError as e:
+        return jsonify({"success": False, "error": str(e)}), 404
+    except LgaBoundariesError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    except Exception as e:
+        print(f"Error rendering {layer} tile {z}/{x}/{y}: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+    
+    # Empty tiles are a 204, which Mapbox GL treats as a tile with no features
+    if not data:
+        return Response(status=204)
+    response = Response(data, mimetype=VECTOR_TILE_TYPE)
+    response.set_etag(hashlib.sha1(data).hexdigest())
+    response.cache_control.public = True
+    response.cache_control.max_age = 60 * 60
+    return response.make_conditional(request)
+
 @app.route('/street_lamps', methods=['POST'])
 def get_street_lamps():
-    """Query for street lamps data along a route from OpenStreetMap"""
+    """Street lamps in a bounding box, served from the tiled OpenStreetMap store"""
     data = request.json
-    bbox = data.get('bbox')
+    bbox = data.get('bbox')  # "south,west,north,east"
     
     if not bbox:
         return jsonify({"success": False, "error": "Missing bounding box"})
     
     try:
-        # Construct Overpass API query to get street lamps
-        query = f"""
-            [out:json];
-            (
-              node["highway"="street_lamp"]({bbox});
-            );
-            out body;
-        """
-        
-        # Fetch street lamps data from Overpass API
-        response = requests.post('https://overpass-api.de/api/interpreter', data=query)
-        
-        if not response.ok:
-            return jsonify({"success": False, "error": "Failed to fetch street lamp data"})
-        
-        lamp_data = response.json()
+        south, west, north, east = parse_bbox(bbox)
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "Invalid bounding box"})
+    
+    try:
+        lamps = get_tile_store('street_lamps').features_in_bbox(south, west, north, east)
         
         # Convert OSM data to GeoJSON
         features = []
-        for element in lamp_data.get('elements', []):
+        for element in lamps:
             feature = {
                 "type": "Feature",
                 "geometry": {
                     "type": "Point",
-                    "coordinates": [element.get('lon'), element.get('lat')]
+                    "coordinates": [element['lon'], element['lat']]
                 },
                 "properties": {
-                    "id": element.get('id'),
-                    "tags": element.get('tags', {})
+                    "id": element['id'],
+                    "tags": element['tags']
                 }
             }
             features.append(feature)
@@ -1237,5 +1660,40 @@ def get_street_lamps():
         print(f"Error fetching street lamps: {e}")
         return jsonify({"success": False, "error": str(e)})
 
+@app.route('/route_lighting', methods=['POST'])
+def route_lighting():
+    """Street-lighting coverage for one or more routes (same metrics as safety.js)"""
+    data = request.json or {}
+    paths = data.get('paths') or ([data['path']] if data.get('path') else [])  # [[[lng, lat], ...], ...]
+    
+    if not paths or any(not path or len(path) < 2 for path in paths):
+        return jsonify({"success": False, "error": "Each route needs at least two points"})
+    try:
+        buffer = float(data.get('buffer', DEFAULT_LAMP_BUFFER))
+    except (TypeError, ValueError):
+        buffer = None
+    if buffer is None or not 0 < buffer <= MAX_LAMP_BUFFER:
+        return jsonify({"success": False, "error": f"buffer must be more than 0 and at most {MAX_LAMP_BUFFER} meters"}), 400
+    
+    try:
+        # Lamps may come from the client ([[lng, lat], ...]); otherwise use the tile store
+        lamps = data.get('lamps')
+        if lamps is None:
+            south, west, north, east = routes_bbox(paths, padding_m=buffer * 2)
+            elements = get_tile_store('street_lamps').features_in_bbox(south, west, north, east)
+            lamps = [[element['lon'], element['lat']] for element in elements]
+        
+        index = LampIndex(lamps, buffer=buffer)
+        results = [index.analyze(path) for path in paths]
+        
+        return jsonify({
+            "success": True,
+            "lampsConsidered": len(lamps),
+            "results": results
+        })
+    except Exception as e:
+        print(f"Error analyzing route lighting: {e}")
+        return jsonify({"success": False, "error": str(e)})
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,202 @@
+"""In-process LRU/TTL cache with an optional SQLite tier.
+
+Values must be JSON-serializable: their serialized size is what the byte
+bound counts, and it is what the SQLite tier stores. The SQLite tier is
+shared by every worker that points at the same file and survives restarts;
+memory hits never touch it.
+
+Every cache registers itself so /cache_stats can report hits and misses.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_caches = []
+
+
+def make_key(*parts):
+    """Stable string key for any JSON-serializable parts"""
+    return json.dumps(parts, separators=(',', ':'), sort_keys=True)
+
+
+class SqliteTier:
+    """Persistent key/value store with per-entry expiry"""
+
+    def __init__(self, path, table):
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)'
+            )
+            self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT value, expires FROM "{self.table}" WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        if row[1] < time.time():
+            self.delete(key)
+            return None
+        return row
+
+    def set(self, key, value, expires):
+        with self._lock:
+            self._conn.execute(
+                f'INSERT OR REPLACE INTO "{self.table}" (key, value, expires) VALUES (?, ?, ?)',
+                (key, value, expires)
+            )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute(f'DELETE FROM "{self.table}" WHERE key = ?', (key,))
+            self._conn.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute(f'DELETE FROM "{self.table}" WHERE expires < ?', (time.time(),))
+            self._conn.commit()
+
+
+class Cache:
+    """LRU cache bounded by entry count and serialized size, with per-entry TTL"""
+
+    def __init__(self, name, ttl, max_entries=1000, max_bytes=32 * 1024 * 1024, db_path=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk = SqliteTier(db_path, name) if db_path else None
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size, expires)
+        self._bytes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.counters = {}
+
+        _caches.append(self)
+
+    def get(self, key):
+        """Cached value for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._remove(key)
+
+        if self.disk is not None:
+            try:
+                row = self.disk.get(key)
+            except sqlite3.Error as e:
+                print(f"{self.name} cache disk error: {e}")
+                row = None
+            if row is not None:
+                value = json.loads(row[0])
+                with self._lock:
+                    self.disk_hits += 1
+                    self._store(key, value, len(row[0]), row[1])
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def peek(self, key):
+        """Fresh in-memory value for key, or None, without touching stats or LRU order"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] >= time.time():
+                return entry[0]
+        return None
+
+    def count(self, counter, amount=1):
+        """Bump a cache-specific counter reported alongside the stats"""
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def set(self, key, value, ttl=None):
+        """Cache a JSON-serializable value"""
+        serialized = json.dumps(value, separators=(',', ':'))
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store(key, value, len(serialized), expires)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, serialized, expires)
+            except sqlite3.Error as e:
+                print(f"{self.name} cache disk error: {e}")
+
+    def get_or_compute(self, key, compute, should_cache=lambda value: True):
+        """Cached value for key, computing and caching it on a miss"""
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = compute()
+        if value is not None and should_cache(value):
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _store(self, key, value, size, expires):
+        # Caller holds the lock
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, size, expires)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        # Caller holds the lock
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                **self.counters,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 3) if lookups else None,
+                'disk': self.disk.path if self.disk else None
+            }
+
+
+def cache_stats():
+    """Stats for every cache, keyed by name"""
+    return {cache.name: cache.stats() for cache in _caches}
@@ -0,0 +1,120 @@
+"""Cache of /chat replies for repeated questions.
+
+A reply is cached under the normalized question plus a hash of the system
+messages sent with it (the prompt and the route, LGA and crime context), so
+the same question about a different route or area is a different entry.
+Clock times in the context are masked before hashing; the context still
+says whether it is day or night, but "10:42 PM" and "10:43 PM" share
+entries.
+
+Only standalone questions are cached: once the model has replied earlier in
+the conversation, a question like "what about at night?" depends on that
+history and is always sent to the model.
+
+When there is no exact match, a cached question with the same context and a
+character-trigram similarity of at least NEAR_DUPLICATE_SIMILARITY counts
+as a match ("how safe is redfern at night" / "how safe is redfern at
+nights"), provided both mention the same numbers and negations.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+
+from cache import Cache, make_key
+
+CHAT_CACHE_TTL = 6 * 60 * 60
+NEAR_DUPLICATE_SIMILARITY = 0.85
+
+# Questions remembered per context for near-duplicate matching
+MAX_QUESTIONS_PER_CONTEXT = 200
+MAX_CONTEXTS = 500
+
+chat_cache = Cache('chat', ttl=CHAT_CACHE_TTL, max_entries=2000, max_bytes=8 * 1024 * 1024,
+                   db_path=os.getenv('CHAT_CACHE_DB'))
+
+_punctuation = re.compile(r"[^\w\s']+")
+_clock_time = re.compile(r"\b\d{1,2}:\d{2}(:\d{2})?\s*([ap]\.?m\.?)?", re.IGNORECASE)
+_numbers = re.compile(r"\d+")
+_negations = re.compile(r"\b(not|no|never|without|isn't|aren't|don't|doesn't|can't|won't)\b")
+
+_questions_lock = threading.Lock()
+_questions = OrderedDict()  # context hash -> deque of (question, trigrams)
+
+
+def normalize_question(text):
+    """Lower-case, drop punctuation and collapse whitespace"""
+    return ' '.join(_punctuation.sub(' ', (text or '').lower()).split())
+
+
+def context_hash(messages):
+    """Hash of the system messages, with clock times masked"""
+    digest = hashlib.sha1()
+    for message in messages:
+        if message.get('role') == 'system':
+            digest.update(_clock_time.sub('<time>', message.get('content') or '').encode('utf-8'))
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _question(messages):
+    # The latest user message, if the model hasn't replied earlier in the conversation
+    if not messages or messages[-1].get('role') != 'user':
+        return None
+    if any(message.get('role') == 'assistant' for message in messages):
+        return None
+    return normalize_question(messages[-1].get('content'))
+
+
+def _trigrams(question):
+    padded = f"  {question} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similar(question, trigrams, candidate, candidate_trigrams):
+    if _numbers.findall(question) != _numbers.findall(candidate):
+        return False
+    if _negations.findall(question) != _negations.findall(candidate):
+        return False
+    union = len(trigrams | candidate_trigrams)
+    return union > 0 and len(trigrams & candidate_trigrams) / union >= NEAR_DUPLICATE_SIMILARITY
+
+
+def get_cached_reply(messages):
+    """Cached reply for these messages, exact or near-duplicate; None on a miss or if not cacheable"""
+    question = _question(messages)
+    if not question:
+        return None
+    context = context_hash(messages)
+    reply = chat_cache.get(make_key(question, context))
+    if reply is not None:
+        return reply
+
+    trigrams = _trigrams(question)
+    with _questions_lock:
+        candidates = list(_questions.get(context, ()))
+    for candidate, candidate_trigrams in reversed(candidates):
+        if _similar(question, trigrams, candidate, candidate_trigrams):
+            reply = chat_cache.peek(make_key(candidate, context))
+            if reply is not None:
+                chat_cache.count('near_duplicate_hits')
+                return reply
+    return None
+
+
+def set_cached_reply(messages, reply):
+    """Cache the model's reply to a standalone question"""
+    question = _question(messages)
+    if not question or not reply:
+        return
+    context = context_hash(messages)
+    chat_cache.set(make_key(question, context), reply)
+    with _questions_lock:
+        questions = _questions.get(context)
+        if questions is None:
+            questions = _questions[context] = deque(maxlen=MAX_QUESTIONS_PER_CONTEXT)
+            while len(_questions) > MAX_CONTEXTS:
+                _questions.popitem(last=False)
+        _questions.move_to_end(context)
+        questions.append((question, _trigrams(question)))
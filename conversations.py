@@ -0,0 +1,203 @@
+"""Server-side chat conversations, kept within a token budget.
+
+With a session id, /chat keeps the system prompt and the user/assistant
+turns here, so the client only sends what is new since its last call. Before
+each model call the history is trimmed to HISTORY_TOKEN_BUDGET: the oldest
+turns are dropped and the questions they asked are kept as a short "earlier
+in this conversation" note, so the prompt stops growing with the session.
+
+Token counts are estimated from character length, which is close enough for
+a budget and needs no tokenizer.
+
+Sessions live in this process's memory unless CHAT_SESSION_DB names a SQLite
+file. With it, every worker that points at the same file reads and writes
+the conversations there, so a follow-up turn can land on any worker.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from cache import SqliteTier
+
+HISTORY_TOKEN_BUDGET = 3000
+SESSION_TTL = 2 * 60 * 60
+MAX_SESSIONS = 5000
+
+# Dropped turns are remembered as at most this many questions, each shortened
+MAX_EARLIER_QUESTIONS = 10
+EARLIER_QUESTION_CHARS = 120
+
+CHARS_PER_TOKEN = 4
+
+# Expired rows are deleted from the SQLite tier once per this many new sessions
+PURGE_EVERY = 100
+
+
+def estimate_tokens(text):
+    return len(text or '') // CHARS_PER_TOKEN + 1
+
+
+class Conversation:
+    """System prompt, recent turns and a note of the questions trimmed from them"""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.system = None
+        self.turns = []
+        self.earlier_questions = []
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def to_json(self):
+        return json.dumps({'system': self.system, 'turns': self.turns, 'earlier_questions': self.earlier_questions},
+                          separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, session_id, value):
+        state = json.loads(value)
+        conversation = cls(session_id)
+        conversation.system = state['system']
+        conversation.turns = state['turns']
+        conversation.earlier_questions = state['earlier_questions']
+        return conversation
+
+    def add(self, role, content):
+        self.turns.append({'role': role, 'content': content})
+
+    def history_tokens(self):
+        return sum(estimate_tokens(turn['content']) for turn in self.turns)
+
+    def trim(self, budget=HISTORY_TOKEN_BUDGET):
+        """Drop the oldest turns until the history fits the budget; the latest turn always stays"""
+        tokens = self.history_tokens()
+        while tokens > budget and len(self.turns) > 1:
+            turn = self.turns.pop(0)
+            tokens -= estimate_tokens(turn['content'])
+            if turn['role'] == 'user':
+                question = turn['content'].strip()
+                if len(question) > EARLIER_QUESTION_CHARS:
+                    question = question[:EARLIER_QUESTION_CHARS].rstrip() + '...'
+                self.earlier_questions.append(question)
+                del self.earlier_questions[:-MAX_EARLIER_QUESTIONS]
+
+    def messages(self, context=()):
+        """Messages for the model: system prompt, earlier-questions note, history, with
+        this turn's context system messages just before the latest user message"""
+        messages = []
+        if self.system:
+            messages.append({'role': 'system', 'content': self.system})
+        if self.earlier_questions:
+            messages.append({
+                'role': 'system',
+                'content': "Earlier in this conversation the user also asked:\n- " + "\n- ".join(self.earlier_questions)
+            })
+        history = list(self.turns)
+        last = history.pop() if history and history[-1]['role'] == 'user' else None
+        messages.extend(history)
+        messages.extend({'role': 'system', 'content': content} for content in context)
+        if last is not None:
+            messages.append(last)
+        return messages
+
+
+class ConversationStore:
+    """Conversations by session id, expiring after SESSION_TTL idle"""
+
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS, db_path=None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.disk = SqliteTier(db_path, 'chat_sessions') if db_path else None
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+        self.created = 0
+        self.expired = 0
+        self.trimmed_turns = 0
+
+    def get(self, session_id):
+        """(conversation, created) for a session id; a new id is made if none is given"""
+        if self.disk is not None:
+            return self._get_shared(session_id)
+        now = time.time()
+        with self._lock:
+            conversation = self._sessions.get(session_id) if session_id else None
+            if conversation is not None and now - conversation.updated >= self.ttl:
+                del self._sessions[session_id]
+                self.expired += 1
+                conversation = None
+            created = conversation is None
+            if created:
+                conversation = Conversation(session_id or uuid.uuid4().hex)
+                self._sessions[conversation.session_id] = conversation
+                self.created += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            conversation.updated = now
+            self._sessions.move_to_end(conversation.session_id)
+        return conversation, created
+
+    def _get_shared(self, session_id):
+        # Each request gets its own copy; the SQLite row is the conversation
+        row = None
+        if session_id:
+            try:
+                row = self.disk.get(session_id)
+            except sqlite3.Error as e:
+                print(f"Chat session store error: {e}")
+        if row is not None:
+            return Conversation.from_json(session_id, row[0]), False
+
+        conversation = Conversation(session_id or uuid.uuid4().hex)
+        with self._lock:
+            self.created += 1
+            purge = self.created % PURGE_EVERY == 0
+        if purge:
+            try:
+                self.disk.purge_expired()
+            except sqlite3.Error as e:
+                print(f"Chat session store error: {e}")
+        return conversation, True
+
+    def save(self, conversation):
+        """Write a changed conversation to the SQLite tier (in-memory sessions need nothing)"""
+        if self.disk is None:
+            return
+        try:
+            self.disk.set(conversation.session_id, conversation.to_json(), time.time() + self.ttl)
+        except sqlite3.Error as e:
+            print(f"Chat session store error: {e}")
+
+    def trim(self, conversation, budget=HISTORY_TOKEN_BUDGET):
+        before = len(conversation.turns)
+        conversation.trim(budget)
+        with self._lock:
+            self.trimmed_turns += before - len(conversation.turns)
+
+    def delete(self, session_id):
+        if self.disk is not None:
+            try:
+                existed = self.disk.get(session_id) is not None
+                self.disk.delete(session_id)
+                return existed
+            except sqlite3.Error as e:
+                print(f"Chat session store error: {e}")
+                return False
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'created': self.created,
+                'expired': self.expired,
+                'trimmed_turns': self.trimmed_turns,
+                'disk': self.disk.path if self.disk else None
+            }
+
+
+conversations = ConversationStore(db_path=os.getenv('CHAT_SESSION_DB'))
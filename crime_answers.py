@@ -0,0 +1,257 @@
+"""Answers to structured crime questions straight from the LGA rankings table.
+
+Many chat questions are lookups in data the server already holds: "what's
+the robbery rate in Bayside", "how many break-ins in Penrith", "which LGA
+has the highest rate of car theft". CrimeQuestionMatcher recognises these
+and answer_question() writes the reply from the crime snapshot in well under
+a millisecond; anything else returns None and goes to the model as before.
+
+Only single questions that name an LGA (or ask for a ranking of crime,
+an offence or a rate) and use explicit statistics wording are answered here.
+Anything with safety, walking or advice wording, or with more than one
+sentence or clause, goes to the model, so open-ended questions such as "is
+it safe to walk through Redfern at night" still get a real answer.
+"""
+import re
+import threading
+
+# Extra ways people name each offence, besides its sheet name
+OFFENCE_SYNONYMS = {
+    'Assault - domestic violence': ['domestic violence', 'domestic assault', 'domestic assaults', 'dv assault'],
+    'Assault - non-domestic violence': ['assault', 'assaults', 'non-domestic assault', 'non-domestic violence'],
+    'Sexual Offences': ['sexual offence', 'sexual offense', 'sexual offenses', 'sexual assault', 'sexual assaults',
+                        'sex offences', 'sex crimes'],
+    'Robbery': ['robberies', 'mugging', 'muggings'],
+    'Break and enter dwelling': ['break and enter', 'break and enters', 'break-in', 'break-ins', 'break in',
+                                 'break ins', 'burglary', 'burglaries', 'home burglary'],
+    'Break and enter non-dwelling': ['commercial break-in', 'commercial break-ins', 'commercial burglary'],
+    'Motor vehicle theft': ['car theft', 'car thefts', 'stolen car', 'stolen cars', 'vehicle theft', 'car stealing'],
+    'Steal from motor vehicle': ['theft from car', 'theft from cars', 'theft from vehicles', 'car break-in',
+                                 'car break-ins'],
+    'Steal from retail store': ['shoplifting', 'retail theft'],
+    'Steal from dwelling': ['theft from home', 'theft from homes', 'theft from dwelling'],
+    'Steal from person': ['pickpocketing', 'pickpockets', 'bag snatching', 'theft from person', 'theft from people'],
+    'Fraud': ['frauds', 'scams'],
+    'Malicious damage to property': ['malicious damage', 'property damage', 'vandalism', 'graffiti'],
+    'Harassment threatening': ['harassment', 'threatening behaviour', 'threatening behavior', 'intimidation'],
+    'Receiving stolen goods': ['stolen goods'],
+    'Other theft': [],
+    'Arson': ['arsons'],
+    'Possession use of cannabis': ['cannabis', 'marijuana', 'weed'],
+    'Prohibited weapons offences': ['weapons offences', 'weapons offenses', 'weapon offences', 'weapons'],
+    'Trespass': ['trespassing'],
+    'Offensive conduct': [],
+    'Offensive language': ['swearing'],
+    'Liquor offences': ['liquor offenses', 'alcohol offences', 'alcohol offenses'],
+    'Breach AVO': ['avo breaches', 'breach of avo', 'avo'],
+    'Breach bail conditions': ['bail breaches', 'breach of bail'],
+    'Resist or hinder officer': ['resisting arrest', 'resist officer', 'hinder officer'],
+    'Transport regulatory offences': ['fare evasion', 'transport offences', 'transport offenses'],
+}
+
+# LGA name suffixes people usually leave out
+LGA_SUFFIXES = (' regional', ' shire', ' plains', ' valley')
+
+DEFAULT_TOP = 5
+MAX_TOP = 10
+
+_STATS_WORDING = re.compile(
+    r"\b(rates?|how many|number of|statistics|stats|figures|incidents|ranks?|ranking|ranked|"
+    r"most common|total crime|crime count|per 100,?000)\b")
+_RANKING_WORDING = re.compile(
+    r"\b(which|what|top|list)\b.*\b(lgas?|areas?|councils?|local government areas?|places?)\b.*"
+    r"\b(highest|most|worst|lowest|least|fewest|safest|top|best|most dangerous)\b|"
+    r"\b(top|worst|safest|best|most dangerous)\s+(\d+\s+)?(lgas?|areas|councils|local government areas)\b|"
+    r"\b(highest|lowest)\b.*\b(rates?|ranks?|numbers?|counts?)\b.*\b(lgas?|areas|councils|nsw)\b")
+# A ranking has to say what it ranks, or "which areas are safest" reads as a crime table
+_CRIME_TERMS = re.compile(r"\b(crimes?|criminal|offen[cs]es?|rates?|incidents)\b")
+# Advice and safety questions need the model, even when they also ask for numbers
+_ADVICE_WORDING = re.compile(r"\b(safe|unsafe|safety|walk|walks|walking|what should i|near me|at night|advice)\b")
+# A second sentence, or a clause starting a new question, after the first
+_MULTI_PART = re.compile(r"(?:[?!;]|\.(?=\s))\s*\S|,\s*(?:what|how|which|where|why|should|can|is|are|do)\b")
+_ASCENDING_WORDING = re.compile(r"\b(lowest|least|fewest|safest|best)\b")
+_COUNT_WORDING = re.compile(r"\b(number|count|incidents|total|how many)\b")
+_MOST_COMMON_WORDING = re.compile(r"\b(most common|most frequent|biggest|main|top) (crimes?|offences?|offenses?)\b")
+_NUMBER = re.compile(r"\b(\d{1,2})\b")
+
+
+def _alternation(phrases):
+    # Longest first, so "north sydney" wins over "sydney" at the same position
+    ordered = sorted(set(phrases), key=len, reverse=True)
+    return re.compile(r"(?<![\w-])(" + "|".join(re.escape(phrase) for phrase in ordered) + r")(?![\w-])")
+
+
+class CrimeQuestionMatcher:
+    """Intent matching and answers for one loaded crime table"""
+
+    def __init__(self, table):
+        self.table = table
+        snapshot = table.snapshot
+        self.snapshot = snapshot
+        self.period = len(snapshot.periods) - 1
+
+        self.lga_aliases = {}
+        for i, name in enumerate(snapshot.lgas):
+            self.lga_aliases[name.lower()] = i
+        for i, name in enumerate(snapshot.lgas):
+            for suffix in LGA_SUFFIXES:
+                if name.lower().endswith(suffix):
+                    self.lga_aliases.setdefault(name.lower()[:-len(suffix)], i)
+        self.lga_pattern = _alternation(self.lga_aliases)
+
+        self.offence_aliases = {}
+        for i, offence in enumerate(snapshot.offences):
+            self.offence_aliases[offence['sheet'].lower()] = i
+            for synonym in OFFENCE_SYNONYMS.get(offence['sheet'], []):
+                self.offence_aliases.setdefault(synonym, i)
+        self.offence_pattern = _alternation(self.offence_aliases)
+
+    def match(self, question):
+        """(intent, details) for a question the table can answer, or None"""
+        text = ' '.join(question.lower().replace('’', "'").split())
+        if _ADVICE_WORDING.search(text) or _MULTI_PART.search(text):
+            return None
+        lgas = []
+        for match in self.lga_pattern.finditer(text):
+            index = self.lga_aliases[match.group(1)]
+            if index not in lgas:
+                lgas.append(index)
+        offences = []
+        for match in self.offence_pattern.finditer(text):
+            index = self.offence_aliases[match.group(1)]
+            if index not in offences:
+                offences.append(index)
+        if len(offences) > 1:
+            return None
+
+        offence = offences[0] if offences else None
+        if not lgas and _RANKING_WORDING.search(text) and (offence is not None or _CRIME_TERMS.search(text)):
+            number = _NUMBER.search(text)
+            return 'ranking', {
+                'offence': offence,
+                'ascending': bool(_ASCENDING_WORDING.search(text)),
+                'metric': 'incidents' if _COUNT_WORDING.search(text) else 'rate',
+                'top': min(int(number.group(1)), MAX_TOP) if number and int(number.group(1)) > 0 else DEFAULT_TOP
+            }
+        if len(lgas) == 1 and _STATS_WORDING.search(text):
+            if offence is None and _MOST_COMMON_WORDING.search(text):
+                return 'most_common', {'lga': lgas[0]}
+            return 'lga_stats', {'lga': lgas[0], 'offence': offence}
+        return None
+
+    def answer(self, intent, details):
+        if intent == 'ranking':
+            return self._ranking(**details)
+        if intent == 'most_common':
+            return self._most_common(details['lga'])
+        return self._lga_stats(details['lga'], details['offence'])
+
+    def _value(self, metric, offence, lga):
+        value = self.snapshot.value(metric, offence, self.period, lga)
+        return None if value != value or value < 0 else value
+
+    def _ranked_count(self, offence):
+        ranks = self.snapshot.column('rank', offence, self.period)
+        return sum(1 for rank in ranks if rank == rank and rank > 0)
+
+    def _lga_stats(self, lga, offence):
+        name = self.snapshot.lgas[lga]
+        period = self.snapshot.periods[self.period]
+        if offence is None:
+            summary = self.table.summary(name)
+            rate = f", a combined rate of {summary['crimeRate']:,} per 100,000 people" if summary['crimeRate'] is not None else ''
+            rank = (f" That ranks {name} {summary['rank']} of {summary['totalLgas']} NSW LGAs for total crime rate "
+                    f"(1 = highest).") if summary['rank'] else ''
+            common = f" The most common offence was {summary['mostCommonCrime'].lower()}." if summary['mostCommonCrime'] else ''
+            return (f"In {period}, {name} recorded {summary['crimeCount']:,} incidents across the 27 major offence "
+                    f"categories{rate}.{rank}{common}")
+
+        sheet = self.snapshot.offences[offence]['sheet']
+        incidents = self._value('incidents', offence, lga)
+        if incidents is None:
+            return f"There is no {sheet.lower()} data for {name} in {period}."
+        answer = f"In {period}, {name} recorded {int(incidents):,} incidents of {sheet.lower()}"
+        rate = self._value('rate', offence, lga)
+        if rate is not None:
+            answer += f", a rate of {rate:,.1f} per 100,000 people"
+        rank = self._value('rank', offence, lga)
+        if rank is not None:
+            answer += f". That ranks {name} {int(rank)} of {self._ranked_count(offence)} NSW LGAs (1 = highest rate)."
+        else:
+            answer += ". BOCSAR does not rank this LGA for this offence (rates are not calculated for it)."
+        return answer
+
+    def _most_common(self, lga):
+        name = self.snapshot.lgas[lga]
+        counts = []
+        for offence, info in enumerate(self.snapshot.offences):
+            incidents = self._value('incidents', offence, lga)
+            if incidents is not None:
+                counts.append((incidents, info['sheet']))
+        if not counts:
+            return f"There is no offence data for {name}."
+        counts.sort(reverse=True)
+        top = [f"{sheet.lower()} ({int(incidents):,} incidents)" for incidents, sheet in counts[:3]]
+        listed = ', '.join(top[:-1]) + f" and {top[-1]}" if len(top) > 1 else top[0]
+        return f"The most common offences in {name} in {self.snapshot.periods[self.period]} were {listed}."
+
+    def _ranking(self, offence, ascending, metric, top):
+        period = self.snapshot.periods[self.period]
+        if offence is None:
+            summaries = [self.table.summary(name) for name in self.snapshot.lgas]
+            key = 'crimeCount' if metric == 'incidents' else 'crimeRate'
+            rows = [(s[key], s['name']) for s in summaries if s[key] is not None]
+            offence_name = 'crime'
+        else:
+            values = self.snapshot.column(metric, offence, self.period)
+            rows = [(value, name) for value, name in zip(values, self.snapshot.lgas) if value == value and value >= 0]
+            offence_name = self.snapshot.offences[offence]['sheet'].lower()
+        if not rows:
+            return None
+        rows.sort(key=lambda row: row[0], reverse=not ascending)
+        if metric == 'incidents':
+            heading = f"{'fewest' if ascending else 'most'} recorded {offence_name} incidents"
+            lines = [f"{position}. {name}: {value:,.0f}" for position, (value, name) in enumerate(rows[:top], 1)]
+        else:
+            heading = f"{'lowest' if ascending else 'highest'} {offence_name} rates"
+            lines = [f"{position}. {name}: {value:,.1f} per 100,000" for position, (value, name) in enumerate(rows[:top], 1)]
+        return f"NSW LGAs with the {heading} in {period}:\n" + "\n".join(lines)
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {'questions': 0, 'answered': 0, 'by_intent': {}}
+
+
+def get_matcher(table):
+    """Matcher for the current crime table, rebuilt when the table reloads"""
+    global _matcher
+    with _matcher_lock:
+        if _matcher is None or _matcher.table is not table:
+            _matcher = CrimeQuestionMatcher(table)
+        return _matcher
+
+
+def answer_question(table, question):
+    """Reply to a structured crime question from the table, or None to let the model answer"""
+    matcher = get_matcher(table)
+    matched = matcher.match(question or '')
+    answer = matcher.answer(*matched) if matched else None
+    with _stats_lock:
+        _stats['questions'] += 1
+        if answer is not None:
+            _stats['answered'] += 1
+            _stats['by_intent'][matched[0]] = _stats['by_intent'].get(matched[0], 0) + 1
+    return answer
+
+
+def fast_path_stats():
+    with _stats_lock:
+        return {
+            'questions': _stats['questions'],
+            'answered': _stats['answered'],
+            'by_intent': dict(_stats['by_intent']),
+            'hit_rate': round(_stats['answered'] / _stats['questions'], 3) if _stats['questions'] else None
+        }
@@ -0,0 +1,265 @@
+"""Crime incident records from CrimeData.csv, parsed once into columns.
+
+The CSV is read with the csv module (so quoted fields with commas survive)
+the first time it is needed and again only when its mtime changes.
+Coordinates are kept as float arrays and every other column is
+dictionary-encoded: an integer code per record plus the column's distinct
+values, which suits BOCSAR's repetitive offence, LGA and suburb columns.
+Records without usable coordinates are dropped at load time, since the map
+cannot show them.
+
+query() filters on a bbox, offence category/subcategory and a
+month range with NumPy masks, and the matching records are serialized either
+column by column or as GeoJSON points. Serialized (and gzipped) bodies are
+kept per query, up to MAX_BODY_BYTES in total, so repeat requests skip the
+work entirely; bodies over MAX_CACHED_BODY are rebuilt each time instead.
+"""
+import csv
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Checked in order; the first that exists is served
+CRIME_DATA_FILES = [
+    'CrimeData.csv',
+    os.path.join(r'C:\Users\SD\Desktop\CODE3234 - W2 - 2025', 'CrimeData.csv'),
+    os.path.join('static', 'data', 'CrimeData.csv'),
+]
+
+# BOCSAR column names first, then the generic names app.js also accepts
+LAT_COLUMNS = ('bcsrgclat', 'Latitude')
+LNG_COLUMNS = ('bcsrgclng', 'Longitude')
+OFFENCE_COLUMNS = ('bcsrcat', 'OffenceCategory', 'bcsrgrp', 'OffenceType')
+YEAR_COLUMNS = ('incyear', 'Year')
+MONTH_COLUMNS = ('incmonth', 'Month')
+
+MONTH_NAMES = {name: i for i, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), 1)}
+
+MAX_BODIES = 32
+MAX_BODY_BYTES = 64 * 1024 * 1024
+MAX_CACHED_BODY = 8 * 1024 * 1024
+
+FORMATS = ('columns', 'geojson')
+
+
+class CrimeRecordsError(Exception):
+    """Raised when the crime data CSV is missing or unreadable"""
+
+
+def find_crime_data_file():
+    for path in CRIME_DATA_FILES:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _first(headers, names):
+    for name in names:
+        if name in headers:
+            return name
+    return None
+
+
+def _month(value):
+    value = value.strip().lower()
+    if value.isdigit():
+        return int(value)
+    return MONTH_NAMES.get(value[:3], 0)
+
+
+def parse_period(value, end=False):
+    """'YYYY' or 'YYYY-MM' (a day is ignored) -> YYYYMM, the whole year's last month if end"""
+    parts = value.strip().split('-')
+    year = int(parts[0])
+    month = int(parts[1]) if len(parts) > 1 else (12 if end else 1)
+    if not 1 <= month <= 12:
+        raise ValueError(f'Invalid month in {value!r}')
+    return year * 100 + month
+
+
+class CrimeRecords:
+    """Column-oriented crime records loaded from one CSV file"""
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.last_modified = key[0]
+        self.etag = hashlib.sha1(f'{path}:{key}'.encode()).hexdigest()[:16]
+
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            try:
+                headers = [header.strip() for header in next(reader)]
+            except StopIteration:
+                raise CrimeRecordsError(f'Crime data file is empty: {path}')
+            rows = [row for row in reader if len(row) >= len(headers)]
+
+        lat_column, lng_column = _first(headers, LAT_COLUMNS), _first(headers, LNG_COLUMNS)
+        if lat_column is None or lng_column is None:
+            raise CrimeRecordsError(f'Crime data file has no latitude/longitude columns: {path}')
+
+        lat_position, lng_position = headers.index(lat_column), headers.index(lng_column)
+        lats = np.array([_float(row[lat_position]) for row in rows], dtype=float)
+        lngs = np.array([_float(row[lng_position]) for row in rows], dtype=float)
+        valid = ~(np.isnan(lats) | np.isnan(lngs))
+        keep = np.flatnonzero(valid).tolist()
+        self.dropped = len(rows) - len(keep)
+        rows = [rows[i] for i in keep]
+
+        self.lat_column, self.lng_column = lat_column, lng_column
+        self.lats, self.lngs = lats[valid], lngs[valid]
+        self.columns = [header for header in headers if header not in (lat_column, lng_column)]
+
+        # Dictionary-encode every other column: codes[i] indexes values
+        self.codes, self.values = {}, {}
+        for header in self.columns:
+            position = headers.index(header)
+            lookup = {}
+            codes = [lookup.setdefault(row[position].strip(), len(lookup)) for row in rows]
+            self.codes[header] = np.array(codes, dtype=np.int32)
+            self.values[header] = np.array(list(lookup), dtype=object)
+
+        self.offence_columns = [column for column in OFFENCE_COLUMNS if column in self.codes]
+        self.periods = self._periods(_first(self.columns, YEAR_COLUMNS), _first(self.columns, MONTH_COLUMNS))
+
+        self._bodies = OrderedDict()
+        self._body_bytes = 0
+        self._bodies_lock = threading.Lock()
+
+    def _periods(self, year_column, month_column):
+        """YYYYMM per record, 0 where the year is unknown"""
+        if year_column is None:
+            return np.zeros(len(self), dtype=np.int32)
+        years = np.array([int(v) if v.isdigit() else 0 for v in self.values[year_column]], dtype=np.int32)
+        periods = years[self.codes[year_column]] * 100
+        if month_column is not None:
+            months = np.array([_month(v) for v in self.values[month_column]], dtype=np.int32)
+            periods += months[self.codes[month_column]]
+        return np.where(periods >= 100, periods, 0)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def column(self, header, indices):
+        if header == self.lat_column:
+            return np.round(self.lats[indices], 6).tolist()
+        if header == self.lng_column:
+            return np.round(self.lngs[indices], 6).tolist()
+        return self.values[header][self.codes[header][indices]].tolist()
+
+    def query(self, bbox=None, offences=None, period_from=None, period_to=None):
+        """Indices of records inside bbox (south, west, north, east), matching any of offences
+        (category or subcategory, case-insensitive) and within the YYYYMM range"""
+        mask = np.ones(len(self), dtype=bool)
+        if bbox is not None:
+            south, west, north, east = bbox
+            mask &= (self.lats >= south) & (self.lats <= north) & (self.lngs >= west) & (self.lngs <= east)
+        if offences:
+            wanted = {offence.strip().lower() for offence in offences}
+            matches = np.zeros(len(self), dtype=bool)
+            for column in self.offence_columns:
+                codes = [i for i, value in enumerate(self.values[column]) if value.lower() in wanted]
+                matches |= np.isin(self.codes[column], codes)
+            mask &= matches
+        if period_from is not None:
+            mask &= self.periods >= period_from
+        if period_to is not None:
+            mask &= (self.periods <= period_to) & (self.periods > 0)
+        return np.flatnonzero(mask)
+
+    def serialize(self, indices, output_format='columns'):
+        """JSON body for the records at indices"""
+        headers = [self.lat_column, self.lng_column] + self.columns
+        columns = {header: self.column(header, indices) for header in headers}
+        result = {'success': True, 'count': len(indices), 'total': len(self)}
+        if output_format == 'geojson':
+            if self.columns:
+                records = [dict(zip(self.columns, values)) for values in zip(*(columns[h] for h in self.columns))]
+            else:
+                records = [{} for _ in range(len(indices))]
+            result['data'] = {
+                'type': 'FeatureCollection',
+                'features': [{
+                    'type': 'Feature',
+                    'geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+                    'properties': properties
+                } for lng, lat, properties in zip(columns[self.lng_column], columns[self.lat_column], records)]
+            }
+        else:
+            result['columns'] = headers
+            result['data'] = columns
+        return json.dumps(result, separators=(',', ':')).encode()
+
+    def body(self, query_key, compute_indices, output_format, compress):
+        """Serialized (optionally gzipped) body for a query, cached per query_key"""
+        key = (query_key, output_format, compress)
+        with self._bodies_lock:
+            if key in self._bodies:
+                self._bodies.move_to_end(key)
+                return self._bodies[key]
+
+        body = self.serialize(compute_indices(), output_format)
+        if compress:
+            body = gzip.compress(body, compresslevel=6)
+
+        if len(body) > MAX_CACHED_BODY:
+            return body
+        with self._bodies_lock:
+            old = self._bodies.pop(key, None)
+            if old is not None:
+                self._body_bytes -= len(old)
+            self._bodies[key] = body
+            self._body_bytes += len(body)
+            while len(self._bodies) > MAX_BODIES or self._body_bytes > MAX_BODY_BYTES:
+                _, evicted = self._bodies.popitem(last=False)
+                self._body_bytes -= len(evicted)
+        return body
+
+
+def _float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return float('nan')
+
+
+_records = None
+_records_lock = threading.Lock()
+
+
+def get_crime_records(path=None):
+    """Return the cached records, reloading if the CSV changed"""
+    global _records
+
+    path = path or find_crime_data_file()
+    if path is None:
+        raise CrimeRecordsError('Crime data file not found: CrimeData.csv')
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise CrimeRecordsError(f'Crime data file not found: {path}')
+    key = (stat.st_mtime, stat.st_size)
+
+    records = _records
+    if records is not None and records.path == path and records.key == key:
+        return records
+
+    with _records_lock:
+        # Another thread may have reloaded while we waited for the lock
+        records = _records
+        if records is not None and records.path == path and records.key == key:
+            return records
+
+        try:
+            _records = CrimeRecords(path, key)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            raise CrimeRecordsError(f'Could not read crime data file {path}: {e}')
+        print(f"Loaded {len(_records)} crime records from {path}"
+              + (f" ({_records.dropped} without coordinates skipped)" if _records.dropped else ""))
+        return _records
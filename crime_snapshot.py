@@ -0,0 +1,282 @@
+"""Compiled, memory-mappable snapshot of the LGA crime rankings workbook.
+
+The workbook holds one sheet per offence, each with an LGA per row and a
+(Number, Rate, Rank) column triple per yearly period. We compile every sheet
+into a single binary file:
+
+    magic (8 bytes) | version (uint32) | header length (uint32) | JSON header
+    | padding to 8 bytes | one float64 column per metric
+
+Each metric column is laid out [offence][period][lga], so the values for one
+offence and period are a contiguous run of LGAs. Cells the workbook marks as
+'nc' (not calculated) are stored as NOT_CALCULATED and empty cells as NaN.
+
+The app maps the file read-only, so loading takes milliseconds, needs neither
+pandas nor openpyxl, and every gunicorn worker shares the same page cache.
+
+Rebuild the snapshot whenever the workbook changes:
+
+    python crime_snapshot.py [workbook.xlsx] [output.bin]
+"""
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+SNAPSHOT_MAGIC = b'LGACRIME'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FILE = 'static/data/lga_crime_snapshot.bin'
+
+METRICS = ['incidents', 'rate', 'rank']
+
+# Sentinel for 'nc' cells; every real metric is non-negative
+NOT_CALCULATED = -1.0
+
+_PREAMBLE = struct.Struct('<8sII')
+
+
+class CrimeSnapshotError(Exception):
+    """Raised when a snapshot file is missing, corrupt or from another version"""
+
+
+class CrimeSnapshot:
+    """Columnar view over the compiled rankings for every offence and period"""
+
+    def __init__(self, header, columns, source_buffer=None):
+        self.header = header
+        self.lgas = header['lgas']
+        self.offences = header['offences']
+        self.periods = header['periods']
+        self.metrics = header['metrics']
+        self._columns = columns
+        # Keep the mmap alive for as long as the memoryviews point into it
+        self._source_buffer = source_buffer
+
+        self._lga_index = {name.strip().lower(): i for i, name in enumerate(self.lgas)}
+        self._offence_index = {}
+        for i, offence in enumerate(self.offences):
+            self._offence_index[offence['sheet'].lower()] = i
+
+    def lga_index(self, name):
+        """Index of an LGA by name (case-insensitive), or None"""
+        if not name:
+            return None
+        return self._lga_index.get(name.strip().lower())
+
+    def offence_index(self, sheet_name):
+        """Index of an offence by its sheet name (case-insensitive), or None"""
+        if not sheet_name:
+            return None
+        return self._offence_index.get(sheet_name.strip().lower())
+
+    def column(self, metric, offence, period):
+        """Values of a metric for every LGA, for one offence and period"""
+        n_lgas = len(self.lgas)
+        start = (offence * len(self.periods) + period) * n_lgas
+        return self._columns[metric][start:start + n_lgas]
+
+    def value(self, metric, offence, period, lga):
+        """A single metric cell; NaN if empty, NOT_CALCULATED if 'nc'"""
+        n_lgas = len(self.lgas)
+        return self._columns[metric][(offence * len(self.periods) + period) * n_lgas + lga]
+
+    def matches_source(self, workbook_path):
+        """Whether this snapshot was compiled from the workbook as it is now"""
+        try:
+            if os.path.getmtime(workbook_path) == self.header.get('source_mtime'):
+                return True
+            return _file_sha1(workbook_path) == self.header.get('source_sha1')
+        except OSError:
+            return False
+
+
+def format_value(value):
+    """Render a stored metric the way the workbook displayed it, or None if empty"""
+    if value is None or math.isnan(value):
+        return None
+    if value == NOT_CALCULATED:
+        return 'nc'
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cell_to_float(value):
+    if value is None or value == '':
+        return math.nan
+    if isinstance(value, str):
+        if value.strip().lower() == 'nc':
+            return NOT_CALCULATED
+        try:
+            return float(value)
+        except ValueError:
+            return math.nan
+    return float(value)
+
+
+def _is_lga_row(row):
+    # LGA rows have a name and at least one metric; footnotes only have text
+    name = row[0] if row else None
+    if not isinstance(name, str) or not name.strip():
+        return False
+    if name.strip().lower().startswith('total nsw'):
+        return False
+    return any(v is not None for v in row[1:])
+
+
+def compile_workbook(path):
+    """Parse every offence sheet of the rankings workbook into a CrimeSnapshot"""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        lgas = None
+        periods = None
+        offences = []
+        values = {metric: [] for metric in METRICS}
+
+        for ws in wb.worksheets:
+            rows = list(ws.iter_rows(values_only=True))
+
+            header_row_idx = None
+            for i, row in enumerate(rows):
+                if row and isinstance(row[0], str) and row[0].strip().lower() == 'local government area':
+                    header_row_idx = i
+                    break
+            if header_row_idx is None:
+                raise CrimeSnapshotError(f"Sheet '{ws.title}' has no 'Local Government Area' header row")
+
+            # The offence description sits in one of the rows above the header
+            title = ws.title
+            for row in rows[:header_row_idx]:
+                if row and isinstance(row[0], str) and 'incident' in row[0].lower():
+                    title = row[0]
+                    break
+
+            n_periods = (len(rows[header_row_idx]) - 1) // 3
+            if periods is None:
+                # Period labels are only stored as values on the first sheet;
+                # the others reference them through formulas
+                labels = [v for v in rows[0][1:] if isinstance(v, str) and v.startswith('Jan')]
+                periods = labels[:n_periods]
+                if len(periods) < n_periods:
+                    periods += [f"Period {i + 1}" for i in range(len(periods), n_periods)]
+            elif n_periods != len(periods):
+                raise CrimeSnapshotError(f"Sheet '{ws.title}' has {n_periods} periods, expected {len(periods)}")
+
+            data_rows = [row for row in rows[header_row_idx + 1:] if _is_lga_row(row)]
+            names = [row[0] for row in data_rows]
+            if lgas is None:
+                lgas = names
+            elif names != lgas:
+                raise CrimeSnapshotError(f"Sheet '{ws.title}' lists different LGAs from the first sheet")
+
+            offences.append({'sheet': ws.title, 'title': title})
+
+            for period in range(n_periods):
+                for m, metric in enumerate(METRICS):
+                    col = 1 + period * 3 + m
+                    values[metric].extend(_cell_to_float(row[col] if len(row) > col else None) for row in data_rows)
+    finally:
+        wb.close()
+
+    header = {
+        'version': SNAPSHOT_VERSION,
+        'source': os.path.basename(path),
+        'source_mtime': os.path.getmtime(path),
+        'source_sha1': _file_sha1(path),
+        'lgas': lgas or [],
+        'offences': offences,
+        'periods': periods or [],
+        'metrics': METRICS
+    }
+    columns = {metric: memoryview(array('d', values[metric])) for metric in METRICS}
+    return CrimeSnapshot(header, columns)
+
+
+def write_snapshot(snapshot, path):
+    """Write a snapshot to disk atomically"""
+    header = dict(snapshot.header)
+    offset = 0
+    column_meta = {}
+    for metric in snapshot.metrics:
+        length = len(snapshot._columns[metric])
+        column_meta[metric] = {'offset': offset, 'length': length}
+        offset += length * 8
+    header['columns'] = column_meta
+
+    header_bytes = json.dumps(header, sort_keys=True).encode('utf-8')
+    data_start = _PREAMBLE.size + len(header_bytes)
+    padding = (-data_start) % 8
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b'\0' * padding)
+        for metric in snapshot.metrics:
+            column = array('d', snapshot._columns[metric])
+            if sys.byteorder != 'little':
+                column.byteswap()
+            column.tofile(f)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path=SNAPSHOT_FILE):
+    """Memory-map a snapshot file written by write_snapshot"""
+    try:
+        with open(path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        raise CrimeSnapshotError(f"Cannot open crime snapshot {path}: {e}")
+
+    if len(buf) < _PREAMBLE.size:
+        raise CrimeSnapshotError(f"Crime snapshot {path} is truncated")
+    magic, version, header_len = _PREAMBLE.unpack_from(buf, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise CrimeSnapshotError(f"{path} is not a crime snapshot")
+    if version != SNAPSHOT_VERSION:
+        raise CrimeSnapshotError(f"Crime snapshot {path} is version {version}, expected {SNAPSHOT_VERSION}")
+
+    header = json.loads(bytes(buf[_PREAMBLE.size:_PREAMBLE.size + header_len]).decode('utf-8'))
+    data_start = _PREAMBLE.size + header_len
+    data_start += (-data_start) % 8
+
+    view = memoryview(buf)
+    columns = {}
+    for metric in header['metrics']:
+        meta = header['columns'][metric]
+        start = data_start + meta['offset']
+        end = start + meta['length'] * 8
+        if end > len(buf):
+            raise CrimeSnapshotError(f"Crime snapshot {path} is truncated")
+        if sys.byteorder == 'little':
+            columns[metric] = view[start:end].cast('d')
+        else:
+            column = array('d', view[start:end])
+            column.byteswap()
+            columns[metric] = memoryview(column)
+
+    return CrimeSnapshot(header, columns, source_buffer=buf)
+
+
+if __name__ == '__main__':
+    workbook = sys.argv[1] if len(sys.argv) > 1 else 'static/data/LgaRankings_27_Offences.xlsx'
+    output = sys.argv[2] if len(sys.argv) > 2 else SNAPSHOT_FILE
+
+    compiled = compile_workbook(workbook)
+    write_snapshot(compiled, output)
+    print(f"Wrote {output}: {len(compiled.offences)} offences, {len(compiled.periods)} periods, "
+          f"{len(compiled.lgas)} LGAs ({os.path.getsize(output)} bytes)")
@@ -0,0 +1,86 @@
+"""Caches for /geocode (Nominatim) and /geocode_autocomplete (Mapbox).
+
+Both are keyed by the normalized query, so "George St, Sydney" and
+"george st  sydney " share an entry. Nominatim only allows one request per
+second per application, so a cache hit here is also a request we don't have
+to queue behind that limit.
+
+Autocomplete sees a new query on every keystroke. When a shorter prefix of
+the query is already cached and its result set was not truncated by the
+provider's limit, the longer query can only narrow it down, so we answer
+by filtering the prefix's suggestions locally instead of calling Mapbox.
+"""
+import os
+import re
+
+from cache import Cache, make_key
+
+GEOCODE_TTL = 7 * 24 * 60 * 60
+GEOCODE_NOT_FOUND_TTL = 60 * 60
+AUTOCOMPLETE_TTL = 24 * 60 * 60
+
+# Shortest prefix worth reusing; one- and two-letter prefixes match too widely
+MIN_PREFIX_LENGTH = 3
+
+# Proximity is rounded to ~1 km so nearby users share autocomplete entries
+PROXIMITY_PRECISION = 2
+
+geocode_cache = Cache('geocode', ttl=GEOCODE_TTL, max_entries=5000, max_bytes=8 * 1024 * 1024,
+                      db_path=os.getenv('GEOCODE_CACHE_DB'))
+autocomplete_cache = Cache('autocomplete', ttl=AUTOCOMPLETE_TTL, max_entries=20000, max_bytes=16 * 1024 * 1024,
+                           db_path=os.getenv('GEOCODE_CACHE_DB'))
+
+_separators = re.compile(r'[\s,]+')
+
+
+def normalize_query(query):
+    """Lower-case, trim and collapse whitespace and commas"""
+    return _separators.sub(' ', (query or '').lower()).strip(' .')
+
+
+def geocode_key(address):
+    return make_key(normalize_query(address))
+
+
+def _autocomplete_key(normalized, country, region, location, limit):
+    proximity = [round(float(c), PROXIMITY_PRECISION) for c in location] if location else None
+    return make_key(normalized, country, region, proximity, limit)
+
+
+def _matches(suggestion, tokens):
+    # Every complete token must be a word of the place name; the last token
+    # may still be half typed, so it only has to start a word
+    words = normalize_query(suggestion.get('name', '')).split(' ')
+    for token in tokens[:-1]:
+        if token not in words:
+            return False
+    last = tokens[-1]
+    return any(word.startswith(last) for word in words)
+
+
+def get_autocomplete(query, country, region, location, limit):
+    """Cached suggestions for the query, reusing a narrow enough prefix; None on a miss"""
+    normalized = normalize_query(query)
+    suggestions = autocomplete_cache.get(_autocomplete_key(normalized, country, region, location, limit))
+    if suggestions is not None:
+        return suggestions
+
+    tokens = normalized.split(' ')
+    for end in range(len(normalized) - 1, MIN_PREFIX_LENGTH - 1, -1):
+        prefix_suggestions = autocomplete_cache.peek(
+            _autocomplete_key(normalized[:end].rstrip(), country, region, location, limit))
+        if prefix_suggestions is None:
+            continue
+        # A full page means the provider may have cut off matches for the longer query
+        if len(prefix_suggestions) >= limit:
+            return None
+        narrowed = [s for s in prefix_suggestions if _matches(s, tokens)]
+        if not narrowed:
+            return None
+        autocomplete_cache.count('prefix_hits')
+        return narrowed
+    return None
+
+
+def set_autocomplete(query, country, region, location, limit, suggestions):
+    autocomplete_cache.set(_autocomplete_key(normalize_query(query), country, region, location, limit), suggestions)
@@ -0,0 +1,232 @@
+"""Point-in-LGA lookup over NSW Local Government Area boundaries.
+
+Boundaries are read from a GeoJSON FeatureCollection of (Multi)Polygons, e.g.
+the NSW LGA boundaries published by NSW Spatial Services or the ABS, saved as
+static/data/nsw_lga_boundaries.geojson (or wherever LGA_BOUNDARIES_FILE
+points).
+
+Polygons are bulk-loaded into a Sort-Tile-Recursive packed R-tree on their
+bounding boxes, so a lookup only tests the one or two LGAs whose boxes hold
+the point. Each polygon also buckets its edges into latitude bands, so the
+ray-casting test only looks at the handful of edges near the point instead
+of every vertex of a detailed coastline.
+"""
+import json
+import math
+import os
+import threading
+
+LGA_BOUNDARIES_FILE = os.getenv('LGA_BOUNDARIES_FILE', 'static/data/nsw_lga_boundaries.geojson')
+
+# Feature properties that may hold the LGA name, in order of preference
+NAME_PROPERTIES = ['lga_name', 'LGA_NAME', 'LGA_NAME24', 'LGA_NAME21', 'lganame', 'abb_name', 'name', 'NAME']
+
+STR_NODE_CAPACITY = 8
+EDGES_PER_BAND = 16
+
+
+class LgaBoundariesError(Exception):
+    """Raised when the boundaries file is missing or cannot be read"""
+
+
+class LgaPolygon:
+    """One polygon (exterior ring plus holes) with its edges bucketed by latitude"""
+
+    def __init__(self, name, rings):
+        self.name = name
+        self.rings = rings
+
+        xs = [x for ring in rings for x, _ in ring]
+        ys = [y for ring in rings for _, y in ring]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+
+        edges = []
+        for ring in rings:
+            for i in range(len(ring) - 1):
+                (x1, y1), (x2, y2) = ring[i], ring[i + 1]
+                if y1 != y2:
+                    edges.append((x1, y1, x2, y2))
+            # Close the ring if the file didn't repeat the first vertex
+            if ring[0] != ring[-1] and ring[0][1] != ring[-1][1]:
+                edges.append((ring[-1][0], ring[-1][1], ring[0][0], ring[0][1]))
+
+        min_y, max_y = self.bbox[1], self.bbox[3]
+        self.n_bands = max(1, len(edges) // EDGES_PER_BAND)
+        self.band_height = (max_y - min_y) / self.n_bands or 1.0
+        self.bands = [[] for _ in range(self.n_bands)]
+        for edge in edges:
+            lo = self._band(min(edge[1], edge[3]))
+            hi = self._band(max(edge[1], edge[3]))
+            for band in range(lo, hi + 1):
+                self.bands[band].append(edge)
+
+    def _band(self, y):
+        band = int((y - self.bbox[1]) / self.band_height)
+        return min(max(band, 0), self.n_bands - 1)
+
+    def contains(self, x, y):
+        """Even-odd ray cast; holes are just more edges"""
+        min_x, min_y, max_x, max_y = self.bbox
+        if not (min_x <= x <= max_x and min_y <= y <= max_y):
+            return False
+        inside = False
+        for x1, y1, x2, y2 in self.bands[self._band(y)]:
+            if (y1 > y) != (y2 > y):
+                if x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                    inside = not inside
+        return inside
+
+
+class STRTree:
+    """Static R-tree bulk-loaded with the Sort-Tile-Recursive algorithm"""
+
+    def __init__(self, items, capacity=STR_NODE_CAPACITY):
+        # Each node is (bbox, children, is_leaf); leaves hold the items
+        self.capacity = capacity
+        level = [(item.bbox, item, True) for item in items]
+        if not level:
+            self.root = None
+            return
+        while len(level) > 1:
+            level = self._pack(level)
+        self.root = level[0]
+
+    def _pack(self, entries):
+        capacity = self.capacity
+        n_nodes = math.ceil(len(entries) / capacity)
+        n_slices = math.ceil(math.sqrt(n_nodes))
+        slice_size = n_slices * capacity
+
+        entries = sorted(entries, key=lambda e: (e[0][0] + e[0][2]) / 2)
+        parents = []
+        for s in range(0, len(entries), slice_size):
+            vertical_slice = sorted(entries[s:s + slice_size], key=lambda e: (e[0][1] + e[0][3]) / 2)
+            for n in range(0, len(vertical_slice), capacity):
+                children = vertical_slice[n:n + capacity]
+                bbox = (min(c[0][0] for c in children), min(c[0][1] for c in children),
+                        max(c[0][2] for c in children), max(c[0][3] for c in children))
+                parents.append((bbox, children, False))
+        return parents
+
+    def query_point(self, x, y):
+        """Items whose bounding box contains the point"""
+        results = []
+        if self.root is None:
+            return results
+        stack = [self.root]
+        while stack:
+            bbox, payload, is_leaf = stack.pop()
+            if not (bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3]):
+                continue
+            if is_leaf:
+                results.append(payload)
+            else:
+                stack.extend(payload)
+        return results
+
+    def query_bbox(self, min_x, min_y, max_x, max_y):
+        """Items whose bounding box intersects the box"""
+        results = []
+        if self.root is None:
+            return results
+        stack = [self.root]
+        while stack:
+            bbox, payload, is_leaf = stack.pop()
+            if bbox[2] < min_x or bbox[0] > max_x or bbox[3] < min_y or bbox[1] > max_y:
+                continue
+            if is_leaf:
+                results.append(payload)
+            else:
+                stack.extend(payload)
+        return results
+
+
+class LgaIndex:
+    """Spatial index answering "which LGA is this point in?" """
+
+    def __init__(self, path, mtime, polygons):
+        self.path = path
+        self.mtime = mtime
+        self.polygons = polygons
+        self.names = sorted({polygon.name for polygon in polygons})
+        self.tree = STRTree(polygons)
+
+    def lookup(self, lng, lat):
+        """Name of the LGA containing (lng, lat), or None"""
+        for polygon in self.tree.query_point(lng, lat):
+            if polygon.contains(lng, lat):
+                return polygon.name
+        return None
+
+    def lookup_many(self, points):
+        """LGA name (or None) for each [lng, lat] point"""
+        lookup = self.lookup
+        return [lookup(point[0], point[1]) for point in points]
+
+
+def _feature_name(properties):
+    for key in NAME_PROPERTIES:
+        value = properties.get(key)
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    return None
+
+
+def load_boundaries(path):
+    """Read a GeoJSON FeatureCollection into LgaPolygons"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            collection = json.load(f)
+    except (OSError, ValueError) as e:
+        raise LgaBoundariesError(f"Cannot read LGA boundaries {path}: {e}")
+
+    polygons = []
+    for feature in collection.get('features', []):
+        geometry = feature.get('geometry') or {}
+        name = _feature_name(feature.get('properties') or {})
+        if not name:
+            continue
+
+        if geometry.get('type') == 'Polygon':
+            parts = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiPolygon':
+            parts = geometry['coordinates']
+        else:
+            continue
+
+        for part in parts:
+            rings = [[(float(p[0]), float(p[1])) for p in ring] for ring in part if len(ring) >= 3]
+            if rings:
+                polygons.append(LgaPolygon(name, rings))
+
+    if not polygons:
+        raise LgaBoundariesError(f"No LGA polygons found in {path}")
+    return polygons
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_lga_index(path=LGA_BOUNDARIES_FILE):
+    """Return the cached index, rebuilding it if the boundaries file changed"""
+    global _index
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        raise LgaBoundariesError(f"LGA boundaries file not found: {path}")
+
+    index = _index
+    if index is not None and index.path == path and index.mtime == mtime:
+        return index
+
+    with _index_lock:
+        index = _index
+        if index is not None and index.path == path and index.mtime == mtime:
+            return index
+
+        polygons = load_boundaries(path)
+        _index = LgaIndex(path, mtime, polygons)
+        print(f"Indexed {len(polygons)} polygons for {len(_index.names)} LGAs from {path}")
+        return _index
@@ -0,0 +1,217 @@
+"""LGA crime rankings table, loaded once and kept in memory.
+
+The rankings are read from the compiled snapshot (see crime_snapshot.py),
+which maps in milliseconds without pandas. If the snapshot is missing or was
+built from a different workbook we compile the workbook in memory instead and
+log a reminder to rebuild it. Either way the table is indexed by LGA name,
+the JSON body served by /lga_crime_data is pre-serialized, and nothing is
+reloaded until one of the files' mtimes changes.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from crime_snapshot import (SNAPSHOT_FILE, CrimeSnapshotError, compile_workbook,
+                            format_value, load_snapshot)
+
+LGA_RANKINGS_FILE = 'static/data/LgaRankings_27_Offences.xlsx'
+
+# /lga_crime_data has always reported the first offence and period
+DEFAULT_OFFENCE = 0
+DEFAULT_PERIOD = 0
+
+
+class LgaCrimeDataError(Exception):
+    """Raised when neither the snapshot nor the rankings workbook can be loaded"""
+
+
+class LgaCrimeTable:
+    """Parsed rankings for one offence, indexed by LGA name"""
+
+    def __init__(self, snapshot, key, offence=DEFAULT_OFFENCE, period=DEFAULT_PERIOD):
+        self.snapshot = snapshot
+        self.key = key
+        self.offense = snapshot.offences[offence]['title'] if snapshot.offences else None
+
+        records = []
+        for i, lga_name in enumerate(snapshot.lgas):
+            metrics = {}
+            for metric in snapshot.metrics:
+                value = format_value(snapshot.value(metric, offence, period, i))
+                if value is not None:
+                    metrics[metric] = value
+            records.append({
+                "lga": lga_name,
+                "offense": self.offense,
+                "metrics": metrics
+            })
+
+        # Sort by LGA name
+        records.sort(key=lambda x: x['lga'])
+        self.records = records
+        self.by_name = {record['lga'].strip().lower(): record for record in records}
+
+        # Pre-serialize the /lga_crime_data response once per load
+        payload = {
+            'success': True,
+            'offense': self.offense,
+            'crime_data': records,
+            'sample': records[:5]
+        }
+        self.body = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.last_modified = max(mtime for mtime in key if mtime is not None)
+
+        self._summaries = None
+
+    def get(self, lga_name):
+        """Look up a record by LGA name (case-insensitive), or None"""
+        if not lga_name:
+            return None
+        return self.by_name.get(lga_name.strip().lower())
+
+    def summary(self, lga_name):
+        """All-offence totals for an LGA in the latest period, or None"""
+        if self._summaries is None:
+            self._summaries = self._build_summaries()
+        index = self.snapshot.lga_index(normalize_lga_name(lga_name))
+        if index is None:
+            index = self.snapshot.lga_index(lga_name)
+        if index is None:
+            return None
+        return self._summaries[index]
+
+    def offence_stats(self, lga_name):
+        """Latest-period incidents, rate and rank of every offence for an LGA, or None"""
+        snapshot = self.snapshot
+        index = snapshot.lga_index(normalize_lga_name(lga_name))
+        if index is None:
+            index = snapshot.lga_index(lga_name)
+        if index is None:
+            return None
+        period = len(snapshot.periods) - 1
+        stats = []
+        for offence, info in enumerate(snapshot.offences):
+            stat = {'offence': info['sheet']}
+            for metric in snapshot.metrics:
+                stat[metric] = format_value(snapshot.value(metric, offence, period, index))
+            stats.append(stat)
+        return stats
+
+    def _build_summaries(self):
+        snapshot = self.snapshot
+        period = len(snapshot.periods) - 1
+        n_lgas = len(snapshot.lgas)
+
+        counts = [0.0] * n_lgas
+        rates = [0.0] * n_lgas
+        has_rate = [True] * n_lgas
+        top_offence = [None] * n_lgas
+        top_count = [-1.0] * n_lgas
+
+        for offence in range(len(snapshot.offences)):
+            incidents = snapshot.column('incidents', offence, period)
+            offence_rates = snapshot.column('rate', offence, period)
+            for i in range(n_lgas):
+                count = incidents[i]
+                if count == count and count >= 0:
+                    counts[i] += count
+                    if count > top_count[i]:
+                        top_count[i] = count
+                        top_offence[i] = snapshot.offences[offence]['sheet']
+                rate = offence_rates[i]
+                if rate == rate and rate >= 0:
+                    rates[i] += rate
+                else:
+                    has_rate[i] = False
+
+        # Rank 1 is the highest total rate; LGAs without rates are unranked
+        ranked = sorted((i for i in range(n_lgas) if has_rate[i]), key=lambda i: rates[i], reverse=True)
+        ranks = {i: position + 1 for position, i in enumerate(ranked)}
+
+        return [{
+            'name': snapshot.lgas[i],
+            'period': snapshot.periods[period],
+            'crimeCount': int(counts[i]),
+            'crimeRate': round(rates[i], 1) if has_rate[i] else None,
+            'rank': ranks.get(i),
+            'totalLgas': len(ranked),
+            'mostCommonCrime': top_offence[i]
+        } for i in range(n_lgas)]
+
+
+def normalize_lga_name(name):
+    """Map boundary-file spellings ("SYDNEY", "Sydney (C)", "City of Sydney") onto rankings names"""
+    if not name:
+        return name
+    name = name.strip()
+    # ABS-style status suffixes, e.g. "Albury (C)" or "Bland (A)"
+    if name.endswith(')') and ' (' in name:
+        name = name[:name.rindex(' (')]
+    for prefix in ('City of ', 'Municipality of ', 'Shire of '):
+        if name.lower().startswith(prefix.lower()):
+            name = name[len(prefix):]
+    for suffix in (' City Council', ' Shire Council', ' Municipal Council', ' Council'):
+        if name.lower().endswith(suffix.lower()):
+            name = name[:-len(suffix)]
+    return name.strip()
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _load(snapshot_path, workbook_path):
+    snapshot = None
+    if os.path.exists(snapshot_path):
+        try:
+            snapshot = load_snapshot(snapshot_path)
+        except CrimeSnapshotError as e:
+            print(f"Ignoring crime snapshot: {e}")
+
+    if snapshot is not None and os.path.exists(workbook_path) and not snapshot.matches_source(workbook_path):
+        print(f"Crime snapshot {snapshot_path} is stale; run 'python crime_snapshot.py' to rebuild it")
+        snapshot = None
+
+    if snapshot is None:
+        if not os.path.exists(workbook_path):
+            raise LgaCrimeDataError(f'Excel file not found: {workbook_path}')
+        try:
+            snapshot = compile_workbook(workbook_path)
+        except CrimeSnapshotError as e:
+            raise LgaCrimeDataError(str(e))
+
+    return snapshot
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_lga_crime_table(snapshot_path=SNAPSHOT_FILE, workbook_path=LGA_RANKINGS_FILE):
+    """Return the cached table, reloading if the snapshot or workbook changed"""
+    global _table
+
+    key = (_mtime(snapshot_path), _mtime(workbook_path))
+    if key == (None, None):
+        raise LgaCrimeDataError(f'Excel file not found: {workbook_path}')
+
+    table = _table
+    if table is not None and table.key == key:
+        return table
+
+    with _table_lock:
+        # Another thread may have reloaded while we waited for the lock
+        table = _table
+        if table is not None and table.key == key:
+            return table
+
+        snapshot = _load(snapshot_path, workbook_path)
+        _table = LgaCrimeTable(snapshot, key)
+        print(f"Loaded {len(_table.records)} LGA crime records "
+              f"({len(snapshot.offences)} offences, {len(snapshot.periods)} periods)")
+        return _table
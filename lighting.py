@@ -0,0 +1,152 @@
+"""Street-lighting coverage of routes, scored on the server.
+
+Mirrors the analysis in static/js/safety.js (same buffer, thresholds and
+definitions) without its O(segments x lamps) pairwise loop:
+
+- lampCount: lamps within the buffer of any route segment
+- lampDensity: lampCount per 100 m of route
+- coveragePercentage: share of segments with a lamp within the buffer of
+  either endpoint
+- safetyLevel: 'high', 'medium' or 'low' from density and coverage
+
+Lamps are bucketed into a uniform grid of buffer-sized cells in a local
+metric projection, so each segment or vertex only looks at the lamps in the
+cells around it, and the distance maths is vectorized with NumPy.
+"""
+import math
+
+import numpy as np
+
+# Keep in sync with static/js/safety.js
+DEFAULT_LAMP_BUFFER = 25  # meters
+MAX_LAMP_BUFFER = 200  # meters; wider than a street, so further lamps don't light the route
+SAFE_LAMP_DENSITY = 1.5  # lamps per 100 meters is considered well-lit
+
+EARTH_RADIUS = 6371000  # meters
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters; works element-wise on arrays"""
+    lat1, lng1, lat2, lng2 = (np.radians(v) for v in (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def safety_level(lamp_density, coverage_percentage):
+    if lamp_density >= SAFE_LAMP_DENSITY and coverage_percentage >= 80:
+        return 'high'
+    if lamp_density >= SAFE_LAMP_DENSITY * 0.6 and coverage_percentage >= 60:
+        return 'medium'
+    return 'low'
+
+
+class LampIndex:
+    """Uniform grid over lamp positions for radius queries around route geometry"""
+
+    def __init__(self, lamp_lnglats, buffer=DEFAULT_LAMP_BUFFER):
+        lamps = np.asarray(lamp_lnglats, dtype=float).reshape(-1, 2)
+        self.buffer = buffer
+        self.lng = lamps[:, 0]
+        self.lat = lamps[:, 1]
+
+        # Local equirectangular projection around the lamps' centre
+        self.lat0 = float(self.lat.mean()) if len(lamps) else 0.0
+        self.lng0 = float(self.lng.mean()) if len(lamps) else 0.0
+        self._kx = EARTH_RADIUS * math.cos(math.radians(self.lat0)) * math.pi / 180
+        self._ky = EARTH_RADIUS * math.pi / 180
+        self.x, self.y = self.project(self.lng, self.lat)
+
+        # Sort lamps by cell so each cell is one contiguous slice
+        cx = np.floor(self.x / buffer).astype(np.int64)
+        cy = np.floor(self.y / buffer).astype(np.int64)
+        order = np.lexsort((cy, cx))
+        self.order = order
+        keys = list(zip(cx[order].tolist(), cy[order].tolist()))
+        self.cells = {}
+        start = 0
+        for i in range(1, len(keys) + 1):
+            if i == len(keys) or keys[i] != keys[start]:
+                self.cells[keys[start]] = (start, i)
+                start = i
+
+    def project(self, lng, lat):
+        lng = np.asarray(lng, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        return (lng - self.lng0) * self._kx, (lat - self.lat0) * self._ky
+
+    def candidates(self, min_x, min_y, max_x, max_y):
+        """Indices of lamps in cells overlapping a projected bbox grown by the buffer"""
+        b = self.buffer
+        slices = []
+        for cx in range(int(math.floor((min_x - b) / b)), int(math.floor((max_x + b) / b)) + 1):
+            for cy in range(int(math.floor((min_y - b) / b)), int(math.floor((max_y + b) / b)) + 1):
+                cell = self.cells.get((cx, cy))
+                if cell is not None:
+                    slices.append(self.order[cell[0]:cell[1]])
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(slices)
+
+    def analyze(self, path):
+        """Lighting metrics for one route given as [[lng, lat], ...]"""
+        coords = np.asarray(path, dtype=float).reshape(-1, 2)
+        lng, lat = coords[:, 0], coords[:, 1]
+
+        route_length = float(haversine(lat[:-1], lng[:-1], lat[1:], lng[1:]).sum()) if len(coords) > 1 else 0.0
+        n_segments = max(len(coords) - 1, 0)
+        buffer = self.buffer
+
+        x, y = self.project(lng, lat)
+
+        # Vertices with a lamp within the buffer; a segment is covered if either end is
+        vertex_lit = np.zeros(len(coords), dtype=bool)
+        for i in range(len(coords)):
+            near = self.candidates(x[i], y[i], x[i], y[i])
+            if len(near):
+                distances = haversine(lat[i], lng[i], self.lat[near], self.lng[near])
+                vertex_lit[i] = bool((distances <= buffer).any())
+        covered_segments = int((vertex_lit[:-1] | vertex_lit[1:]).sum()) if n_segments else 0
+
+        # Lamps within the buffer of any segment, by projected point-to-segment distance
+        near_route = np.zeros(len(self.x), dtype=bool)
+        for i in range(n_segments):
+            x1, y1, x2, y2 = x[i], y[i], x[i + 1], y[i + 1]
+            near = self.candidates(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+            if not len(near):
+                continue
+            near = near[~near_route[near]]
+            if not len(near):
+                continue
+            dx, dy = x2 - x1, y2 - y1
+            length_sq = dx * dx + dy * dy
+            px, py = self.x[near], self.y[near]
+            if length_sq > 0:
+                t = np.clip(((px - x1) * dx + (py - y1) * dy) / length_sq, 0.0, 1.0)
+            else:
+                t = np.zeros(len(near))
+            distances = np.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+            near_route[near[distances <= buffer]] = True
+        lamp_count = int(near_route.sum())
+
+        lamp_density = lamp_count / route_length * 100 if route_length > 0 else 0.0
+        coverage_percentage = covered_segments / n_segments * 100 if n_segments else 0.0
+
+        return {
+            'routeLength': round(route_length),
+            'lampCount': lamp_count,
+            'lampDensity': round(lamp_density, 2),
+            'coveragePercentage': round(coverage_percentage, 1),
+            'coveredSegments': covered_segments,
+            'totalSegments': n_segments,
+            'safetyLevel': safety_level(lamp_density, coverage_percentage)
+        }
+
+
+def routes_bbox(paths, padding_m=DEFAULT_LAMP_BUFFER * 2):
+    """(south, west, north, east) around every route, padded by a few buffers"""
+    coords = np.concatenate([np.asarray(path, dtype=float).reshape(-1, 2) for path in paths])
+    pad_lat = padding_m / 111320
+    pad_lng = padding_m / (111320 * max(math.cos(math.radians(float(coords[:, 1].mean()))), 0.01))
+    return (float(coords[:, 1].min()) - pad_lat, float(coords[:, 0].min()) - pad_lng,
+            float(coords[:, 1].max()) + pad_lat, float(coords[:, 0].max()) + pad_lng)
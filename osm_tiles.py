@@ -0,0 +1,384 @@
+"""Tile-based local store for OpenStreetMap point features fetched from Overpass.
+
+Instead of sending each client's arbitrary bbox to Overpass, the world is cut
+into fixed slippy-map tiles at TILE_ZOOM. A tile is fetched once (missing
+tiles are batched into a single Overpass query), written to disk as JSON and
+kept in an in-memory LRU; a bbox query is answered by assembling the tiles
+that cover it. Tiles older than the TTL are refreshed on the next request,
+and if Overpass is unreachable the stale copy is served instead.
+
+Several kinds can be fetched together: ensure_tiles() and kinds_in_bbox()
+put the selectors of every kind missing a tile into the same Overpass query
+and sort the results back into each kind's store by their tags. Ways and
+relations (e.g. hospital grounds) are stored as their centre point.
+
+A metro area can be pre-seeded so it works without network access:
+
+    python osm_tiles.py seed street_lamps,traffic_signals [south,west,north,east]
+"""
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import providers
+
+OVERPASS_URL = 'https://overpass-api.de/api/interpreter'
+
+TILE_ZOOM = 14
+TILE_TTL = 7 * 24 * 60 * 60
+TILE_CACHE_DIR = os.getenv('OSM_TILE_CACHE_DIR', 'cache/osm_tiles')
+
+# Tiles fetched per Overpass query, and the most a single request may cover
+TILES_PER_QUERY = 16
+MAX_TILES_PER_REQUEST = 256
+MEMORY_TILES = 4096
+
+SYDNEY_BBOX = (-34.12, 150.52, -33.42, 151.35)  # south, west, north, east
+
+# Each kind of feature we store: (tag key, tag value, OSM element types)
+KINDS = {
+    'street_lamps': ('highway', 'street_lamp', ['node']),
+    'traffic_signals': ('highway', 'traffic_signals', ['node']),
+    'hospitals': ('amenity', 'hospital', ['node', 'way', 'relation']),
+    'police': ('amenity', 'police', ['node', 'way', 'relation']),
+}
+
+# Features of a kind closer than this are thinned to one (e.g. one traffic signal per intersection)
+THIN_DISTANCES = {'traffic_signals': 40}  # meters
+
+METERS_PER_DEGREE = 111320
+
+
+class OsmTileError(Exception):
+    """Raised when tiles can't be fetched and no cached copy exists"""
+
+
+def lnglat_to_tile(lng, lat, zoom=TILE_ZOOM):
+    """Slippy-map tile (x, y) containing a point"""
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(x, y, zoom=TILE_ZOOM):
+    """(south, west, north, east) of a tile"""
+    n = 2 ** zoom
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, west, north, east
+
+
+def tiles_for_bbox(south, west, north, east, zoom=TILE_ZOOM):
+    """Every tile overlapping a bbox"""
+    min_x, min_y = lnglat_to_tile(west, north, zoom)
+    max_x, max_y = lnglat_to_tile(east, south, zoom)
+    return [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+
+
+def parse_bbox(bbox):
+    """Accept 'south,west,north,east' (Overpass order) or a 4-item list"""
+    if isinstance(bbox, str):
+        bbox = bbox.split(',')
+    south, west, north, east = (float(v) for v in bbox)
+    if south > north or west > east:
+        raise ValueError('Bounding box must be south,west,north,east')
+    return south, west, north, east
+
+
+class OsmTileStore:
+    """Disk- and memory-cached tiles of one kind of OSM feature"""
+
+    def __init__(self, kind, cache_dir=TILE_CACHE_DIR, ttl=TILE_TTL, zoom=TILE_ZOOM):
+        self.kind = kind
+        self.tag_key, self.tag_value, element_types = KINDS[kind]
+        self.selectors = [f'{element_type}["{self.tag_key}"="{self.tag_value}"]' for element_type in element_types]
+        self.cache_dir = os.path.join(cache_dir, kind, str(zoom))
+        self.ttl = ttl
+        self.zoom = zoom
+
+        self._lock = threading.Lock()
+        self._tiles = OrderedDict()  # (x, y) -> {'fetched': ts, 'elements': [...]}
+
+        self.tile_hits = 0
+        self.tile_fetches = 0
+        self.stale_served = 0
+
+    def _path(self, tile):
+        return os.path.join(self.cache_dir, str(tile[0]), f"{tile[1]}.json")
+
+    def _remember(self, tile, record):
+        with self._lock:
+            self._tiles[tile] = record
+            self._tiles.move_to_end(tile)
+            while len(self._tiles) > MEMORY_TILES:
+                self._tiles.popitem(last=False)
+
+    def _cached(self, tile):
+        """Tile record from memory or disk, fresh or not, or None"""
+        with self._lock:
+            record = self._tiles.get(tile)
+            if record is not None:
+                self._tiles.move_to_end(tile)
+                return record
+        try:
+            with open(self._path(tile), encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._remember(tile, record)
+        return record
+
+    def _is_fresh(self, record):
+        return record is not None and time.time() - record['fetched'] < self.ttl
+
+    def _save(self, tile, record):
+        path = self._path(tile)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        self._remember(tile, record)
+
+    def matches(self, element):
+        return (element.get('tags') or {}).get(self.tag_key) == self.tag_value
+
+    def ensure(self, tiles):
+        """Make sure every tile is cached, fetching missing or stale ones; returns their records"""
+        return ensure_tiles([self], tiles)[self.kind]
+
+    def features_in_bbox(self, south, west, north, east):
+        """Every stored element inside the bbox"""
+        return kinds_in_bbox([self.kind], south, west, north, east)[self.kind]
+
+    def seed(self, south, west, north, east):
+        """Fetch every tile of a bbox, e.g. to pre-load a metro area for offline use"""
+        seed([self.kind], south, west, north, east)
+
+    def stats(self):
+        return {
+            'memory_tiles': len(self._tiles),
+            'tile_hits': self.tile_hits,
+            'tile_fetches': self.tile_fetches,
+            'stale_served': self.stale_served
+        }
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+# (kind, tile) -> Event for tiles being fetched right now. Overlapping requests wait for the
+# fetch already in flight instead of repeating it; no lock is held during the Overpass call.
+_inflight = {}
+_inflight_lock = threading.Lock()
+# How long to wait for another request's fetch of a tile before giving up on it
+INFLIGHT_WAIT = 120  # seconds
+
+
+def _element_point(element):
+    # Nodes have their own coordinates; ways and relations come with a centre from `out center`
+    if element.get('lat') is not None and element.get('lon') is not None:
+        return element['lat'], element['lon']
+    center = element.get('center') or {}
+    if center.get('lat') is not None and center.get('lon') is not None:
+        return center['lat'], center['lon']
+    return None
+
+
+def _fetch(stores_by_tile, zoom):
+    """Fetch tiles for one or more kinds in a single Overpass query and store each of them"""
+    clauses = []
+    for tile, stores in stores_by_tile.items():
+        south, west, north, east = tile_bounds(tile[0], tile[1], zoom)
+        for store in stores:
+            for selector in store.selectors:
+                clauses.append(f"{selector}({south},{west},{north},{east});")
+    query = "[out:json][timeout:90];\n(\n" + "\n".join(clauses) + "\n);\nout center;"
+
+    response = providers.overpass.post(OVERPASS_URL, data=query)
+    if not response.ok:
+        raise OsmTileError(f"Overpass returned {response.status_code}")
+    elements = response.json().get('elements', [])
+
+    by_store_tile = {(store.kind, tile): [] for tile, stores in stores_by_tile.items() for store in stores}
+    for element in elements:
+        point = _element_point(element)
+        if point is None:
+            continue
+        tile = lnglat_to_tile(point[1], point[0], zoom)
+        for store in stores_by_tile.get(tile, ()):
+            if store.matches(element):
+                by_store_tile[(store.kind, tile)].append({
+                    'id': element.get('id'),
+                    'type': element.get('type', 'node'),
+                    'lat': point[0],
+                    'lon': point[1],
+                    'tags': element.get('tags', {})
+                })
+
+    fetched = time.time()
+    for tile, stores in stores_by_tile.items():
+        for store in stores:
+            store._save(tile, {'fetched': fetched, 'elements': by_store_tile[(store.kind, tile)]})
+            store.tile_fetches += 1
+
+
+def _claim(pairs):
+    """Split (store, tile) pairs into those this caller must fetch and events to wait on"""
+    owned, waits = [], []
+    with _inflight_lock:
+        for store, tile in pairs:
+            event = _inflight.get((store.kind, tile))
+            if event is None:
+                _inflight[(store.kind, tile)] = threading.Event()
+                owned.append((store, tile))
+            else:
+                waits.append(event)
+    return owned, waits
+
+
+def _release(pairs):
+    with _inflight_lock:
+        for store, tile in pairs:
+            event = _inflight.pop((store.kind, tile), None)
+            if event is not None:
+                event.set()
+
+
+def ensure_tiles(stores, tiles):
+    """Make sure every store has every tile cached, fetching what is missing or stale with as few
+    Overpass queries as possible; returns {kind: {tile: record}}"""
+    zoom = stores[0].zoom
+    records = {store.kind: {tile: store._cached(tile) for tile in tiles} for store in stores}
+    missing = []
+    for store in stores:
+        stale = [tile for tile in tiles if not store._is_fresh(records[store.kind][tile])]
+        store.tile_hits += len(tiles) - len(stale)
+        missing.extend((store, tile) for tile in stale)
+    if not missing:
+        return records
+
+    owned, waits = _claim(missing)
+    try:
+        # Another request may have finished these tiles between our lookup and the claim
+        done = [(store, tile) for store, tile in owned if store._is_fresh(store._cached(tile))]
+        _release(done)
+        to_fetch = {}
+        for store, tile in owned:
+            if (store, tile) not in done:
+                to_fetch.setdefault(tile, []).append(store)
+
+        missing_tiles = list(to_fetch)
+        for start in range(0, len(missing_tiles), TILES_PER_QUERY):
+            chunk = {tile: to_fetch[tile] for tile in missing_tiles[start:start + TILES_PER_QUERY]}
+            try:
+                _fetch(chunk, zoom)
+            except Exception as e:
+                kinds = sorted({store.kind for tile_stores in chunk.values() for store in tile_stores})
+                if all(records[store.kind][tile] is not None for tile, tile_stores in chunk.items()
+                       for store in tile_stores):
+                    print(f"Serving stale {', '.join(kinds)} tiles after Overpass error: {e}")
+                    for tile_stores in chunk.values():
+                        for store in tile_stores:
+                            store.stale_served += 1
+                    continue
+                raise OsmTileError(f"Failed to fetch {', '.join(kinds)} data: {e}")
+            finally:
+                _release([(store, tile) for tile, tile_stores in chunk.items() for store in tile_stores])
+    finally:
+        _release(owned)
+
+    for event in waits:
+        event.wait(INFLIGHT_WAIT)
+
+    records = {store.kind: {tile: store._cached(tile) for tile in tiles} for store in stores}
+    failed = sorted({store.kind for store, tile in missing if records[store.kind][tile] is None})
+    if failed:
+        raise OsmTileError(f"Failed to fetch {', '.join(failed)} data")
+    return records
+
+
+def kinds_in_bbox(kinds, south, west, north, east):
+    """Every stored element of each kind inside the bbox, as {kind: [element, ...]}"""
+    stores = [get_tile_store(kind) for kind in kinds]
+    tiles = tiles_for_bbox(south, west, north, east, stores[0].zoom)
+    if len(tiles) > MAX_TILES_PER_REQUEST:
+        raise OsmTileError(f"Bounding box too large ({len(tiles)} tiles, max {MAX_TILES_PER_REQUEST})")
+
+    found = {}
+    for kind, records in ensure_tiles(stores, tiles).items():
+        elements = []
+        for record in records.values():
+            for element in record['elements']:
+                if south <= element['lat'] <= north and west <= element['lon'] <= east:
+                    elements.append(element)
+        found[kind] = elements
+    return found
+
+
+def thin_by_distance(elements, distance):
+    """Keep the first element of every group within `distance` meters of it (e.g. one traffic
+    signal per intersection); grid-bucketed, so linear in the number of elements"""
+    if distance <= 0 or not elements:
+        return list(elements)
+    lng_scale = math.cos(math.radians(elements[0]['lat']))
+    cell = distance / METERS_PER_DEGREE
+    grid = {}
+    for i, element in enumerate(elements):
+        key = (int(element['lat'] // cell), int(element['lon'] * lng_scale // cell))
+        grid.setdefault(key, []).append(i)
+
+    removed = set()
+    kept = []
+    for i, element in enumerate(elements):
+        if i in removed:
+            continue
+        kept.append(element)
+        row, col = int(element['lat'] // cell), int(element['lon'] * lng_scale // cell)
+        for d_row in (-1, 0, 1):
+            for d_col in (-1, 0, 1):
+                for j in grid.get((row + d_row, col + d_col), ()):
+                    if j != i and j not in removed:
+                        other = elements[j]
+                        dx = (other['lon'] - element['lon']) * lng_scale
+                        if math.hypot(dx, other['lat'] - element['lat']) * METERS_PER_DEGREE <= distance:
+                            removed.add(j)
+    return kept
+
+
+def get_tile_store(kind):
+    """Shared store for a kind of feature"""
+    with _stores_lock:
+        if kind not in _stores:
+            _stores[kind] = OsmTileStore(kind)
+        return _stores[kind]
+
+
+def tile_store_stats():
+    return {kind: store.stats() for kind, store in _stores.items()}
+
+
+def seed(kinds, south, west, north, east):
+    """Fetch every tile of a bbox for each kind, e.g. to pre-load a metro area for offline use"""
+    stores = [get_tile_store(kind) for kind in kinds]
+    tiles = tiles_for_bbox(south, west, north, east, stores[0].zoom)
+    for start in range(0, len(tiles), TILES_PER_QUERY):
+        ensure_tiles(stores, tiles[start:start + TILES_PER_QUERY])
+        print(f"Seeded {min(start + TILES_PER_QUERY, len(tiles))}/{len(tiles)} {', '.join(kinds)} tiles")
+
+
+if __name__ == '__main__':
+    seed_kinds = sys.argv[2].split(',') if len(sys.argv) > 2 else []
+    if len(sys.argv) < 3 or sys.argv[1] != 'seed' or not all(kind in KINDS for kind in seed_kinds):
+        print(f"Usage: python osm_tiles.py seed {{{'|'.join(KINDS)}}}[,...] [south,west,north,east]")
+        sys.exit(1)
+    seed_bbox = parse_bbox(sys.argv[3]) if len(sys.argv) > 3 else SYDNEY_BBOX
+    seed(seed_kinds, *seed_bbox)
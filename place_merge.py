@@ -0,0 +1,121 @@
+"""Merging Google Places results from several searches into one ranked list.
+
+/proxy_place_search combines text search, nearby search, further text-search
+pages and cuisine keyword searches. Every batch goes through PlaceMerger:
+
+- the bounds check runs once per batch on NumPy arrays, giving each place
+  the smallest number of 10% steps beyond the expanded viewport it needs
+  (0 = in view), so each source only says how far out it will accept
+- duplicates are dropped in O(1): by place_id, or by the same name within
+  ~11 m, looked up in a hash of ~11 m grid cells and their neighbours
+- a duplicate fills in fields the first copy was missing (rating, address)
+- ranked() puts places in view first, then the ones slightly outside, each
+  group in the order the searches returned them
+"""
+import math
+
+import numpy as np
+
+# Grid cell size in degrees; same name within one cell in each axis is a duplicate
+DUPLICATE_DISTANCE = 0.0001
+
+OUTSIDE_VIEW_NOTE = "(slightly outside current view)"
+
+
+def bounds_levels(lats, lngs, bounds_expanded, max_margin):
+    """Per place, the fewest extra 10% steps of the expanded bounds that contain it.
+
+    Places needing more than max_margin steps get -1. Without bounds every
+    place is level 0.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lngs = np.asarray(lngs, dtype=float)
+    if not bounds_expanded:
+        return np.zeros(len(lats), dtype=int)
+
+    levels = np.full(len(lats), -1, dtype=int)
+    for margin in range(max_margin, -1, -1):
+        lat_pad = bounds_expanded['lat_diff'] * margin
+        lng_pad = bounds_expanded['lng_diff'] * margin
+        inside = ((bounds_expanded['sw_lat'] - lat_pad <= lats) & (lats <= bounds_expanded['ne_lat'] + lat_pad) &
+                  (bounds_expanded['sw_lng'] - lng_pad <= lngs) & (lngs <= bounds_expanded['ne_lng'] + lng_pad))
+        levels[inside] = margin
+    return levels
+
+
+def _cell(lat, lng):
+    return math.floor(lat / DUPLICATE_DISTANCE), math.floor(lng / DUPLICATE_DISTANCE)
+
+
+class PlaceMerger:
+    """Deduplicating, bounds-filtering accumulator for place search results"""
+
+    def __init__(self, bounds_expanded=None, id_prefix='search'):
+        self.bounds = bounds_expanded
+        self.id_prefix = id_prefix
+        self.places = []
+        self.accepted = []  # (place as given, place_id, max margin) for each kept place
+        self._outside = []
+        self._by_place_id = {}
+        self._by_cell = {}  # (cell_lat, cell_lng) -> [place, ...]
+
+    def __len__(self):
+        return len(self.places)
+
+    def _find_duplicate(self, place_id, place):
+        if place_id and place_id in self._by_place_id:
+            return self._by_place_id[place_id]
+        cell_lat, cell_lng = _cell(place['lat'], place['lng'])
+        for d_lat in (-1, 0, 1):
+            for d_lng in (-1, 0, 1):
+                for existing in self._by_cell.get((cell_lat + d_lat, cell_lng + d_lng), ()):
+                    if (existing['name'] == place['name'] and
+                            abs(existing['lat'] - place['lat']) < DUPLICATE_DISTANCE and
+                            abs(existing['lng'] - place['lng']) < DUPLICATE_DISTANCE):
+                        return existing
+        return None
+
+    def add(self, candidates, place_ids=None, max_margins=0):
+        """Merge formatted places; returns the ones that were new, with ids assigned.
+
+        max_margins is how many extra 10% steps past the expanded bounds a
+        place may be and still be kept (one value, or one per candidate);
+        kept places outside the view get a note in their description.
+        """
+        if not candidates:
+            return []
+        place_ids = place_ids or [None] * len(candidates)
+        max_margins = np.broadcast_to(np.asarray(max_margins, dtype=int), (len(candidates),))
+        levels = bounds_levels([p['lat'] for p in candidates], [p['lng'] for p in candidates],
+                               self.bounds, int(max_margins.max()))
+        keep = (levels >= 0) & (levels <= max_margins)
+
+        added = []
+        for place, place_id, level, kept, max_margin in zip(candidates, place_ids, levels.tolist(), keep.tolist(),
+                                                            max_margins.tolist()):
+            if not kept:
+                continue
+            existing = self._find_duplicate(place_id, place)
+            if existing is not None:
+                for field in ('rating', 'address'):
+                    if not existing.get(field) and place.get(field):
+                        existing[field] = place[field]
+                continue
+
+            self.accepted.append((dict(place), place_id, max_margin))
+
+            if level > 0:
+                place['description'] = f"{place.get('description', '')} {OUTSIDE_VIEW_NOTE}".strip()
+            place['id'] = f"{self.id_prefix}-{len(self.places) + 1}"
+            self.places.append(place)
+            self._outside.append(level > 0)
+            if place_id:
+                self._by_place_id[place_id] = place
+            self._by_cell.setdefault(_cell(place['lat'], place['lng']), []).append(place)
+            added.append(place)
+        return added
+
+    def ranked(self):
+        """Places in view first, then those slightly outside, each in arrival order"""
+        order = sorted(range(len(self.places)), key=lambda i: self._outside[i])
+        return [self.places[i] for i in order]
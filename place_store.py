@@ -0,0 +1,213 @@
+"""Local store of Google Places results, keyed by search category and map tile.
+
+Every successful Places search is written into the store under its category
+(e.g. a nearby-search type and keyword, or a normalized text query): the
+places go into a grid of zoom-16 tiles for bbox and radius lookups, and the
+area the search covered is recorded as a set of coverage tiles. A later
+query in the same category whose area lies inside one fresh searched
+area, or entirely in fresh coverage tiles, is answered from the store, in the order the provider ranked the places,
+without calling Google.
+
+Google caps each response (20 per page), so a search that hit the cap may
+have left out places that a smaller search of the same area would return.
+Coverage from such a truncated search only answers queries of a similar
+size (within TRUNCATED_SPAN_RATIO); coverage from a complete result set
+answers any query inside it. Only tiles that lie wholly inside a searched
+area count as covered, so coverage from several searches can combine without
+a query reaching into the unsearched part of an edge tile.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from osm_tiles import lnglat_to_tile, tile_bounds, tiles_for_bbox
+
+PLACE_TTL = 24 * 60 * 60
+
+# Places are indexed at this zoom (~500 m tiles in Sydney)
+INDEX_ZOOM = 16
+# Coverage uses the finest zoom at which a search area is at most this many tiles
+MAX_COVERAGE_TILES = 64
+MIN_COVERAGE_ZOOM = 6
+
+TRUNCATED_SPAN_RATIO = 2.0
+MAX_CATEGORIES = 500
+# Searched areas kept per category, oldest dropped first
+MAX_AREAS = 256
+
+METERS_PER_DEGREE = 111320
+
+
+def bbox_span(south, west, north, east):
+    """Longer side of a bbox in meters"""
+    lng_scale = math.cos(math.radians((south + north) / 2))
+    return max((north - south) * METERS_PER_DEGREE, (east - west) * METERS_PER_DEGREE * lng_scale)
+
+
+def radius_bbox(lat, lng, radius):
+    """(south, west, north, east) around a circle"""
+    d_lat = radius / METERS_PER_DEGREE
+    d_lng = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    return lat - d_lat, lng - d_lng, lat + d_lat, lng + d_lng
+
+
+def bounds_bbox(bounds):
+    """(south, west, north, east) from [[sw_lng, sw_lat], [ne_lng, ne_lat]]"""
+    return bounds[0][1], bounds[0][0], bounds[1][1], bounds[1][0]
+
+
+def _distance(lat1, lng1, lat2, lng2):
+    # Equirectangular is plenty at search-radius scales
+    x = (lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot(x, lat2 - lat1) * METERS_PER_DEGREE
+
+
+def coverage_zoom(south, west, north, east):
+    for zoom in range(INDEX_ZOOM, MIN_COVERAGE_ZOOM - 1, -1):
+        min_x, min_y = lnglat_to_tile(west, north, zoom)
+        max_x, max_y = lnglat_to_tile(east, south, zoom)
+        if (max_x - min_x + 1) * (max_y - min_y + 1) <= MAX_COVERAGE_TILES:
+            return zoom
+    return MIN_COVERAGE_ZOOM
+
+
+class _Category:
+    def __init__(self):
+        self.places = {}    # key -> {'place', 'fetched', 'rank', 'tile'}
+        self.tiles = {}     # (x, y) at INDEX_ZOOM -> set of keys
+        self.coverage = {}  # (zoom, x, y) -> (fetched, span, truncated)
+        self.areas = []     # (fetched, span, truncated, (south, west, north, east)) per search
+
+
+class PlaceStore:
+    """Tile-indexed places per search category, with coverage tracking"""
+
+    def __init__(self, ttl=PLACE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._categories = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _usable(self, record, span, now):
+        # record starts (fetched, span, truncated)
+        return (record is not None and now - record[0] < self.ttl and
+                not (record[2] and record[1] > span * TRUNCATED_SPAN_RATIO))
+
+    def _covered(self, category, south, west, north, east, now):
+        span = bbox_span(south, west, north, east)
+        for area in category.areas:
+            a_south, a_west, a_north, a_east = area[3]
+            if (a_south <= south and a_west <= west and north <= a_north and east <= a_east and
+                    self._usable(area, span, now)):
+                return True
+        for zoom in range(coverage_zoom(south, west, north, east), MIN_COVERAGE_ZOOM - 1, -1):
+            if all(self._usable(category.coverage.get((zoom, x, y)), span, now)
+                   for x, y in tiles_for_bbox(south, west, north, east, zoom)):
+                return True
+        return False
+
+    def lookup_bbox(self, category_key, south, west, north, east, grow=0.0):
+        """Stored places inside the bbox in provider rank order, or None if the area isn't covered.
+
+        grow widens the area places are returned from (not the area that must
+        be covered) by that fraction of its size on every side.
+        """
+        now = time.time()
+        with self._lock:
+            category = self._categories.get(category_key)
+            if category is None or not self._covered(category, south, west, north, east, now):
+                self.misses += 1
+                return None
+            self._categories.move_to_end(category_key)
+            self.hits += 1
+
+            lat_pad = (north - south) * grow
+            lng_pad = (east - west) * grow
+            south, west, north, east = south - lat_pad, west - lng_pad, north + lat_pad, east + lng_pad
+            min_x, min_y = lnglat_to_tile(west, north, INDEX_ZOOM)
+            max_x, max_y = lnglat_to_tile(east, south, INDEX_ZOOM)
+            if (max_x - min_x + 1) * (max_y - min_y + 1) > len(category.places):
+                # Wide areas: scanning every place is cheaper than visiting every tile
+                entries = category.places.values()
+            else:
+                entries = [category.places[key]
+                           for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)
+                           for key in category.tiles.get((x, y), ())]
+            found = []
+            for entry in entries:
+                place = entry['place']
+                if now - entry['fetched'] < self.ttl and south <= place['lat'] <= north and west <= place['lng'] <= east:
+                    found.append(entry)
+        found.sort(key=lambda entry: entry['rank'])
+        return [dict(entry['place']) for entry in found]
+
+    def lookup_radius(self, category_key, lat, lng, radius):
+        """Stored places within radius meters in provider rank order, or None if the area isn't covered"""
+        places = self.lookup_bbox(category_key, *radius_bbox(lat, lng, radius))
+        if places is None:
+            return None
+        return [place for place in places if _distance(lat, lng, place['lat'], place['lng']) <= radius]
+
+    def store(self, category_key, south, west, north, east, places, place_keys, truncated):
+        """Record a search over a bbox: its places (in rank order) and the area it covered"""
+        now = time.time()
+        span = bbox_span(south, west, north, east)
+        with self._lock:
+            category = self._categories.get(category_key)
+            if category is None:
+                category = self._categories[category_key] = _Category()
+                while len(self._categories) > MAX_CATEGORIES:
+                    self._categories.popitem(last=False)
+            self._categories.move_to_end(category_key)
+            self._purge(category, now)
+
+            for rank, (place, key) in enumerate(zip(places, place_keys)):
+                if key is None:
+                    key = (place['name'], round(place['lat'], 5), round(place['lng'], 5))
+                old = category.places.pop(key, None)
+                if old is not None:
+                    category.tiles[old['tile']].discard(key)
+                tile = lnglat_to_tile(place['lng'], place['lat'], INDEX_ZOOM)
+                category.places[key] = {'place': dict(place), 'fetched': now, 'rank': rank, 'tile': tile}
+                category.tiles.setdefault(tile, set()).add(key)
+
+            category.areas.append((now, span, truncated, (south, west, north, east)))
+            del category.areas[:-MAX_AREAS]
+
+            # Edge tiles reach past the searched area, so only whole tiles count
+            zoom = coverage_zoom(south, west, north, east)
+            for x, y in tiles_for_bbox(south, west, north, east, zoom):
+                t_south, t_west, t_north, t_east = tile_bounds(x, y, zoom)
+                if south <= t_south and west <= t_west and t_north <= north and t_east <= east:
+                    category.coverage[(zoom, x, y)] = (now, span, truncated)
+
+    def _purge(self, category, now):
+        # Caller holds the lock
+        for key in [key for key, entry in category.places.items() if now - entry['fetched'] >= self.ttl]:
+            entry = category.places.pop(key)
+            category.tiles[entry['tile']].discard(key)
+        for tile in [tile for tile, record in category.coverage.items() if now - record[0] >= self.ttl]:
+            del category.coverage[tile]
+        category.areas = [area for area in category.areas if now - area[0] < self.ttl]
+
+    def clear(self):
+        with self._lock:
+            self._categories.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'categories': len(self._categories),
+                'places': sum(len(category.places) for category in self._categories.values()),
+                'coverage_tiles': sum(len(category.coverage) for category in self._categories.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None
+            }
+
+
+place_store = PlaceStore()
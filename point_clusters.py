@@ -0,0 +1,232 @@
+"""Zoom-aware point clustering for dense OpenStreetMap layers (street lamps, traffic signals).
+
+A ClusterIndex is built once per dataset with the same greedy hierarchical
+scheme as Mapbox's supercluster: starting one zoom past MAX_ZOOM, every
+point absorbs its unclaimed neighbours within CLUSTER_RADIUS pixels into a
+weighted-centroid cluster, and each zoom level down clusters the level
+above it. Each level is stored as NumPy arrays sorted by x, so a
+(bbox, zoom) query is a binary search plus a mask - well under a
+millisecond - and returns at most a few clusters per screen tile however
+many points lie underneath.
+
+Datasets are regions of REGION_ZOOM tiles (256 of the store's zoom-14
+tiles each), built from the tile store on first use and rebuilt once an
+hour if any of their tiles changed. Clusters never span two regions.
+Building a region fetches up to 256 tiles, so a query can limit how many
+unbuilt regions it builds and report the rest as pending.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from osm_tiles import TILE_ZOOM, ensure_tiles, get_tile_store, tiles_for_bbox
+
+CLUSTER_RADIUS = 60   # pixels
+TILE_EXTENT = 512     # pixels per tile the radius is measured against
+MIN_ZOOM = 0
+MAX_ZOOM = 16         # above this, points are returned unclustered
+
+REGION_ZOOM = 10
+INDEX_REFRESH = 60 * 60
+MAX_INDEXES = 64
+
+
+def _lng_x(lngs):
+    return np.asarray(lngs, dtype=float) / 360.0 + 0.5
+
+
+def _lat_y(lats):
+    sin = np.sin(np.radians(np.asarray(lats, dtype=float)))
+    y = 0.5 - 0.25 * np.log((1 + sin) / (1 - sin)) / math.pi
+    return np.clip(y, 0.0, 1.0)
+
+
+def _x_lng(x):
+    return (x - 0.5) * 360.0
+
+
+def _y_lat(y):
+    return np.degrees(2 * np.arctan(np.exp((1 - 2 * y) * math.pi)) - math.pi / 2)
+
+
+class ClusterIndex:
+    """Per-zoom clusters of a fixed set of points"""
+
+    def __init__(self, lngs, lats, ids, radius=CLUSTER_RADIUS, extent=TILE_EXTENT,
+                 min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.ids = np.asarray(ids)
+
+        # A level is (x, y, count, point) with point = index into ids for unclustered points, else -1
+        x, y = _lng_x(lngs), _lat_y(lats)
+        level = (x, y, np.ones(len(x), dtype=np.int64), np.arange(len(x)))
+        self.levels = {max_zoom + 1: self._sorted(level)}
+        for zoom in range(max_zoom, min_zoom - 1, -1):
+            level = self._cluster(level, radius / (extent * 2 ** zoom))
+            self.levels[zoom] = self._sorted(level)
+
+    @staticmethod
+    def _sorted(level):
+        order = np.argsort(level[0], kind='stable')
+        return tuple(array[order] for array in level)
+
+    @staticmethod
+    def _cluster(level, r):
+        xs, ys, counts, points = level
+        cells = {}
+        cell_x = (xs // r).astype(np.int64).tolist()
+        cell_y = (ys // r).astype(np.int64).tolist()
+        for i, key in enumerate(zip(cell_x, cell_y)):
+            cells.setdefault(key, []).append(i)
+
+        x_list, y_list, count_list = xs.tolist(), ys.tolist(), counts.tolist()
+        r_sq = r * r
+        claimed = bytearray(len(x_list))
+        out_x, out_y, out_count, out_point = [], [], [], []
+        for i in range(len(x_list)):
+            if claimed[i]:
+                continue
+            claimed[i] = 1
+            x, y, count = x_list[i], y_list[i], count_list[i]
+            wx, wy, total = x * count, y * count, count
+            cx, cy = cell_x[i], cell_y[i]
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for j in cells.get((cx + dx, cy + dy), ()):
+                        if not claimed[j] and (x_list[j] - x) ** 2 + (y_list[j] - y) ** 2 <= r_sq:
+                            claimed[j] = 1
+                            wx += x_list[j] * count_list[j]
+                            wy += y_list[j] * count_list[j]
+                            total += count_list[j]
+            if total == count:
+                out_x.append(x)
+                out_y.append(y)
+                out_count.append(count)
+                out_point.append(int(points[i]))
+            else:
+                out_x.append(wx / total)
+                out_y.append(wy / total)
+                out_count.append(total)
+                out_point.append(-1)
+        return (np.array(out_x), np.array(out_y), np.array(out_count, dtype=np.int64),
+                np.array(out_point, dtype=np.int64))
+
+    def query(self, south, west, north, east, zoom):
+        """(lngs, lats, counts, ids) at a zoom inside the bbox; ids are None for clusters"""
+        zoom = min(max(int(zoom), self.min_zoom), self.max_zoom + 1)
+        xs, ys, counts, points = self.levels[zoom]
+        lo = np.searchsorted(xs, _lng_x(west), side='left')
+        hi = np.searchsorted(xs, _lng_x(east), side='right')
+        min_y, max_y = _lat_y(north), _lat_y(south)
+        inside = np.flatnonzero((ys[lo:hi] >= min_y) & (ys[lo:hi] <= max_y)) + lo
+        ids = [self.ids[point].item() if point >= 0 else None for point in points[inside].tolist()]
+        return _x_lng(xs[inside]), _y_lat(ys[inside]), counts[inside], ids
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class _Region:
+    def __init__(self, index, signature):
+        self.index = index
+        self.signature = signature
+        self.checked = time.time()
+
+
+_regions = OrderedDict()  # least recently used first
+_regions_lock = threading.Lock()
+_build_locks = {}
+
+
+def _region_tiles(region):
+    scale = 2 ** (TILE_ZOOM - REGION_ZOOM)
+    return [(region[0] * scale + dx, region[1] * scale + dy) for dx in range(scale) for dy in range(scale)]
+
+
+def get_region_index(kind, region):
+    """ClusterIndex for one kind's points in one REGION_ZOOM tile, built or refreshed as needed"""
+    key = (kind, region)
+    with _regions_lock:
+        entry = _regions.get(key)
+        if entry is not None:
+            _regions.move_to_end(key)
+            if time.time() - entry.checked < INDEX_REFRESH:
+                return entry.index
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+
+    try:
+        with build_lock:
+            return _build_region_index(kind, region, key)
+    finally:
+        with _regions_lock:
+            if _build_locks.get(key) is build_lock:
+                del _build_locks[key]
+
+
+def _build_region_index(kind, region, key):
+    with _regions_lock:
+        entry = _regions.get(key)
+    if entry is not None and time.time() - entry.checked < INDEX_REFRESH:
+        return entry.index
+
+    store = get_tile_store(kind)
+    records = ensure_tiles([store], _region_tiles(region))[kind]
+    signature = tuple(sorted((tile, record['fetched']) for tile, record in records.items() if record))
+    if entry is not None and entry.signature == signature:
+        entry.checked = time.time()
+        return entry.index
+
+    elements = [element for record in records.values() if record for element in record['elements']]
+    started = time.time()
+    index = ClusterIndex([e['lon'] for e in elements], [e['lat'] for e in elements],
+                         [e['id'] for e in elements])
+    print(f"Clustered {len(elements)} {kind} in region {region} in {time.time() - started:.2f}s")
+
+    with _regions_lock:
+        _regions[key] = _Region(index, signature)
+        _regions.move_to_end(key)
+        while len(_regions) > MAX_INDEXES:
+            _regions.popitem(last=False)
+    return index
+
+
+def clusters_in_bbox(kind, south, west, north, east, zoom, max_builds=None):
+    """GeoJSON features for clusters and lone points of a kind in a bbox at a map zoom.
+
+    At most max_builds regions that have never been clustered are built (None
+    for no limit); returns (features, number of regions skipped for that)
+    """
+    regions = tiles_for_bbox(south, west, north, east, REGION_ZOOM)
+    if max_builds is not None:
+        with _regions_lock:
+            unbuilt = [region for region in regions if (kind, region) not in _regions]
+        skipped = set(unbuilt[max_builds:])
+        regions = [region for region in regions if region not in skipped]
+    else:
+        skipped = ()
+    features = []
+    for region in regions:
+        lngs, lats, counts, ids = get_region_index(kind, region).query(south, west, north, east, zoom)
+        for lng, lat, count, point_id in zip(lngs.tolist(), lats.tolist(), counts.tolist(), ids):
+            if point_id is None:
+                properties = {'cluster': True, 'point_count': count}
+            else:
+                properties = {'id': point_id}
+            features.append({
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [round(lng, 6), round(lat, 6)]},
+                'properties': properties
+            })
+    return features, len(skipped)
+
+
+def cluster_stats():
+    with _regions_lock:
+        return {
+            'indexes': len(_regions),
+            'points': sum(len(entry.index) for entry in _regions.values())
+        }
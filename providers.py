@@ -0,0 +1,241 @@
+"""Shared HTTP clients for the upstream providers the app proxies.
+
+Each provider gets one long-lived requests.Session, so connections (and TLS
+sessions) are kept alive and pooled per host instead of being re-opened for
+every call, plus its own connect/read timeouts so one slow provider can't pin
+a worker indefinitely. Every call is counted: requests, errors, timeouts,
+HTTP error statuses and latency, served at /provider_stats.
+
+Identical requests that are already in flight are coalesced: the first
+caller makes the upstream call and everyone who asks for the same thing
+while it runs gets the same response (or exception).
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Connect timeouts slightly above a multiple of 3s, the TCP retransmit window
+DEFAULT_CONNECT_TIMEOUT = 3.05
+# Raise both when serving with cooperative I/O (serve.py), where hundreds of calls can be in flight
+DEFAULT_POOL_SIZE = int(os.getenv('PROVIDER_POOL_SIZE', '20'))
+FAN_OUT_WORKERS = int(os.getenv('FAN_OUT_WORKERS', '32'))
+
+
+class ProviderStats:
+    """Thread-safe call counters and latency totals for one provider"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.http_errors = 0
+        self.coalesced = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds, error=False, timeout=False, http_error=False):
+        with self._lock:
+            self.requests += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            if error:
+                self.errors += 1
+            if timeout:
+                self.timeouts += 1
+            if http_error:
+                self.http_errors += 1
+
+    def record_coalesced(self):
+        with self._lock:
+            self.coalesced += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'timeouts': self.timeouts,
+                'http_errors': self.http_errors,
+                'coalesced': self.coalesced,
+                'avg_ms': round(self.total_seconds / self.requests * 1000, 1) if self.requests else None,
+                'max_ms': round(self.max_seconds * 1000, 1)
+            }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, on_shared=None):
+        """Run fn once per key at a time; callers that piggyback get on_shared() called"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if on_shared is not None:
+                on_shared()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+def _freeze(value):
+    # Hashable, order-independent form of params/data for single-flight keys
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), str(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class ProviderClient:
+    """Pooled, keep-alive session for one upstream provider"""
+
+    def __init__(self, name, read_timeout, connect_timeout=DEFAULT_CONNECT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE,
+                 coalesce_methods=('GET',)):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.stats = ProviderStats()
+        self.coalesce_methods = coalesce_methods
+        self._flight = SingleFlight()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        if method not in self.coalesce_methods:
+            return self._send(method, url, **kwargs)
+
+        key = (method, url, _freeze(kwargs.get('params')), _freeze(kwargs.get('data')))
+        return self._flight.do(key, lambda: self._send(method, url, **kwargs),
+                               on_shared=self.stats.record_coalesced)
+
+    def _send(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.Timeout:
+            self.stats.record(time.perf_counter() - start, error=True, timeout=True)
+            raise
+        except requests.RequestException:
+            self.stats.record(time.perf_counter() - start, error=True)
+            raise
+        self.stats.record(time.perf_counter() - start, http_error=response.status_code >= 400)
+        return response
+
+    def get(self, url, params=None, **kwargs):
+        return self.request('GET', url, params=params, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request('POST', url, data=data, **kwargs)
+
+    @contextmanager
+    def track(self):
+        """Count a call made through another library (e.g. geopy) against this provider"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            timed_out = 'timeout' in type(e).__name__.lower() or 'timedout' in type(e).__name__.lower()
+            self.stats.record(time.perf_counter() - start, error=True, timeout=timed_out)
+            raise
+        self.stats.record(time.perf_counter() - start)
+
+
+mapbox = ProviderClient('mapbox', read_timeout=10)
+osrm = ProviderClient('osrm', read_timeout=15)
+google_places = ProviderClient('google_places', read_timeout=10)
+# Overpass queries are POSTed but are read-only, so they can be coalesced too
+overpass = ProviderClient('overpass', read_timeout=30, coalesce_methods=('GET', 'POST'))
+nominatim = ProviderClient('nominatim', read_timeout=10)
+
+PROVIDERS = [mapbox, osrm, google_places, overpass, nominatim]
+
+
+def provider_stats():
+    """Counters for every provider, keyed by name"""
+    return {provider.name: provider.stats.as_dict() for provider in PROVIDERS}
+
+
+_fan_out_executor = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS, thread_name_prefix='provider-fan-out')
+
+
+def fan_out(calls, deadline):
+    """Run (name, zero-argument callable) pairs concurrently for at most `deadline` seconds.
+
+    Returns one result per call, in the order given. Calls that raised or
+    had not finished by the deadline yield None; late calls keep running in
+    the background but their results are dropped.
+    """
+    futures = [_fan_out_executor.submit(call) for _, call in calls]
+    done, not_done = wait(futures, timeout=deadline)
+    for future in not_done:
+        future.cancel()
+
+    results = []
+    for (name, _), future in zip(calls, futures):
+        if future not in done:
+            print(f"Dropped {name}: no response within {deadline}s")
+            results.append(None)
+            continue
+        try:
+            results.append(future.result())
+        except Exception as e:
+            print(f"{name} error: {e}")
+            results.append(None)
+    return results
+
+
+def call_later(delay, fn):
+    """Future for fn() run on the fan-out pool after `delay` seconds, without tying up a pool worker meanwhile.
+
+    Cancelling the future before the delay is up means fn never runs.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn())
+        except Exception as e:
+            future.set_exception(e)
+
+    timer = threading.Timer(delay, lambda: _fan_out_executor.submit(run))
+    timer.daemon = True
+    timer.start()
+    return future
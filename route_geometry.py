@@ -0,0 +1,174 @@
+"""Route geometry helpers: comparing, simplifying and encoding routes.
+
+Routes from different providers have very different vertex densities (a
+straight avenue may be two vertices in one route and forty in another), so
+comparing vertices by index says little about whether two routes follow the
+same streets. Instead every route is resampled at evenly spaced points
+along its length, projected to a local metric plane, and compared by how
+much of one route's length lies within OVERLAP_DISTANCE of the other.
+
+route_overlap_matrix() scores all candidates against each other at once,
+with the distance maths vectorized in NumPy.
+
+format_route() shrinks a /route response for the client: Douglas-Peucker
+simplification to a tolerance in meters, and encoded polylines (precision 5
+or 6) in place of GeoJSON coordinate arrays.
+"""
+import math
+
+import numpy as np
+
+EARTH_RADIUS = 6371000  # meters
+
+# Points per route when comparing; spacing is route length / RESAMPLE_POINTS
+RESAMPLE_POINTS = 64
+# A stretch of route counts as shared if the other route passes within this distance
+OVERLAP_DISTANCE = 40  # meters
+# A route sharing more than this fraction of its length with another is not a real alternative
+MAX_SHARED_FRACTION = 0.7
+
+
+def project(paths):
+    """Equirectangular projection of [[lng, lat], ...] paths to meters around their common centre"""
+    arrays = [np.asarray(path, dtype=float).reshape(-1, 2) for path in paths]
+    lat0 = float(np.concatenate(arrays)[:, 1].mean())
+    kx = EARTH_RADIUS * math.cos(math.radians(lat0)) * math.pi / 180
+    ky = EARTH_RADIUS * math.pi / 180
+    return [np.column_stack((array[:, 0] * kx, array[:, 1] * ky)) for array in arrays]
+
+
+def resample(xy, n=RESAMPLE_POINTS):
+    """n points evenly spaced by arc length along a projected polyline"""
+    if len(xy) == 1:
+        return np.repeat(xy, n, axis=0)
+    lengths = np.hypot(*np.diff(xy, axis=0).T)
+    distance = np.concatenate(([0.0], np.cumsum(lengths)))
+    if distance[-1] == 0:
+        return np.repeat(xy[:1], n, axis=0)
+    targets = np.linspace(0.0, distance[-1], n)
+    return np.column_stack((np.interp(targets, distance, xy[:, 0]), np.interp(targets, distance, xy[:, 1])))
+
+
+def _nearest_distances(points, starts, ends):
+    """Distance from each point (P, 2) to the nearest segment of each route (N, S, 2) -> (N, P)"""
+    dx = (ends[..., 0] - starts[..., 0])[:, None, :]         # (N, 1, S)
+    dy = (ends[..., 1] - starts[..., 1])[:, None, :]
+    length_sq = np.maximum(dx * dx + dy * dy, 1e-12)
+    rx = points[None, :, 0, None] - starts[:, None, :, 0]    # (N, P, S)
+    ry = points[None, :, 1, None] - starts[:, None, :, 1]
+    t = np.clip((rx * dx + ry * dy) / length_sq, 0.0, 1.0)
+    rx -= t * dx
+    ry -= t * dy
+    return np.sqrt((rx * rx + ry * ry).min(axis=-1))
+
+
+def route_overlap_matrix(paths, n=RESAMPLE_POINTS, overlap_distance=OVERLAP_DISTANCE):
+    """overlap[i, j]: fraction of route i's length within overlap_distance of route j.
+
+    Also returns hausdorff[i, j], the farthest any point of route i gets
+    from route j, in meters.
+    """
+    if not paths:
+        return np.zeros((0, 0)), np.zeros((0, 0))
+    samples = np.stack([resample(xy, n) for xy in project(paths)])  # (N, n, 2)
+    starts, ends = samples[:, :-1], samples[:, 1:]
+
+    overlap = np.empty((len(paths), len(paths)))
+    hausdorff = np.empty((len(paths), len(paths)))
+    # One row at a time keeps memory at N x n x n rather than N^2 x n x n
+    for i in range(len(paths)):
+        nearest = _nearest_distances(samples[i], starts, ends)  # (N, n)
+        overlap[i] = (nearest <= overlap_distance).mean(axis=-1)
+        hausdorff[i] = nearest.max(axis=-1)
+    return overlap, hausdorff
+
+
+def select_distinct_routes(paths, max_routes, max_shared=MAX_SHARED_FRACTION):
+    """Indices of paths to keep, in order: the first always, then each path sharing at most
+    max_shared of its length with every path already kept"""
+    if not paths:
+        return []
+    overlap, _ = route_overlap_matrix(paths)
+    kept = [0]
+    for i in range(1, len(paths)):
+        if len(kept) >= max_routes:
+            break
+        if (overlap[i, kept] <= max_shared).all():
+            kept.append(i)
+    return kept
+
+
+# Ground meters per pixel at zoom 0 on the equator, for 256 px tiles
+METERS_PER_PIXEL_Z0 = 156543.03392
+# Zoom-based simplification drops detail smaller than this many pixels
+SIMPLIFY_PIXELS = 0.5
+
+POLYLINE_PRECISION = {'polyline': 5, 'polyline6': 6}
+
+
+def tolerance_for_zoom(zoom, lat):
+    """Simplification tolerance in meters that is invisible at a map zoom level"""
+    return SIMPLIFY_PIXELS * METERS_PER_PIXEL_Z0 * math.cos(math.radians(lat)) / 2 ** zoom
+
+
+def simplify(path, tolerance):
+    """Douglas-Peucker simplification of a [[lng, lat], ...] path, tolerance in meters"""
+    if tolerance <= 0 or len(path) < 3:
+        return path
+    xy = project([path])[0]
+    keep = np.zeros(len(xy), dtype=bool)
+    keep[0] = keep[-1] = True
+    tolerance_sq = tolerance * tolerance
+    stack = [(0, len(xy) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = xy[last] - xy[first]
+        length_sq = max(dx * dx + dy * dy, 1e-12)
+        rx = xy[first + 1:last, 0] - xy[first, 0]
+        ry = xy[first + 1:last, 1] - xy[first, 1]
+        t = np.clip((rx * dx + ry * dy) / length_sq, 0.0, 1.0)
+        rx -= t * dx
+        ry -= t * dy
+        distance_sq = rx * rx + ry * ry
+        farthest = int(distance_sq.argmax())
+        if distance_sq[farthest] > tolerance_sq:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return [path[i] for i in np.flatnonzero(keep)]
+
+
+def encode_polyline(path, precision=5):
+    """Encoded polyline (Google's algorithm, lat/lng order) of a [[lng, lat], ...] path"""
+    if not path:
+        return ''
+    coords = np.round(np.asarray(path, dtype=float)[:, ::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(coords, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+    chars = []
+    for value in values.tolist():
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return ''.join(chars)
+
+
+def format_route(route, geometry_format='geojson', tolerance=None):
+    """Copy of a route result with its paths simplified to tolerance meters and/or polyline-encoded"""
+    if not route.get('success') or (geometry_format == 'geojson' and not tolerance):
+        return route
+
+    def shape(path):
+        if tolerance:
+            path = simplify(path, tolerance)
+        if geometry_format in POLYLINE_PRECISION:
+            return encode_polyline(path, POLYLINE_PRECISION[geometry_format])
+        return path
+
+    formatted = dict(route, path=shape(route['path']), geometry_format=geometry_format)
+    formatted['alternatives'] = [dict(alt, path=shape(alt['path'])) for alt in route.get('alternatives', [])]
+    return formatted
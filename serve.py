@@ -0,0 +1,49 @@
+"""Serve the app from a single process with cooperative (gevent) I/O.
+
+Almost every endpoint spends its time waiting on Mapbox, OSRM, Google,
+Overpass or OpenAI. Under `python app.py` or plain gunicorn sync workers each
+of those waits holds a whole thread or process. Here gevent patches sockets,
+sleeps, locks and threads before anything else is imported, so every
+blocking call in requests, the OpenAI client and providers.py yields to
+other requests instead, and one process keeps hundreds of upstream calls in
+flight. The views and their request/response formats are unchanged,
+including the NDJSON streams.
+
+Only I/O yields: CPU-bound work (offline A* routing, cluster index builds,
+vector tile rendering) blocks every connection in the process until it
+finishes, so run several workers under gunicorn if that work is common.
+
+    python serve.py [host] [port]
+
+The same mode under gunicorn:
+
+    gunicorn -k gevent --worker-connections 1000 app:app
+"""
+import os
+import sys
+
+try:
+    from gevent import monkey
+except ImportError:
+    sys.exit("Async serving needs gevent: pip install -r requirements.txt")
+monkey.patch_all()
+
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+
+# Each in-flight request may hold a pooled connection per provider; size the pools to match
+os.environ.setdefault('PROVIDER_POOL_SIZE', '200')
+os.environ.setdefault('FAN_OUT_WORKERS', '500')
+
+from app import app
+
+MAX_CONNECTIONS = int(os.getenv('ASYNC_MAX_CONNECTIONS', '1000'))
+
+
+if __name__ == '__main__':
+    host = sys.argv[1] if len(sys.argv) > 1 else os.getenv('HOST', '127.0.0.1')
+    port = int(sys.argv[2] if len(sys.argv) > 2 else os.getenv('PORT', '5000'))
+
+    server = WSGIServer((host, port), app, spawn=Pool(MAX_CONNECTIONS))
+    print(f"Serving on http://{host}:{port} with up to {MAX_CONNECTIONS} concurrent connections")
+    server.serve_forever()
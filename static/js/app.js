@@ -96,7 +96,7 @@ document.addEventListener('DOMContentLoaded', function() {
             source: 'traffic-signals',
             paint: {
                 'circle-color': 'rgba(186, 104, 200, 0.3)', // Keep original light purple color with transparency
-                'circle-radius': 10, // Match hospital halo size
+                'circle-radius': clusterRadius(10), // Match hospital halo size
                 'circle-stroke-width': 1, // Match hospital halo stroke
                 'circle-stroke-color': 'rgba(255, 255, 255, 0.5)' // Match hospital halo stroke color
             },
@@ -112,7 +112,7 @@ document.addEventListener('DOMContentLoaded', function() {
             source: 'traffic-signals',
             paint: {
                 'circle-color': '#BA68C8', // Keep original light purple color
-                'circle-radius': 5, // Match hospital marker size
+                'circle-radius': clusterRadius(5), // Match hospital marker size
                 'circle-stroke-width': 1, // Match hospital marker stroke
                 'circle-stroke-color': 'rgba(255, 255, 255, 0.9)' // Match hospital marker stroke color
             },
@@ -124,6 +124,7 @@ document.addEventListener('DOMContentLoaded', function() {
         // Add popup for traffic signals
         map.on('mouseenter', 'traffic-signals', function(e) {
             const coordinates = e.features[0].geometry.coordinates.slice();
+            const pointCount = e.features[0].properties.point_count;
             
             // Create popup
             new mapboxgl.Popup({
@@ -132,7 +133,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 offset: 10
             })
             .setLngLat(coordinates)
-            .setHTML('<strong>Traffic Signal</strong><br><small>Click to add to route</small>')
+            .setHTML(pointCount ? `<strong>${pointCount} Traffic Signals</strong><br><small>Click to zoom in</small>`
+                                : '<strong>Traffic Signal</strong><br><small>Click to add to route</small>')
             .addTo(map);
         });
 
@@ -1113,12 +1115,7 @@ document.addEventListener('DOMContentLoaded', function() {
         // Street Lamps
         if (window._filteredStreetLamps) {
             window._filteredStreetLamps = null;
-            if (window.state && window.state.streetLamps && map.getSource('street-lamps')) {
-                map.getSource('street-lamps').setData({
-                    type: 'FeatureCollection',
-                    features: window.state.streetLamps
-                });
-            }
+            refreshClusteredLayer('street_lamps');
         }
         // Hospitals
         if (window._filteredHospitals) {
@@ -2809,119 +2806,179 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
-    // Function to fetch traffic signals from OpenStreetMap
-    async function fetchTrafficSignals() {
-        // Central Sydney area bounding box (extended south to include Mascot)
-        const bbox = '-33.95,151.15,-33.85,151.25';
-        
-        // Construct Overpass API query to get traffic signals
-        const query = `
-            [out:json];
-            (
-              node["highway"="traffic_signals"](${bbox});
-            );
-            out body;
-        `;
-        
-        // Fetch traffic signals data from Overpass API
-        const response = await fetch('https://overpass-api.de/api/interpreter', {
-            method: 'POST',
-            body: query
-        });
+    // OpenStreetMap feature layers come from /osm_features, which takes several kinds at once.
+    // Layers requested in the same tick for the same bbox share one request, hospitals and police
+    // are always fetched together, and each response is reused for a few minutes.
+    const OSM_COMPANION_KINDS = { hospitals: ['police'], police: ['hospitals'] };
+    const OSM_RESULT_TTL = 5 * 60 * 1000;
+    // /osm_features covers at most 256 zoom-14 tiles (16 x 16); a 14-tile span stays inside that
+    const OSM_MAX_SPAN_TILES = 14;
+    const osmFeatureBatches = new Map();  // bbox -> { kinds, promise }
+    const osmFeatureResults = new Map();  // `${kind}|${bbox}` -> { time, data }
+    
+    // Shrink a 'south,west,north,east' bbox around its centre to at most maxSpan tiles across at a zoom
+    function clampOsmBbox(bbox, zoom = 14, maxSpan = OSM_MAX_SPAN_TILES) {
+        let [south, west, north, east] = bbox.split(',').map(Number);
+        const n = Math.pow(2, zoom);
+        const tileX = lng => (lng + 180) / 360 * n;
+        const tileY = lat => (1 - Math.asinh(Math.tan(lat * Math.PI / 180)) / Math.PI) / 2 * n;
+        const [minX, maxX, minY, maxY] = [tileX(west), tileX(east), tileY(north), tileY(south)];
+        if (maxX - minX > maxSpan || maxY - minY > maxSpan) {
+            console.log(`Clamping OSM bbox ${bbox} to the map centre`);
+            const half = maxSpan / 2;
+            const centreX = (minX + maxX) / 2;
+            const centreY = (minY + maxY) / 2;
+            west = Math.max(minX, centreX - half) / n * 360 - 180;
+            east = Math.min(maxX, centreX + half) / n * 360 - 180;
+            north = Math.atan(Math.sinh(Math.PI * (1 - 2 * Math.max(minY, centreY - half) / n))) * 180 / Math.PI;
+            south = Math.atan(Math.sinh(Math.PI * (1 - 2 * Math.min(maxY, centreY + half) / n))) * 180 / Math.PI;
+        }
+        return [south, west, north, east].map(v => v.toFixed(5)).join(',');
+    }
+    
+    async function requestOsmFeatures(kinds, bbox) {
+        const response = await fetch(`/osm_features?kind=${encodeURIComponent(kinds.join(','))}&bbox=${encodeURIComponent(bbox)}`);
         
         if (!response.ok) {
-            throw new Error('Failed to fetch traffic signals data');
+            throw new Error(`Server responded with status: ${response.status}`);
         }
         
         const data = await response.json();
+        if (!data.success) {
+            throw new Error(data.error || `Failed to fetch ${kinds.join(', ')} data`);
+        }
+        kinds.forEach(kind => osmFeatureResults.set(`${kind}|${bbox}`, { time: Date.now(), data }));
+        return data;
+    }
+    
+    // Resolves to the /osm_features response holding data[kind] for the bbox
+    function fetchOsmFeatures(kind, bbox) {
+        bbox = clampOsmBbox(bbox);
+        const cached = osmFeatureResults.get(`${kind}|${bbox}`);
+        if (cached && Date.now() - cached.time < OSM_RESULT_TTL) {
+            return Promise.resolve(cached.data);
+        }
+        
+        let batch = osmFeatureBatches.get(bbox);
+        if (!batch) {
+            batch = { kinds: new Set() };
+            batch.promise = new Promise(resolve => setTimeout(resolve, 0)).then(() => {
+                osmFeatureBatches.delete(bbox);
+                return requestOsmFeatures([...batch.kinds], bbox);
+            });
+            osmFeatureBatches.set(bbox, batch);
+        }
+        batch.kinds.add(kind);
+        (OSM_COMPANION_KINDS[kind] || []).forEach(companion => batch.kinds.add(companion));
+        return batch.promise;
+    }
+    
+    // Street lamps and traffic signals are drawn from /osm_clusters while they show every point:
+    // clusters and lone points for the current view, refreshed as the map moves. Filtered views
+    // (safety analysis, safety filter) still set their own features on the same sources.
+    const CLUSTERED_LAYERS = {
+        street_lamps: {
+            source: 'street-lamps',
+            layer: 'street-lamps',
+            showsAll: () => !(window._filteredStreetLamps && window._filteredStreetLamps.features &&
+                              window._filteredStreetLamps.features.length > 0)
+        },
+        traffic_signals: {
+            source: 'traffic-signals',
+            layer: 'traffic-signals',
+            showsAll: () => !safetyFilterActive
+        }
+    };
+    // /osm_clusters covers at most 9 zoom-10 regions (3 x 3); a 2-region span stays inside that
+    const CLUSTER_REGION_ZOOM = 10;
+    const CLUSTER_MAX_SPAN_REGIONS = 2;
+    // Regions the server hasn't clustered yet are built one per request; ask again for the rest
+    const CLUSTER_PENDING_RETRY = 1000;
+    const clusterRequests = {};  // kind -> AbortController of the request in flight
+    
+    async function refreshClusteredLayer(kind) {
+        const config = CLUSTERED_LAYERS[kind];
+        const source = map.getSource(config.source);
+        if (!source || !map.getLayer(config.layer) ||
+            map.getLayoutProperty(config.layer, 'visibility') !== 'visible' || !config.showsAll()) {
+            return;
+        }
         
-        // Convert OSM data to GeoJSON features
-        const features = data.elements.map(element => ({
-            type: 'Feature',
-            geometry: {
-                type: 'Point',
-                coordinates: [element.lon, element.lat]
-            },
-            properties: {
-                id: element.id,
-                tags: element.tags
+        if (clusterRequests[kind]) {
+            clusterRequests[kind].abort();
+        }
+        const controller = new AbortController();
+        clusterRequests[kind] = controller;
+        
+        const bounds = map.getBounds();
+        const bbox = clampOsmBbox(`${bounds.getSouth()},${bounds.getWest()},${bounds.getNorth()},${bounds.getEast()}`,
+                                  CLUSTER_REGION_ZOOM, CLUSTER_MAX_SPAN_REGIONS);
+        try {
+            const response = await fetch(`/osm_clusters?kind=${kind}&bbox=${encodeURIComponent(bbox)}&zoom=${Math.floor(map.getZoom())}`,
+                                         { signal: controller.signal });
+            const data = await response.json();
+            if (!data.success) {
+                throw new Error(data.error || `Failed to cluster ${kind}`);
             }
-        }));
+            // A filter may have been applied while the request was out
+            if (!config.showsAll()) {
+                return;
+            }
+            source.setData(data.data);
+            if (data.pending > 0) {
+                setTimeout(() => refreshClusteredLayer(kind), CLUSTER_PENDING_RETRY);
+            }
+        } catch (error) {
+            if (error.name !== 'AbortError') {
+                console.error(`Error loading ${kind} clusters:`, error);
+            }
+        } finally {
+            if (clusterRequests[kind] === controller) {
+                delete clusterRequests[kind];
+            }
+        }
+    }
+    
+    map.on('moveend', function() {
+        Object.keys(CLUSTERED_LAYERS).forEach(refreshClusteredLayer);
+    });
+    window.refreshClusteredLayer = refreshClusteredLayer;
+    
+    // Clicking a cluster zooms in on it
+    function zoomIntoCluster(feature) {
+        map.easeTo({
+            center: feature.geometry.coordinates,
+            zoom: Math.min(map.getZoom() + 2, 17)
+        });
+    }
+    
+    // Circle size for a point layer that may hold clusters with a point_count
+    function clusterRadius(pointRadius) {
+        return ['case', ['has', 'point_count'],
+            ['interpolate', ['linear'], ['get', 'point_count'], 2, pointRadius + 4, 100, pointRadius + 10, 1000, pointRadius + 16],
+            pointRadius];
+    }
+    
+    // Function to fetch traffic signals from OpenStreetMap
+    async function fetchTrafficSignals() {
+        // Central Sydney area bounding box (extended south to include Mascot)
+        const bbox = '-33.95,151.15,-33.85,151.25';
         
-        // Filter traffic signals to remove those in close proximity
-        const filteredFeatures = filterProximateSignals(features);
+        // Signals within 40 m of each other (one intersection) are condensed server-side
+        const data = await fetchOsmFeatures('traffic_signals', bbox);
+        const filteredFeatures = data.data.traffic_signals.features;
         
         // Store all traffic signals (both original and filtered)
         allTrafficSignals = filteredFeatures;
         filteredTrafficSignals = [...filteredFeatures]; // Initialize filtered to all signals
         
-        // Update the traffic signals source with the filtered features
-        const trafficSignalsSource = map.getSource('traffic-signals');
-        if (trafficSignalsSource) {
-            trafficSignalsSource.setData({
-                type: 'FeatureCollection',
-                features: filteredFeatures
-            });
-        }
+        // The map shows them clustered for the current view
+        refreshClusteredLayer('traffic_signals');
         
         // Show notification with count
-        showNotification(`Loaded ${filteredFeatures.length} traffic signals (condensed from ${features.length})`, 'info');
+        showNotification(`Loaded ${filteredFeatures.length} traffic signals (condensed from ${data.unfiltered_counts.traffic_signals})`, 'info');
     }
     
-    // Function to filter traffic signals in close proximity to each other
-    function filterProximateSignals(signals) {
-        // Define the proximity threshold in meters
-        const proximityThreshold = 40; // Consider signals within 40m as same intersection
-        
-        // Create an array to hold filtered signals
-        const filteredSignals = [];
-        // Create a set to track which signals have been processed
-        const processedIds = new Set();
-        
-        // Process each signal
-        signals.forEach(signal => {
-            // Skip if already processed
-            if (processedIds.has(signal.properties.id)) {
-                return;
-            }
-            
-            // Create a Leaflet latLng for the current signal
-            const signalLatLng = L.latLng(
-                signal.geometry.coordinates[1], 
-                signal.geometry.coordinates[0]
-            );
-            
-            // Find all signals within the proximity threshold
-            const proximate = signals.filter(otherSignal => {
-                // Skip if same signal
-                if (otherSignal.properties.id === signal.properties.id) {
-                    return false;
-                }
-                
-                // Create a Leaflet latLng for the other signal
-                const otherLatLng = L.latLng(
-                    otherSignal.geometry.coordinates[1], 
-                    otherSignal.geometry.coordinates[0]
-                );
-                
-                // Calculate distance between signals
-                const distance = signalLatLng.distanceTo(otherLatLng);
-                
-                // Return true if within proximity threshold
-                return distance <= proximityThreshold;
-            });
-            
-            // Add the current signal to filtered list
-            filteredSignals.push(signal);
-            
-            // Mark the current signal and all proximate signals as processed
-            processedIds.add(signal.properties.id);
-            proximate.forEach(p => processedIds.add(p.properties.id));
-        });
-        
-        return filteredSignals;
-    }
-
     // Function to toggle crime markers
     async function toggleCrimeMarkers() {
         const toggleBtn = document.getElementById('toggle-crime');
@@ -2974,31 +3031,69 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // Crime records are loaded for the viewport, padded by half a screen on each
+    // side and grown to take in the route so route analyses see all of its incidents
+    const CRIME_BBOX_PADDING = 0.5;
+    let crimeDataBbox = null; // [south, west, north, east] of the loaded records
+    let crimeDataRequest = 0;
+    
+    function crimeBboxForView(route = state.currentRoute, padding = CRIME_BBOX_PADDING) {
+        const bounds = map.getBounds();
+        const padLat = (bounds.getNorth() - bounds.getSouth()) * padding;
+        const padLng = (bounds.getEast() - bounds.getWest()) * padding;
+        const bbox = [bounds.getSouth() - padLat, bounds.getWest() - padLng,
+                      bounds.getNorth() + padLat, bounds.getEast() + padLng];
+        (route || []).forEach(([lng, lat]) => {
+            bbox[0] = Math.min(bbox[0], lat);
+            bbox[1] = Math.min(bbox[1], lng);
+            bbox[2] = Math.max(bbox[2], lat);
+            bbox[3] = Math.max(bbox[3], lng);
+        });
+        return bbox;
+    }
+    
+    function bboxContains(outer, inner) {
+        return outer[0] <= inner[0] && outer[1] <= inner[1] && outer[2] >= inner[2] && outer[3] >= inner[3];
+    }
+    
+    // Reload once the view (or the route) leaves the loaded area, unless the
+    // markers are filtered down to a route
+    map.on('moveend', function() {
+        if (crimeDataBbox && !window._filteredCrimeData &&
+            !bboxContains(crimeDataBbox, crimeBboxForView(state.currentRoute, 0))) {
+            fetchCrimeData(crimeBboxForView(), true);
+        }
+    });
+    
     // Function to fetch crime data from external source
-    async function fetchCrimeData() {
+    // refresh: reload for a new bbox without changing layer visibility
+    async function fetchCrimeData(bbox = crimeBboxForView(), refresh = false) {
+        const request = ++crimeDataRequest;
         try {
-            // Use our Flask endpoint to get the crime data
-            const response = await fetch('/crime_data');
+            // The server parses the CSV once and sends the matching records column by column
+            const response = await fetch(`/crime_data?format=columns&bbox=${bbox.map(v => v.toFixed(5)).join(',')}`);
             
             if (!response.ok) {
                 throw new Error('Crime data file not found');
             }
             
-            const csvText = await response.text();
+            const result = await response.json();
+            if (!result.success) {
+                throw new Error(result.error || 'Crime data file not found');
+            }
             
-            // Parse CSV
-            const rows = csvText.split('\n').map(row => row.split(','));
-            const headers = rows[0];
+            // A later request (the map moved again) supersedes this one
+            if (request !== crimeDataRequest) {
+                return;
+            }
+            crimeDataBbox = bbox;
             
-            // Convert rows to objects - handle all valid entries
+            // Rebuild one object per record, keyed by the CSV headers as before
             const parsedData = [];
-            for (let i = 1; i < rows.length; i++) {
-                const row = rows[i];
-                if (row.length < headers.length) continue; // Skip incomplete rows
-                
+            for (let i = 0; i < result.count; i++) {
                 const rowData = {};
-                headers.forEach((header, index) => {
-                    rowData[header.trim()] = row[index]?.trim();
+                result.columns.forEach(header => {
+                    rowData[header] = result.data[header][i];
                 });
                 parsedData.push(rowData);
             }
@@ -3014,8 +3109,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 return !isNaN(lat) && !isNaN(lng);
             });
             
-            if (validRecords.length === 0) {
-                throw new Error('No valid crime records found with coordinates');
+            if (validRecords.length === 0 && !refresh) {
+                showNotification('No crime incidents recorded in this area', 'info');
             }
             
             // Create GeoJSON features from the records
@@ -3199,6 +3294,12 @@ document.addEventListener('DOMContentLoaded', function() {
                 });
             }
             
+            if (refresh) {
+                // The route filter snapshots the source again on its next run
+                window._originalCrimeData = null;
+                return validRecords;
+            }
+            
             // Show all crime layers
             map.setLayoutProperty('crime-clusters', 'visibility', 'visible');
             map.setLayoutProperty('crime-cluster-count', 'visibility', 'visible');
@@ -3209,6 +3310,11 @@ document.addEventListener('DOMContentLoaded', function() {
         } catch (error) {
             console.error('Error loading crime data:', error);
             
+            // Keep the records already on the map if a refresh fails
+            if (refresh) {
+                return;
+            }
+            
             // Try to use mock data if real data isn't available
             const mockData = generateMockCrimeData();
             
@@ -3949,6 +4055,7 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Reset the filter active state
         safetyFilterActive = false;
+        refreshClusteredLayer('traffic_signals');
         
         // Remove "filter-active" class
         resetSafetyFilterBtn.classList.remove('filter-active');
@@ -3970,6 +4077,11 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Prevent the click from reaching the map
         e.originalEvent.stopPropagation();
+        
+        if (e.features[0].properties.cluster) {
+            zoomIntoCluster(e.features[0]);
+            return;
+        }
 
         const coordinates = e.features[0].geometry.coordinates.slice();
         const featureId = e.features[0].properties.id;
@@ -4157,6 +4269,11 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Prevent the click from reaching the map
         e.originalEvent.stopPropagation();
+        
+        if (e.features[0].properties.cluster) {
+            zoomIntoCluster(e.features[0]);
+            return;
+        }
 
         const coordinates = e.features[0].geometry.coordinates.slice();
         const featureId = e.features[0].properties.id;
@@ -4316,6 +4433,7 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Create popup for street lamps
         const coordinates = e.features[0].geometry.coordinates.slice();
+        const pointCount = e.features[0].properties.point_count;
         
         new mapboxgl.Popup({
             closeButton: false,
@@ -4323,7 +4441,8 @@ document.addEventListener('DOMContentLoaded', function() {
             offset: 10
         })
         .setLngLat(coordinates)
-        .setHTML('<strong>Street Lamp</strong><br><small>Click to add to route</small>')
+        .setHTML(pointCount ? `<strong>${pointCount} Street Lamps</strong><br><small>Click to zoom in</small>`
+                            : '<strong>Street Lamp</strong><br><small>Click to add to route</small>')
         .addTo(map);
     });
     
@@ -4402,7 +4521,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 source: 'street-lamps',
                 paint: {
                     'circle-color': '#FF9800', // Orange color
-                    'circle-radius': 4,
+                    'circle-radius': clusterRadius(4),
                     'circle-stroke-width': 1,
                     'circle-stroke-color': 'rgba(255, 255, 255, 0.9)'
                 },
@@ -4418,7 +4537,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 source: 'street-lamps',
                 paint: {
                     'circle-color': 'rgba(255, 152, 0, 0.3)', // Translucent orange
-                    'circle-radius': 8,
+                    'circle-radius': clusterRadius(8),
                     'circle-stroke-width': 1,
                     'circle-stroke-color': 'rgba(255, 255, 255, 0.5)'
                 },
@@ -4437,43 +4556,12 @@ document.addEventListener('DOMContentLoaded', function() {
             bbox = `${bounds.getSouth()},${bounds.getWest()},${bounds.getNorth()},${bounds.getEast()}`;
         }
         
-        // Construct Overpass API query to get street lamps
-        const query = `
-            [out:json];
-            (
-              node["highway"="street_lamp"](${bbox});
-            );
-            out body;
-        `;
-        
         // Show notification
         showNotification('Fetching street lamp data...', 'info');
         
         try {
-            // Fetch street lamps data from Overpass API
-            const response = await fetch('https://overpass-api.de/api/interpreter', {
-                method: 'POST',
-                body: query
-            });
-            
-            if (!response.ok) {
-                throw new Error('Failed to fetch street lamp data');
-            }
-            
-            const data = await response.json();
-            
-            // Convert OSM data to GeoJSON features
-            const features = data.elements.map(element => ({
-                type: 'Feature',
-                geometry: {
-                    type: 'Point',
-                    coordinates: [element.lon, element.lat]
-                },
-                properties: {
-                    id: element.id,
-                    tags: element.tags
-                }
-            }));
+            const data = await fetchOsmFeatures('street_lamps', bbox);
+            const features = data.data.street_lamps.features;
             
             // Store street lamps data globally
             window.state.streetLamps = features;
@@ -4481,14 +4569,8 @@ document.addEventListener('DOMContentLoaded', function() {
             // Make sure the layer exists
             addStreetLampLayers();
             
-            // Update the street lamps source with the features
-            const streetLampsSource = map.getSource('street-lamps');
-            if (streetLampsSource) {
-                streetLampsSource.setData({
-                    type: 'FeatureCollection',
-                    features: features
-                });
-            }
+            // The map shows them clustered for the current view
+            refreshClusteredLayer('street_lamps');
             
             // Show notification with count
             showNotification(`Loaded ${features.length} street lamps in the area`, 'info');
@@ -4560,21 +4642,14 @@ document.addEventListener('DOMContentLoaded', function() {
                             showNotification('No street lamps found in this area', 'info');
                         }
                     });
-                } else {
-                    // Show all lamps if we're not in a filtered state
-                    const streetLampsSource = map.getSource('street-lamps');
-                    if (streetLampsSource) {
-                        streetLampsSource.setData({
-                            type: 'FeatureCollection',
-                            features: window.state.streetLamps
-                        });
-                        console.log(`Showing all ${window.state.streetLamps.length} street lamps`);
-                    }
-            }
+                }
             
             map.setLayoutProperty('street-lamps', 'visibility', 'visible');
                 map.setLayoutProperty('street-lamps-halo', 'visibility', 'visible');
                 streetLampsVisible = true;
+                
+                // Show all lamps, clustered for the current view
+                refreshClusteredLayer('street_lamps');
             }
             
             // Update button appearance
@@ -4596,6 +4671,9 @@ document.addEventListener('DOMContentLoaded', function() {
         // Add hospital layers
         addHospitalLayers();
         
+        // Add the LGA crime choropleth (hidden until toggled) if the server can render it
+        showLgaCrimeIfAvailable();
+        
         // ... existing map load code ...
     });
 
@@ -4665,57 +4743,21 @@ document.addEventListener('DOMContentLoaded', function() {
             bbox = `${bounds.getSouth()},${bounds.getWest()},${bounds.getNorth()},${bounds.getEast()}`;
         }
         
-        // Construct Overpass API query to get hospitals
-        const query = `
-            [out:json];
-            (
-              node["amenity"="hospital"](${bbox});
-              way["amenity"="hospital"](${bbox});
-              relation["amenity"="hospital"](${bbox});
-            );
-            out center;
-        `;
-        
         // Show notification
         showNotification('Fetching hospital data...', 'info');
         
         try {
-            // Fetch hospital data from Overpass API
-            const response = await fetch('https://overpass-api.de/api/interpreter', {
-                method: 'POST',
-                body: query
-            });
-            
-            if (!response.ok) {
-                throw new Error('Failed to fetch hospital data');
-            }
-            
-            const data = await response.json();
-            
-            // Convert OSM data to GeoJSON features
-            const features = data.elements.map(element => {
-                // Handle different element types (node, way, relation)
-                let coordinates;
-                if (element.type === 'node') {
-                    coordinates = [element.lon, element.lat];
-                } else {
-                    // For ways and relations, use the center point
-                    coordinates = [element.center.lon, element.center.lat];
+            // Ways and relations arrive as their centre point
+            const data = await fetchOsmFeatures('hospitals', bbox);
+            const features = data.data.hospitals.features.map(feature => ({
+                type: 'Feature',
+                geometry: feature.geometry,
+                properties: {
+                    id: feature.properties.id,
+                    name: feature.properties.name || 'Hospital',
+                    tags: JSON.stringify(feature.properties.tags || {})
                 }
-                
-                return {
-                    type: 'Feature',
-                    geometry: {
-                        type: 'Point',
-                        coordinates: coordinates
-                    },
-                    properties: {
-                        id: element.id,
-                        name: element.tags && element.tags.name ? element.tags.name : 'Hospital',
-                        tags: JSON.stringify(element.tags || {})
-                    }
-                };
-            });
+            }));
             
             // Store hospitals data globally
             window.state.hospitals = features;
@@ -5751,46 +5793,6 @@ document.addEventListener('DOMContentLoaded', function() {
     // Expose function to window for access from other scripts
     window.calculateSafetyScore = calculateSafetyScore;
 
-    // Function to fetch more detailed information about a specific hospital
-    async function fetchHospitalDetails(hospitalId) {
-        try {
-            // Construct Overpass API query to get detailed info for a specific hospital
-            const query = `
-                [out:json];
-                (
-                  node(${hospitalId});
-                  way(${hospitalId});
-                  relation(${hospitalId});
-                );
-                out body;
-                >;
-                out skel qt;
-            `;
-            
-            // Fetch detailed hospital data from Overpass API
-            const response = await fetch('https://overpass-api.de/api/interpreter', {
-                method: 'POST',
-                body: query
-            });
-            
-            if (!response.ok) {
-                throw new Error('Failed to fetch hospital details');
-            }
-            
-            const data = await response.json();
-            
-            // Return the detailed element if found
-            if (data.elements && data.elements.length > 0) {
-                return data.elements[0];
-            }
-            
-            return null;
-        } catch (error) {
-            console.error('Error fetching hospital details:', error);
-            return null;
-        }
-    }
-    
     // Add click event handler for hospital markers
     map.on('click', 'hospitals', async function(e) {
         // Get clicked feature
@@ -5813,14 +5815,8 @@ document.addEventListener('DOMContentLoaded', function() {
             .setHTML('<div class="hospital-popup"><p>Loading hospital information...</p></div>')
             .addTo(map);
             
-        // Try to fetch additional details
-        const detailedInfo = await fetchHospitalDetails(id);
-        
-        // Merge tags from detailed info if available
-        let mergedTags = tags;
-        if (detailedInfo && detailedInfo.tags) {
-            mergedTags = {...tags, ...detailedInfo.tags};
-        }
+        // The layer already carries every tag of the element, so no details request is needed
+        const mergedTags = tags;
         
         // Extract relevant information from tags
         const phone = mergedTags.phone || mergedTags['contact:phone'] || 'Not available';
@@ -6072,57 +6068,21 @@ document.addEventListener('DOMContentLoaded', function() {
             bbox = `${bounds.getSouth()},${bounds.getWest()},${bounds.getNorth()},${bounds.getEast()}`;
         }
         
-        // Construct Overpass API query to get police stations
-        const query = `
-            [out:json];
-            (
-              node["amenity"="police"](${bbox});
-              way["amenity"="police"](${bbox});
-              relation["amenity"="police"](${bbox});
-            );
-            out center;
-        `;
-        
         // Show notification
         showNotification('Fetching police station data...', 'info');
         
         try {
-            // Fetch police station data from Overpass API
-            const response = await fetch('https://overpass-api.de/api/interpreter', {
-                method: 'POST',
-                body: query
-            });
-            
-            if (!response.ok) {
-                throw new Error('Failed to fetch police station data');
-            }
-            
-            const data = await response.json();
-            
-            // Convert OSM data to GeoJSON features
-            const features = data.elements.map(element => {
-                // Handle different element types (node, way, relation)
-                let coordinates;
-                if (element.type === 'node') {
-                    coordinates = [element.lon, element.lat];
-                } else {
-                    // For ways and relations, use the center point
-                    coordinates = [element.center.lon, element.center.lat];
+            // Ways and relations arrive as their centre point
+            const data = await fetchOsmFeatures('police', bbox);
+            const features = data.data.police.features.map(feature => ({
+                type: 'Feature',
+                geometry: feature.geometry,
+                properties: {
+                    id: feature.properties.id,
+                    name: feature.properties.name || 'Police Station',
+                    tags: JSON.stringify(feature.properties.tags || {})
                 }
-                
-                return {
-                    type: 'Feature',
-                    geometry: {
-                        type: 'Point',
-                        coordinates: coordinates
-                    },
-                    properties: {
-                        id: element.id,
-                        name: element.tags && element.tags.name ? element.tags.name : 'Police Station',
-                        tags: JSON.stringify(element.tags || {})
-                    }
-                };
-            });
+            }));
             
             // Store police stations data globally
             window.state.policeStations = features;
@@ -6150,46 +6110,6 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // Function to fetch police station details
-    async function fetchPoliceStationDetails(stationId) {
-        try {
-            // Construct Overpass API query to get detailed info for a specific police station
-            const query = `
-                [out:json];
-                (
-                  node(${stationId});
-                  way(${stationId});
-                  relation(${stationId});
-                );
-                out body;
-                >;
-                out skel qt;
-            `;
-            
-            // Fetch detailed police station data from Overpass API
-            const response = await fetch('https://overpass-api.de/api/interpreter', {
-                method: 'POST',
-                body: query
-            });
-            
-            if (!response.ok) {
-                throw new Error('Failed to fetch police station details');
-            }
-            
-            const data = await response.json();
-            
-            // Return the detailed element if found
-            if (data.elements && data.elements.length > 0) {
-                return data.elements[0];
-            }
-            
-            return null;
-        } catch (error) {
-            console.error('Error fetching police station details:', error);
-            return null;
-        }
-    }
-    
     // Function to toggle police stations visibility
     function togglePoliceStations() {
         // Get the button element
@@ -6261,14 +6181,8 @@ document.addEventListener('DOMContentLoaded', function() {
             .setHTML('<div class="police-station-popup"><p>Loading police station information...</p></div>')
             .addTo(map);
             
-        // Try to fetch additional details
-        const detailedInfo = await fetchPoliceStationDetails(id);
-        
-        // Merge tags from detailed info if available
-        let mergedTags = tags;
-        if (detailedInfo && detailedInfo.tags) {
-            mergedTags = {...tags, ...detailedInfo.tags};
-        }
+        // The layer already carries every tag of the element, so no details request is needed
+        const mergedTags = tags;
         
         // Extract relevant information from tags as specified
         const operator = mergedTags.operator || 'Not available';
@@ -6625,57 +6539,21 @@ document.addEventListener('DOMContentLoaded', function() {
             bbox = `${bounds.getSouth()},${bounds.getWest()},${bounds.getNorth()},${bounds.getEast()}`;
         }
         
-        // Construct Overpass API query to get police stations
-        const query = `
-            [out:json];
-            (
-              node["amenity"="police"](${bbox});
-              way["amenity"="police"](${bbox});
-              relation["amenity"="police"](${bbox});
-            );
-            out center;
-        `;
-        
         // Show notification
         showNotification('Fetching police station data...', 'info');
         
         try {
-            // Fetch police station data from Overpass API
-            const response = await fetch('https://overpass-api.de/api/interpreter', {
-                method: 'POST',
-                body: query
-            });
-            
-            if (!response.ok) {
-                throw new Error('Failed to fetch police station data');
-            }
-            
-            const data = await response.json();
-            
-            // Convert OSM data to GeoJSON features
-            const features = data.elements.map(element => {
-                // Handle different element types (node, way, relation)
-                let coordinates;
-                if (element.type === 'node') {
-                    coordinates = [element.lon, element.lat];
-                } else {
-                    // For ways and relations, use the center point
-                    coordinates = [element.center.lon, element.center.lat];
+            // Ways and relations arrive as their centre point
+            const data = await fetchOsmFeatures('police', bbox);
+            const features = data.data.police.features.map(feature => ({
+                type: 'Feature',
+                geometry: feature.geometry,
+                properties: {
+                    id: feature.properties.id,
+                    name: feature.properties.name || 'Police Station',
+                    tags: JSON.stringify(feature.properties.tags || {})
                 }
-                
-                return {
-                    type: 'Feature',
-                    geometry: {
-                        type: 'Point',
-                        coordinates: coordinates
-                    },
-                    properties: {
-                        id: element.id,
-                        name: element.tags && element.tags.name ? element.tags.name : 'Police Station',
-                        tags: JSON.stringify(element.tags || {})
-                    }
-                };
-            });
+            }));
             
             // Store police stations data globally
             window.state.policeStations = features;
@@ -6703,46 +6581,6 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // Function to fetch police station details
-    async function fetchPoliceStationDetails(stationId) {
-        try {
-            // Construct Overpass API query to get detailed info for a specific police station
-            const query = `
-                [out:json];
-                (
-                  node(${stationId});
-                  way(${stationId});
-                  relation(${stationId});
-                );
-                out body;
-                >;
-                out skel qt;
-            `;
-            
-            // Fetch detailed police station data from Overpass API
-            const response = await fetch('https://overpass-api.de/api/interpreter', {
-                method: 'POST',
-                body: query
-            });
-            
-            if (!response.ok) {
-                throw new Error('Failed to fetch police station details');
-            }
-            
-            const data = await response.json();
-            
-            // Return the detailed element if found
-            if (data.elements && data.elements.length > 0) {
-                return data.elements[0];
-            }
-            
-            return null;
-        } catch (error) {
-            console.error('Error fetching police station details:', error);
-            return null;
-        }
-    }
-    
     // Function to toggle police stations visibility
     function togglePoliceStations() {
         // Get the button element
@@ -6792,6 +6630,127 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Function to add the LGA crime choropleth, drawn from the server's vector tiles
+    function addLgaCrimeLayers() {
+        if (!map.getSource('lga-crime')) {
+            map.addSource('lga-crime', {
+                type: 'vector',
+                tiles: [`${window.location.origin}/tiles/lga_crime/{z}/{x}/{y}.mvt`],
+                maxzoom: 14
+            });
+        }
+        
+        // Keep the fill under the route line
+        const beforeId = map.getLayer('route-outline') ? 'route-outline' : undefined;
+        
+        if (!map.getLayer('lga-crime-fill')) {
+            map.addLayer({
+                id: 'lga-crime-fill',
+                type: 'fill',
+                source: 'lga-crime',
+                'source-layer': 'lga_crime',
+                layout: {
+                    'visibility': 'none'
+                },
+                paint: {
+                    // Rank 1 is the highest crime rate; unranked LGAs stay grey
+                    'fill-color': [
+                        'case',
+                        ['has', 'rank'],
+                        ['interpolate', ['linear'], ['get', 'rank'],
+                            1, '#d73027',
+                            40, '#fc8d59',
+                            80, '#fee08b',
+                            130, '#ffffbf'
+                        ],
+                        '#cccccc'
+                    ],
+                    'fill-opacity': 0.35
+                }
+            }, beforeId);
+        }
+        
+        if (!map.getLayer('lga-crime-outline')) {
+            map.addLayer({
+                id: 'lga-crime-outline',
+                type: 'line',
+                source: 'lga-crime',
+                'source-layer': 'lga_crime',
+                layout: {
+                    'visibility': 'none'
+                },
+                paint: {
+                    'line-color': '#666666',
+                    'line-width': 0.5,
+                    'line-opacity': 0.6
+                }
+            }, beforeId);
+        }
+    }
+    
+    // The lga_crime tiles need the LGA boundaries file on the server, so the
+    // toggle stays hidden unless /tiles/layers lists the layer
+    async function showLgaCrimeIfAvailable() {
+        try {
+            const response = await fetch('/tiles/layers');
+            const result = await response.json();
+            if (!result.success || !result.layers.includes('lga_crime')) {
+                return;
+            }
+        } catch (error) {
+            console.error('Error checking vector tile layers:', error);
+            return;
+        }
+        
+        addLgaCrimeLayers();
+        const lgaCrimeBtn = document.getElementById('toggle-lga-crime');
+        if (lgaCrimeBtn) {
+            lgaCrimeBtn.style.display = '';
+        }
+    }
+    
+    // Function to toggle the LGA crime choropleth
+    function toggleLgaCrime() {
+        const lgaCrimeBtn = document.getElementById('toggle-lga-crime');
+        
+        if (!map.getLayer('lga-crime-fill')) {
+            return false;
+        }
+        
+        const visible = map.getLayoutProperty('lga-crime-fill', 'visibility') === 'visible';
+        const visibility = visible ? 'none' : 'visible';
+        map.setLayoutProperty('lga-crime-fill', 'visibility', visibility);
+        map.setLayoutProperty('lga-crime-outline', 'visibility', visibility);
+        
+        // Update button appearance
+        if (lgaCrimeBtn) {
+            lgaCrimeBtn.classList.toggle('active', !visible);
+        }
+        
+        return !visible;
+    }
+    
+    // LGA crime toggle
+    const toggleLgaCrimeBtn = document.getElementById('toggle-lga-crime');
+    if (toggleLgaCrimeBtn) {
+        toggleLgaCrimeBtn.addEventListener('click', toggleLgaCrime);
+    }
+    
+    // Show the LGA's crime summary on click
+    map.on('click', 'lga-crime-fill', function(e) {
+        const properties = e.features[0].properties;
+        let html = `<strong>${properties.name}</strong>`;
+        if (properties.rank !== undefined) {
+            html += `<br>Crime rate: ${properties.crimeRate}`
+                  + `<br>Incidents: ${properties.crimeCount}`
+                  + `<br>Rank: ${properties.rank} (1 = highest)`;
+        }
+        new mapboxgl.Popup()
+            .setLngLat(e.lngLat)
+            .setHTML(html)
+            .addTo(map);
+    });
+
     // Add click event handler for police station markers
     map.on('click', 'police-stations', async function(e) {
         // Get clicked feature
@@ -6814,14 +6773,8 @@ document.addEventListener('DOMContentLoaded', function() {
             .setHTML('<div class="police-station-popup"><p>Loading police station information...</p></div>')
             .addTo(map);
             
-        // Try to fetch additional details
-        const detailedInfo = await fetchPoliceStationDetails(id);
-        
-        // Merge tags from detailed info if available
-        let mergedTags = tags;
-        if (detailedInfo && detailedInfo.tags) {
-            mergedTags = {...tags, ...detailedInfo.tags};
-        }
+        // The layer already carries every tag of the element, so no details request is needed
+        const mergedTags = tags;
         
         // Extract relevant information from tags as specified
         const operator = mergedTags.operator || 'Not available';
@@ -7175,7 +7128,7 @@ document.addEventListener('DOMContentLoaded', function() {
             crimeTimePanel.style.display = 'block';
             
             // Fetch crime data then update panel
-            fetchCrimeData().then(() => {
+            fetchCrimeData(crimeBboxForView(route)).then(() => {
                 console.log("Crime data loaded, now updating panel");
                 
                 // Add a small delay to ensure everything is loaded
@@ -189,6 +189,53 @@ I'm analyzing your route for safety.<br/><br/>
 For non-safety related general route planning questions, respond conversationally without the structured data format.` }
     ];
     
+    // Server-side conversation: the server keeps the history, so each call only
+    // sends the chatHistory entries added since the last one
+    let chatSessionId = null;
+    let syncedHistoryLength = 0;
+    
+    // Build the /chat request body for a server-side conversation
+    function buildChatRequest(messages, lga) {
+        return {
+            session_id: chatSessionId,
+            // The system prompt only needs sending when the session starts
+            system: chatSessionId ? undefined : chatHistory[0].content,
+            messages: chatHistory.slice(Math.max(syncedHistoryLength, 1)),
+            // System messages added for this turn only (route, LGA and crime context)
+            context: messages
+                .filter(m => m.role === 'system' && !chatHistory.includes(m))
+                .map(m => m.content),
+            // An LGA named here gets its crime statistics attached on the server
+            lga: lga || undefined
+        };
+    }
+    
+    // Post a chat request, starting a new session with the full history if the old one expired
+    async function postChat(messages, lga) {
+        let response = await fetch('/chat', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(buildChatRequest(messages, lga))
+        });
+        
+        if (response.ok) {
+            const data = await response.clone().json();
+            if (data.session_expired) {
+                chatSessionId = null;
+                syncedHistoryLength = 0;
+                return postChat(messages, lga);
+            }
+            if (data.session_id) {
+                chatSessionId = data.session_id;
+                // sendMessage adds the reply to chatHistory next; the server already has it
+                syncedHistoryLength = chatHistory.length + 1;
+            }
+        }
+        return response;
+    }
+    
     // Initialize chat
     function initChat() {
         // Add CSS styling for safety responses
@@ -804,14 +851,23 @@ For non-safety related general route planning questions, respond conversationall
             
             // Continue with normal message processing for non-safety queries
             // Check if the message is related to crime data
-            let crimeData = null;
-            if (normalizedMessage.toLowerCase().includes('crime') || 
+            const isCrimeQuestion = normalizedMessage.toLowerCase().includes('crime') || 
                 normalizedMessage.toLowerCase().includes('safety') ||
                 normalizedMessage.toLowerCase().includes('lga') ||
                 normalizedMessage.toLowerCase().includes('violence') ||
                 normalizedMessage.toLowerCase().includes('assault') ||
                 normalizedMessage.toLowerCase().includes('incident') ||
-                isLgaQuery) {
+                isLgaQuery;
+            let crimeData = null;
+            let chatLga = null;
+            if (isCrimeQuestion) {
+                // The server attaches this LGA's statistics by name
+                chatLga = (lgaData && lgaData.stats && lgaData.stats[0] && lgaData.stats[0].name) ||
+                    await getMapCentreLgaName();
+            }
+            
+            // Only a first turn with no known LGA still sends the whole rankings table inline
+            if (isCrimeQuestion && chatLga === null && !chatSessionId) {
                 
                 // Fetch crime data to provide to the AI
                 try {
@@ -915,7 +971,7 @@ Please inform the user that we have LGA crime data but couldn't find a match for
             }
             
             // Call OpenAI API
-            const response = await callOpenAI(messages);
+            const response = await callOpenAI(messages, chatLga);
             
             // Remove loading indicator
             loadingMessage.remove();
@@ -923,12 +979,12 @@ Please inform the user that we have LGA crime data but couldn't find a match for
             // Process and add assistant response
             let assistantMessage = response.choices[0].message.content;
             
-            // Special case for LGA query - add a hint if this is the first time
+            // Special case for LGA query - add a hint if this is the first time.
+            // The hint is only displayed, so chatHistory keeps the reply the server stored
+            let hintMessage = '';
             if (isLgaQuery && !window.hasShownLgaHint) {
                 window.hasShownLgaHint = true;
-                // Add hint to the message
-                const hintMessage = `\n\n[Note: You can ask about crime statistics for any NSW Local Government Area like "How many robberies in Bayside?" or "What's the most common crime in Sydney?" for detailed statistics.]`;
-                assistantMessage = assistantMessage + hintMessage;
+                hintMessage = `\n\n[Note: You can ask about crime statistics for any NSW Local Government Area like "How many robberies in Bayside?" or "What's the most common crime in Sydney?" for detailed statistics.]`;
                 console.log("Adding LGA hint to response");
             }
             
@@ -938,11 +994,11 @@ Please inform the user that we have LGA crime data but couldn't find a match for
             // Only show the conversational part to the user
             if (parsedResponse.response && parsedResponse.response !== assistantMessage) {
                 // If we successfully parsed a structured response, show only the response part
-                addMessageToChat('assistant', parsedResponse.response);
+                addMessageToChat('assistant', parsedResponse.response + hintMessage);
             } else {
                 // If parsing failed, clean up the message before displaying
                 const cleanedMessage = cleanResponseForDisplay(assistantMessage);
-                addMessageToChat('assistant', cleanedMessage);
+                addMessageToChat('assistant', cleanedMessage + hintMessage);
             }
             
             // Add to history (keep full response for context)
@@ -1844,7 +1900,7 @@ Please inform the user that we have LGA crime data but couldn't find a match for
     }
     
     // Call OpenAI API for chat completion
-    async function callOpenAI(messages) {
+    async function callOpenAI(messages, lga) {
         // Check if this is an LGA crime stats query and add extra enforcement
         const lastUserMessage = messages.find(m => m.role === 'user')?.content || '';
         const isLgaQuery = isLgaCrimeStatsQuery(lastUserMessage);
@@ -1943,13 +1999,7 @@ You MUST say something like: "Bayside recorded exactly 32 robbery incidents in t
         
         try {
             // Call the backend proxy instead of directly calling OpenAI
-            const response = await fetch('/chat', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({ messages })
-            });
+            const response = await postChat(messages, lga);
                 
             if (!response.ok) {
                 const errorData = await response.json();
@@ -2624,6 +2674,20 @@ You MUST say something like: "Bayside recorded exactly 32 robbery incidents in t
         }
     }
     
+    // Name of the LGA at the map centre, or null
+    async function getMapCentreLgaName() {
+        const mapObj = window.mapInstance;
+        if (!mapObj || typeof mapObj.getCenter !== 'function') return null;
+        try {
+            const center = mapObj.getCenter();
+            const info = await window.getLgaInfoForCoordinates(center.lat.toFixed(4), center.lng.toFixed(4));
+            return (info && info.success && info.lga) || null;
+        } catch (error) {
+            console.error("Error looking up LGA at map centre:", error);
+            return null;
+        }
+    }
+    
     // Helper function to get LGA information for coordinates
     window.getLgaInfoForCoordinates = async function(lat, lng) {
         try {
@@ -3123,6 +3187,9 @@ You MUST say something like: "Bayside recorded exactly 32 robbery incidents in t
                     const visibility = keepVisible ? 'visible' : 'none';
                     window.map.setLayoutProperty('street-lamps', 'visibility', visibility);
                     window.map.setLayoutProperty('street-lamps-halo', 'visibility', visibility);
+                    if (window.refreshClusteredLayer) {
+                        window.refreshClusteredLayer('street_lamps');
+                    }
                     
                     console.log(`Reset street lamps filter: ${window.state.streetLamps.length} lamps, visibility=${visibility}`);
                 }
@@ -3596,6 +3663,10 @@ You MUST say something like: "Bayside recorded exactly 32 robbery incidents in t
                 
                 console.log(`Reset to show all ${window.state.streetLamps.length} street lamps`);
             }
+            // Back to the clustered view of every lamp once no filter is active
+            if (window.refreshClusteredLayer) {
+                window.refreshClusteredLayer('street_lamps');
+            }
         } catch (error) {
             console.error("Error resetting street lamp filter:", error);
         }
@@ -5297,14 +5368,23 @@ You MUST say something like: "Bayside recorded exactly 32 robbery incidents in t
             
             // Continue with normal message processing for non-safety queries
             // Check if the message is related to crime data
-            let crimeData = null;
-            if (normalizedMessage.toLowerCase().includes('crime') || 
+            const isCrimeQuestion = normalizedMessage.toLowerCase().includes('crime') || 
                 normalizedMessage.toLowerCase().includes('safety') ||
                 normalizedMessage.toLowerCase().includes('lga') ||
                 normalizedMessage.toLowerCase().includes('violence') ||
                 normalizedMessage.toLowerCase().includes('assault') ||
                 normalizedMessage.toLowerCase().includes('incident') ||
-                isLgaQuery) {
+                isLgaQuery;
+            let crimeData = null;
+            let chatLga = null;
+            if (isCrimeQuestion) {
+                // The server attaches this LGA's statistics by name
+                chatLga = (lgaData && lgaData.stats && lgaData.stats[0] && lgaData.stats[0].name) ||
+                    await getMapCentreLgaName();
+            }
+            
+            // Only a first turn with no known LGA still sends the whole rankings table inline
+            if (isCrimeQuestion && chatLga === null && !chatSessionId) {
                 
                 // Fetch crime data to provide to the AI
                 try {
@@ -5408,7 +5488,7 @@ Please inform the user that we have LGA crime data but couldn't find a match for
             }
             
             // Call OpenAI API
-            const response = await callOpenAI(messages);
+            const response = await callOpenAI(messages, chatLga);
             
             // Remove loading indicator
             loadingMessage.remove();
@@ -5416,12 +5496,12 @@ Please inform the user that we have LGA crime data but couldn't find a match for
             // Process and add assistant response
             let assistantMessage = response.choices[0].message.content;
             
-            // Special case for LGA query - add a hint if this is the first time
+            // Special case for LGA query - add a hint if this is the first time.
+            // The hint is only displayed, so chatHistory keeps the reply the server stored
+            let hintMessage = '';
             if (isLgaQuery && !window.hasShownLgaHint) {
                 window.hasShownLgaHint = true;
-                // Add hint to the message
-                const hintMessage = `\n\n[Note: You can ask about crime statistics for any NSW Local Government Area like "How many robberies in Bayside?" or "What's the most common crime in Sydney?" for detailed statistics.]`;
-                assistantMessage = assistantMessage + hintMessage;
+                hintMessage = `\n\n[Note: You can ask about crime statistics for any NSW Local Government Area like "How many robberies in Bayside?" or "What's the most common crime in Sydney?" for detailed statistics.]`;
                 console.log("Adding LGA hint to response");
             }
             
@@ -5431,11 +5511,11 @@ Please inform the user that we have LGA crime data but couldn't find a match for
             // Only show the conversational part to the user
             if (parsedResponse.response && parsedResponse.response !== assistantMessage) {
                 // If we successfully parsed a structured response, show only the response part
-                addMessageToChat('assistant', parsedResponse.response);
+                addMessageToChat('assistant', parsedResponse.response + hintMessage);
             } else {
                 // If parsing failed, clean up the message before displaying
                 const cleanedMessage = cleanResponseForDisplay(assistantMessage);
-                addMessageToChat('assistant', cleanedMessage);
+                addMessageToChat('assistant', cleanedMessage + hintMessage);
             }
             
             // Add to history (keep full response for context)
@@ -0,0 +1,33 @@
+"""Which chat questions the crime fast path answers itself"""
+from types import SimpleNamespace
+
+from crime_answers import CrimeQuestionMatcher
+
+SNAPSHOT = SimpleNamespace(
+    lgas=['Sydney', 'Newcastle', 'Bayside', 'Penrith'],
+    offences=[{'sheet': 'Robbery'}, {'sheet': 'Break and enter dwelling'}, {'sheet': 'Motor vehicle theft'}],
+    periods=['Jan 2024 - Dec 2024'],
+)
+MATCHER = CrimeQuestionMatcher(SimpleNamespace(snapshot=SNAPSHOT))
+
+
+def test_open_ended_questions_reach_the_model():
+    for question in [
+        'Which areas are safest to walk at night near me?',
+        'Is Sydney safe? What is the crime rate and what should I watch out for when walking at night?',
+        'I was robbed in Newcastle, what should I do? how many incidents get solved?',
+    ]:
+        assert MATCHER.match(question) is None, question
+
+
+def test_ranking_needs_a_crime_term():
+    assert MATCHER.match('Which areas are the best?') is None
+    intent, details = MATCHER.match('Which LGAs have the lowest crime rates?')
+    assert intent == 'ranking' and details['ascending']
+
+
+def test_statistics_lookups_are_answered():
+    assert MATCHER.match("What's the robbery rate in Bayside?") == ('lga_stats', {'lga': 2, 'offence': 0})
+    assert MATCHER.match('How many break-ins in Penrith') == ('lga_stats', {'lga': 3, 'offence': 1})
+    intent, details = MATCHER.match('Which LGA has the highest rate of car theft')
+    assert intent == 'ranking' and details['offence'] == 2 and not details['ascending']
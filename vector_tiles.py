@@ -0,0 +1,404 @@
+"""Mapbox Vector Tiles for the map's safety overlays.
+
+Each layer is rendered per z/x/y tile from data the server already caches:
+
+    street_lamps, traffic_signals, hospitals, police
+        OSM points from the tile store. Below DETAIL_ZOOM they come from the
+        point_clusters index (clusters carry point_count); from DETAIL_ZOOM on
+        every point is included with its id (and name, if it has one).
+    lga_crime
+        LGA boundary polygons clipped to the tile, with the latest-period crime
+        summary (crimeRate, crimeCount, rank) for a choropleth.
+
+Tiles are encoded here (the format is a small protobuf, version 2.1 of the
+spec) and kept in an in-memory LRU. Tiles pre-rendered to disk with
+
+    python vector_tiles.py render lga_crime 5 12 [south,west,north,east]
+
+are served from TILE_DIR until they are older than TILE_TTL.
+"""
+import math
+import os
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from lga_boundaries import LgaBoundariesError, get_lga_index
+from lga_crime import LgaCrimeDataError, get_lga_crime_table
+from osm_tiles import KINDS, SYDNEY_BBOX, THIN_DISTANCES, kinds_in_bbox, parse_bbox, thin_by_distance, \
+    tile_bounds, tiles_for_bbox
+from point_clusters import REGION_ZOOM, clusters_in_bbox
+
+EXTENT = 4096
+# Polygons are clipped this far (in tile units) outside the tile so edges don't show seams
+BUFFER = 64
+
+POINT_LAYERS = list(KINDS)
+LAYERS = POINT_LAYERS + ['lga_crime']
+
+# Point layers need one clustering region per tile, so lower zooms are left empty
+POINT_MIN_ZOOM = REGION_ZOOM
+DETAIL_ZOOM = 14
+MAX_ZOOM = 22
+
+TILE_TTL = 24 * 60 * 60
+TILE_DIR = os.getenv('VECTOR_TILE_DIR', 'cache/vector_tiles')
+MEMORY_BYTES = 64 * 1024 * 1024
+
+CONTENT_TYPE = 'application/vnd.mapbox-vector-tile'
+
+
+class VectorTileError(Exception):
+    """Raised for an unknown layer or a tile outside the valid range"""
+
+
+# Protobuf encoding
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 31)
+
+
+def _field(number, wire_type):
+    return _varint((number << 3) | wire_type)
+
+
+def _length_delimited(number, payload):
+    return _field(number, 2) + _varint(len(payload)) + payload
+
+
+def _packed(number, values):
+    return _length_delimited(number, b''.join(_varint(v) for v in values))
+
+
+def _value(value):
+    # Tile.Value fields: string = 1, double = 3, uint = 5, sint = 6, bool = 7
+    if isinstance(value, bool):
+        return _field(7, 0) + _varint(int(value))
+    if isinstance(value, int) and value >= 0:
+        return _field(5, 0) + _varint(value)
+    if isinstance(value, int):
+        return _field(6, 0) + _varint((value << 1) ^ (value >> 63))
+    if isinstance(value, float):
+        return _field(3, 1) + struct.pack('<d', value)
+    return _length_delimited(1, str(value).encode('utf-8'))
+
+
+def _command(command_id, count):
+    return (command_id & 0x7) | (count << 3)
+
+
+def _point_geometry(x, y):
+    return [_command(1, 1), _zigzag(x), _zigzag(y)]
+
+
+def _polygon_geometry(rings):
+    geometry = []
+    cursor_x = cursor_y = 0
+    for ring in rings:
+        geometry.append(_command(1, 1))
+        geometry += [_zigzag(ring[0][0] - cursor_x), _zigzag(ring[0][1] - cursor_y)]
+        geometry.append(_command(2, len(ring) - 1))
+        for (x0, y0), (x1, y1) in zip(ring, ring[1:]):
+            geometry += [_zigzag(x1 - x0), _zigzag(y1 - y0)]
+        geometry.append(_command(7, 1))
+        cursor_x, cursor_y = ring[-1]
+    return geometry
+
+
+def encode_layer(name, features, extent=EXTENT):
+    """One Tile.Layer; features are (id or None, properties, geom_type, geometry commands)"""
+    keys, values = {}, {}
+    body = bytearray()
+    for feature_id, properties, geom_type, geometry in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value).__name__, value), len(values)))
+        feature = b''
+        if feature_id is not None:
+            feature += _field(1, 0) + _varint(feature_id)
+        if tags:
+            feature += _packed(2, tags)
+        feature += _field(3, 0) + _varint(geom_type) + _packed(4, geometry)
+        body += _length_delimited(2, feature)
+
+    layer = _field(15, 0) + _varint(2) + _length_delimited(1, name.encode('utf-8')) + bytes(body)
+    for key in keys:
+        layer += _length_delimited(3, key.encode('utf-8'))
+    for (_, value) in values:
+        layer += _length_delimited(4, _value(value))
+    layer += _field(5, 0) + _varint(extent)
+    return _length_delimited(3, layer)
+
+
+# Geometry
+
+def _world_xy(lng, lat):
+    sin = math.sin(math.radians(max(min(lat, 85.0511), -85.0511)))
+    return lng / 360.0 + 0.5, 0.5 - 0.25 * math.log((1 + sin) / (1 - sin)) / math.pi
+
+
+def _tile_projector(z, x, y, extent=EXTENT):
+    scale = 2 ** z
+
+    def project(lng, lat):
+        wx, wy = _world_xy(lng, lat)
+        return (wx * scale - x) * extent, (wy * scale - y) * extent
+    return project
+
+
+def _clip_ring(ring, low, high):
+    """Sutherland-Hodgman clip of a closed ring to the square [low, high]"""
+    def clip(points, inside, intersect):
+        if not points:
+            return points
+        out = []
+        previous = points[-1]
+        for point in points:
+            if inside(point):
+                if not inside(previous):
+                    out.append(intersect(previous, point))
+                out.append(point)
+            elif inside(previous):
+                out.append(intersect(previous, point))
+            previous = point
+        return out
+
+    def at_x(edge):
+        return lambda a, b: (edge, a[1] + (b[1] - a[1]) * (edge - a[0]) / (b[0] - a[0]))
+
+    def at_y(edge):
+        return lambda a, b: (a[0] + (b[0] - a[0]) * (edge - a[1]) / (b[1] - a[1]), edge)
+
+    points = ring[:-1] if ring[0] == ring[-1] else ring
+    points = clip(points, lambda p: p[0] >= low, at_x(low))
+    points = clip(points, lambda p: p[0] <= high, at_x(high))
+    points = clip(points, lambda p: p[1] >= low, at_y(low))
+    points = clip(points, lambda p: p[1] <= high, at_y(high))
+    return points
+
+
+def _ring_area(ring):
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1])) / 2
+
+
+def _tile_rings(rings, project, extent=EXTENT, buffer=BUFFER):
+    """Project, clip and quantize a polygon's rings; exterior first, MVT winding"""
+    out = []
+    for position, ring in enumerate(rings):
+        clipped = _clip_ring([project(lng, lat) for lng, lat in ring], -buffer, extent + buffer)
+        quantized = []
+        for x, y in clipped:
+            point = (int(round(x)), int(round(y)))
+            if not quantized or quantized[-1] != point:
+                quantized.append(point)
+        while len(quantized) > 1 and quantized[0] == quantized[-1]:
+            quantized.pop()
+        if len(quantized) < 3:
+            if position == 0:
+                return []
+            continue
+        area = _ring_area(quantized)
+        if area == 0:
+            if position == 0:
+                return []
+            continue
+        # Exterior rings have positive area in tile coordinates (y down), holes negative
+        if (position == 0) != (area > 0):
+            quantized.reverse()
+        out.append(quantized)
+    return out
+
+
+# Layers
+
+def _inner_bounds(x, y, z):
+    """tile_bounds shrunk a hair, so lookups by bbox don't pick up the neighbours sharing its edges"""
+    south, west, north, east = tile_bounds(x, y, z)
+    pad_lng = (east - west) * 1e-6
+    pad_lat = (north - south) * 1e-6
+    return south + pad_lat, west + pad_lng, north - pad_lat, east - pad_lng
+
+
+def _point_features(layer, z, x, y):
+    if z < POINT_MIN_ZOOM:
+        return []
+    south, west, north, east = _inner_bounds(x, y, z)
+    project = _tile_projector(z, x, y)
+    features = []
+    if z < DETAIL_ZOOM:
+        clusters, _ = clusters_in_bbox(layer, south, west, north, east, z)
+        for feature in clusters:
+            lng, lat = feature['geometry']['coordinates']
+            px, py = project(lng, lat)
+            properties = feature['properties']
+            if properties.get('cluster'):
+                features.append((None, {'cluster': True, 'point_count': properties['point_count']},
+                                 1, _point_geometry(int(px), int(py))))
+            else:
+                features.append((properties['id'], {}, 1, _point_geometry(int(px), int(py))))
+        return features
+
+    elements = kinds_in_bbox([layer], south, west, north, east)[layer]
+    elements = sorted(elements, key=lambda element: (element.get('type', 'node'), element['id']))
+    for element in thin_by_distance(elements, THIN_DISTANCES.get(layer, 0)):
+        px, py = project(element['lon'], element['lat'])
+        properties = {'name': element['tags'].get('name')}
+        features.append((element['id'], properties, 1, _point_geometry(int(px), int(py))))
+    return features
+
+
+def _lga_crime_features(z, x, y):
+    index = get_lga_index()
+    try:
+        table = get_lga_crime_table()
+    except LgaCrimeDataError:
+        table = None
+
+    south, west, north, east = tile_bounds(x, y, z)
+    # Include polygons reaching into the clip buffer
+    pad_lng = (east - west) * BUFFER / EXTENT
+    pad_lat = (north - south) * BUFFER / EXTENT
+    project = _tile_projector(z, x, y)
+
+    features = []
+    for polygon in index.tree.query_bbox(west - pad_lng, south - pad_lat, east + pad_lng, north + pad_lat):
+        rings = _tile_rings(polygon.rings, project)
+        if not rings:
+            continue
+        properties = {'name': polygon.name}
+        summary = table.summary(polygon.name) if table else None
+        if summary:
+            properties.update({
+                'crimeRate': summary['crimeRate'],
+                'crimeCount': summary['crimeCount'],
+                'rank': summary['rank']
+            })
+        features.append((None, properties, 3, _polygon_geometry(rings)))
+    return features
+
+
+def available_layers():
+    """Layers that can be rendered now; lga_crime needs the LGA boundaries file"""
+    try:
+        get_lga_index()
+    except LgaBoundariesError:
+        return list(POINT_LAYERS)
+    return list(LAYERS)
+
+
+def render_tile(layer, z, x, y):
+    """Encoded tile bytes (empty if the tile has no features)"""
+    if layer not in LAYERS:
+        raise VectorTileError(f"Unknown layer: {layer}")
+    if not (0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise VectorTileError(f"Tile {z}/{x}/{y} is out of range")
+    features = _lga_crime_features(z, x, y) if layer == 'lga_crime' else _point_features(layer, z, x, y)
+    return encode_layer(layer, features) if features else b''
+
+
+class VectorTileCache:
+    """Byte-bounded LRU of rendered tiles, backed by pre-rendered tiles on disk"""
+
+    def __init__(self, tile_dir=TILE_DIR, ttl=TILE_TTL, max_bytes=MEMORY_BYTES):
+        self.tile_dir = tile_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._tiles = OrderedDict()  # (layer, z, x, y) -> (rendered, data)
+        self._bytes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.renders = 0
+
+    def _path(self, key):
+        layer, z, x, y = key
+        return os.path.join(self.tile_dir, layer, str(z), str(x), f"{y}.mvt")
+
+    def get(self, layer, z, x, y):
+        key = (layer, z, x, y)
+        now = time.time()
+        with self._lock:
+            entry = self._tiles.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._tiles.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        path = self._path(key)
+        try:
+            if now - os.path.getmtime(path) < self.ttl:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                self._remember(key, os.path.getmtime(path), data)
+                with self._lock:
+                    self.disk_hits += 1
+                return data
+        except OSError:
+            pass
+
+        data = render_tile(layer, z, x, y)
+        self._remember(key, now, data)
+        with self._lock:
+            self.renders += 1
+        return data
+
+    def _remember(self, key, rendered, data):
+        with self._lock:
+            old = self._tiles.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._tiles[key] = (rendered, data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and self._tiles:
+                _, (_, evicted) = self._tiles.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def prerender(self, layer, min_zoom, max_zoom, south, west, north, east):
+        """Render every tile of a bbox to disk for a range of zooms"""
+        for z in range(min_zoom, max_zoom + 1):
+            tiles = tiles_for_bbox(south, west, north, east, z)
+            for x, y in tiles:
+                data = render_tile(layer, z, x, y)
+                path = self._path((layer, z, x, y))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            print(f"Rendered {len(tiles)} {layer} tiles at zoom {z}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'memory_tiles': len(self._tiles),
+                'memory_bytes': self._bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'renders': self.renders
+            }
+
+
+vector_tiles = VectorTileCache()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 5 or sys.argv[1] != 'render' or sys.argv[2] not in LAYERS:
+        print(f"Usage: python vector_tiles.py render {{{'|'.join(LAYERS)}}} min_zoom max_zoom [south,west,north,east]")
+        sys.exit(1)
+    render_bbox = parse_bbox(sys.argv[5]) if len(sys.argv) > 5 else SYDNEY_BBOX
+    vector_tiles.prerender(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), *render_bbox)
@@ -0,0 +1,419 @@
+"""Offline pedestrian routing over a graph built from a local OpenStreetMap extract.
+
+The graph is compiled once from an .osm (XML) or .osm.pbf extract and saved
+as a NumPy .npz file of flat arrays:
+
+    lngs, lats      int32 coordinates of every walkable node, in 1e-7 degrees
+    offsets         CSR row offsets: node i's edges are offsets[i]:offsets[i + 1]
+    targets         int32 node at the other end of each edge
+    lengths         float32 edge length in meters
+    cell_keys       sorted grid cell of every node, for snapping points to the graph
+    cell_nodes      node indices in cell_keys order
+
+Every way a person can walk along (footways, paths, steps and streets,
+minus motorways and ways tagged foot=no or private) becomes edges in both
+directions, and only the largest connected component is kept so a snapped
+point can always reach any other. Loading is a single np.load, so startup
+stays fast however large the extract was.
+
+Routes are found with A* using straight-line distance as the heuristic.
+
+Build the graph whenever the extract changes (.pbf needs the osmium package):
+
+    python walking_graph.py sydney.osm.pbf [output.npz]
+"""
+import heapq
+import math
+import os
+import sys
+import threading
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+WALKING_GRAPH_FILE = os.getenv('WALKING_GRAPH_FILE', 'static/data/walking_graph.npz')
+GRAPH_VERSION = 1
+
+EARTH_RADIUS = 6371000  # meters
+COORD_SCALE = 10 ** 7
+
+WALKABLE_HIGHWAYS = {
+    'footway', 'path', 'pedestrian', 'steps', 'living_street', 'residential', 'service', 'unclassified',
+    'tertiary', 'tertiary_link', 'secondary', 'secondary_link', 'primary', 'primary_link', 'trunk',
+    'trunk_link', 'track', 'cycleway', 'bridleway', 'corridor', 'road'
+}
+FOOT_ALLOWED = {'yes', 'designated', 'permissive'}
+FOOT_DENIED = {'no', 'private'}
+
+# Snapping grid, about 220 m by 185 m in Sydney
+CELL_SIZE = 0.002
+# Give up snapping a point farther than this from any walkable node
+MAX_SNAP_DISTANCE = 500  # meters
+
+# Same pace the OSRM results are adjusted to: 5 km/h plus 10% for crossings
+WALKING_SPEED = 1.38  # meters per second
+WALKING_DELAY_FACTOR = 1.1
+
+# Alternatives reuse A* with the edges of routes already found made this much longer
+ALTERNATIVE_PENALTY = 1.6
+MAX_ALTERNATIVES = 2
+
+
+class WalkingGraphError(Exception):
+    """Raised when the graph file is missing or unreadable, or no route exists"""
+
+
+def is_walkable(tags):
+    highway = tags.get('highway')
+    if not highway:
+        return False
+    foot = tags.get('foot')
+    if foot in FOOT_ALLOWED:
+        return True
+    if foot in FOOT_DENIED or tags.get('access') in FOOT_DENIED:
+        return False
+    if tags.get('sidewalk') == 'separate' and highway not in ('footway', 'path', 'pedestrian'):
+        # Mapped sidewalks carry the pedestrians; walking on the carriageway would double every street
+        return False
+    return highway in WALKABLE_HIGHWAYS
+
+
+def _read_osm_xml(path):
+    """(ways, coords) from an .osm file: walkable ways as node id lists, and their node coordinates"""
+    ways = []
+    needed = set()
+    for _, elem in ET.iterparse(path):
+        if elem.tag == 'way':
+            tags = {tag.get('k'): tag.get('v') for tag in elem.iter('tag')}
+            if is_walkable(tags):
+                refs = [int(nd.get('ref')) for nd in elem.iter('nd')]
+                ways.append(refs)
+                needed.update(refs)
+            elem.clear()
+        elif elem.tag == 'relation':
+            elem.clear()
+
+    # Second pass for just the coordinates the walkable ways use
+    coords = {}
+    for _, elem in ET.iterparse(path):
+        if elem.tag == 'node':
+            node_id = int(elem.get('id'))
+            if node_id in needed:
+                coords[node_id] = (float(elem.get('lon')), float(elem.get('lat')))
+            elem.clear()
+    return ways, coords
+
+
+def _read_osm_pbf(path):
+    try:
+        import osmium
+    except ImportError:
+        raise WalkingGraphError("Reading .pbf extracts needs the osmium package (pip install osmium)")
+
+    ways = []
+    coords = {}
+
+    class Handler(osmium.SimpleHandler):
+        def way(self, way):
+            if is_walkable({tag.k: tag.v for tag in way.tags}):
+                refs = []
+                for node in way.nodes:
+                    if node.location.valid():
+                        refs.append(node.ref)
+                        coords[node.ref] = (node.location.lon, node.location.lat)
+                ways.append(refs)
+
+    Handler().apply_file(path, locations=True)
+    return ways, coords
+
+
+def _segment_lengths(lng1, lat1, lng2, lat2):
+    """Haversine distances in meters between arrays of points in degrees"""
+    lng1, lat1, lng2, lat2 = map(np.radians, (lng1, lat1, lng2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _cell_keys(lngs, lats):
+    # lngs/lats in degrees; one int64 key per grid cell
+    return np.floor(lats / CELL_SIZE).astype(np.int64) * 1000000 + np.floor(lngs / CELL_SIZE).astype(np.int64)
+
+
+def _largest_component(n, offsets, targets):
+    labels = np.full(n, -1, dtype=np.int32)
+    component, offsets, targets = memoryview(labels), memoryview(offsets), memoryview(targets)
+    best, best_size, label = -1, 0, 0
+    for start in range(n):
+        if component[start] != -1:
+            continue
+        component[start] = label
+        stack, size = [start], 0
+        while stack:
+            node = stack.pop()
+            size += 1
+            for edge in range(offsets[node], offsets[node + 1]):
+                target = targets[edge]
+                if component[target] == -1:
+                    component[target] = label
+                    stack.append(target)
+        if size > best_size:
+            best, best_size = label, size
+        label += 1
+    return labels == best
+
+
+def build_graph(osm_path):
+    """Compile an .osm or .osm.pbf extract into the graph arrays"""
+    if osm_path.endswith('.pbf'):
+        ways, coords = _read_osm_pbf(osm_path)
+    else:
+        ways, coords = _read_osm_xml(osm_path)
+
+    index = {}
+    sources, dests = [], []
+    for refs in ways:
+        refs = [ref for ref in refs if ref in coords]
+        for a, b in zip(refs, refs[1:]):
+            if a != b:
+                sources.append(index.setdefault(a, len(index)))
+                dests.append(index.setdefault(b, len(index)))
+    if not index:
+        raise WalkingGraphError(f"No walkable ways found in {osm_path}")
+
+    node_coords = np.empty((len(index), 2))
+    for node_id, i in index.items():
+        node_coords[i] = coords[node_id]
+    sources, dests = np.array(sources, dtype=np.int32), np.array(dests, dtype=np.int32)
+    # Both directions, with duplicate segments (shared by two ways) removed
+    pairs = np.unique(np.column_stack((np.concatenate((sources, dests)), np.concatenate((dests, sources)))), axis=0)
+
+    def csr(n, pairs):
+        counts = np.bincount(pairs[:, 0], minlength=n)
+        return np.concatenate(([0], np.cumsum(counts))).astype(np.int32), pairs[:, 1].astype(np.int32)
+
+    offsets, targets = csr(len(index), pairs)
+    keep = _largest_component(len(index), offsets, targets)
+    renumber = np.cumsum(keep) - 1
+    pairs = pairs[keep[pairs[:, 0]] & keep[pairs[:, 1]]]
+    pairs = renumber[pairs]
+    node_coords = node_coords[keep]
+    offsets, targets = csr(len(node_coords), pairs)
+
+    lngs, lats = node_coords[:, 0], node_coords[:, 1]
+    lengths = _segment_lengths(lngs[pairs[:, 0]], lats[pairs[:, 0]], lngs[pairs[:, 1]], lats[pairs[:, 1]])
+    keys = _cell_keys(lngs, lats)
+    order = np.argsort(keys, kind='stable')
+    return {
+        'version': np.array(GRAPH_VERSION),
+        'lngs': np.round(lngs * COORD_SCALE).astype(np.int32),
+        'lats': np.round(lats * COORD_SCALE).astype(np.int32),
+        'offsets': offsets,
+        'targets': targets,
+        'lengths': lengths.astype(np.float32),
+        'cell_keys': keys[order],
+        'cell_nodes': order.astype(np.int32)
+    }
+
+
+class WalkingGraph:
+    """Array-backed pedestrian graph with point snapping and A* routing"""
+
+    def __init__(self, arrays, path=None, mtime=None):
+        self.path = path
+        self.mtime = mtime
+        self.lngs = arrays['lngs'].astype(np.float64) / COORD_SCALE
+        self.lats = arrays['lats'].astype(np.float64) / COORD_SCALE
+        self.offsets = arrays['offsets']
+        self.targets = arrays['targets']
+        self.lengths = arrays['lengths']
+        self.cell_keys = arrays['cell_keys']
+        self.cell_nodes = arrays['cell_nodes']
+
+        # memoryviews index to plain Python numbers, much faster than NumPy scalars in the search loop
+        self._lngs = memoryview(self.lngs)
+        self._lats = memoryview(self.lats)
+        self._offsets = memoryview(self.offsets)
+        self._targets = memoryview(self.targets)
+        self._lengths = memoryview(self.lengths)
+
+        # Meters per degree for the A* heuristic, shrunk slightly so it never overestimates
+        self._ky = EARTH_RADIUS * math.pi / 180 * 0.995
+        self._kx = self._ky * min(math.cos(math.radians(float(self.lats.min()))),
+                                  math.cos(math.radians(float(self.lats.max())))) if len(self.lats) else self._ky
+
+    @property
+    def node_count(self):
+        return len(self.lngs)
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    def nearest_node(self, lng, lat):
+        """Closest graph node to a point, or None if none is within MAX_SNAP_DISTANCE"""
+        cell_lat, cell_lng = math.floor(lat / CELL_SIZE), math.floor(lng / CELL_SIZE)
+        reach = int(MAX_SNAP_DISTANCE / (EARTH_RADIUS * math.radians(CELL_SIZE) * math.cos(math.radians(lat)))) + 1
+        best, best_distance = None, MAX_SNAP_DISTANCE
+        for ring in range(reach + 1):
+            candidates = []
+            for d_lat in range(-ring, ring + 1):
+                for d_lng in range(-ring, ring + 1):
+                    if max(abs(d_lat), abs(d_lng)) != ring:
+                        continue
+                    key = (cell_lat + d_lat) * 1000000 + cell_lng + d_lng
+                    lo, hi = np.searchsorted(self.cell_keys, [key, key + 1])
+                    candidates.append(self.cell_nodes[lo:hi])
+            candidates = np.concatenate(candidates)
+            if len(candidates):
+                distances = _segment_lengths(lng, lat, self.lngs[candidates], self.lats[candidates])
+                i = int(distances.argmin())
+                if distances[i] < best_distance:
+                    best, best_distance = int(candidates[i]), float(distances[i])
+            # Anything in the next ring is at least this far away
+            if best is not None and best_distance <= ring * EARTH_RADIUS * math.radians(CELL_SIZE) * 0.5:
+                break
+        return best
+
+    def shortest_path(self, source, target, penalties=None):
+        """Node list of the shortest path by A*; penalties maps edge index -> length multiplier"""
+        lngs, lats = self._lngs, self._lats
+        offsets, targets, lengths = self._offsets, self._targets, self._lengths
+        kx, ky = self._kx, self._ky
+        target_lng, target_lat = lngs[target], lats[target]
+
+        best = {source: 0.0}
+        previous = {source: -1}
+        done = set()
+        queue = [(0.0, source)]
+        while queue:
+            _, node = heapq.heappop(queue)
+            if node == target:
+                break
+            if node in done:
+                continue
+            done.add(node)
+            base = best[node]
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[edge]
+                if neighbour in done:
+                    continue
+                length = lengths[edge]
+                if penalties and edge in penalties:
+                    length *= penalties[edge]
+                cost = base + length
+                if cost < best.get(neighbour, math.inf):
+                    best[neighbour] = cost
+                    previous[neighbour] = node
+                    estimate = math.hypot((lngs[neighbour] - target_lng) * kx, (lats[neighbour] - target_lat) * ky)
+                    heapq.heappush(queue, (cost + estimate, neighbour))
+        else:
+            raise WalkingGraphError("No walking route between these points")
+
+        nodes = [target]
+        while previous[nodes[-1]] != -1:
+            nodes.append(previous[nodes[-1]])
+        nodes.reverse()
+        return nodes
+
+    def path_edges(self, nodes):
+        """Edge indices along a node path"""
+        edges = []
+        for a, b in zip(nodes, nodes[1:]):
+            start, end = self.offsets[a], self.offsets[a + 1]
+            edges.append(start + int(np.flatnonzero(self.targets[start:end] == b)[0]))
+        return edges
+
+    def route(self, points, alternatives=False):
+        """Routes through [lng, lat] points as [(path, distance)], the shortest first"""
+        nodes = []
+        for lng, lat in points:
+            node = self.nearest_node(float(lng), float(lat))
+            if node is None:
+                raise WalkingGraphError(f"No walkable path within {MAX_SNAP_DISTANCE} m of {lng},{lat}")
+            nodes.append(node)
+
+        routes = [self._route_legs(nodes)]
+        if alternatives:
+            penalties = {}
+            for _ in range(MAX_ALTERNATIVES):
+                for edge in self.path_edges(routes[-1]):
+                    penalties[edge] = ALTERNATIVE_PENALTY
+                legs = self._route_legs(nodes, penalties)
+                if legs not in routes:
+                    routes.append(legs)
+
+        results = []
+        for route_nodes in routes:
+            edges = self.path_edges(route_nodes)
+            distance = float(self.lengths[edges].sum()) if edges else 0.0
+            path = [[float(self.lngs[n]), float(self.lats[n])] for n in route_nodes]
+            results.append((path, distance))
+        return results
+
+    def _route_legs(self, nodes, penalties=None):
+        route = [nodes[0]]
+        for source, target in zip(nodes, nodes[1:]):
+            route.extend(self.shortest_path(source, target, penalties)[1:])
+        return route
+
+
+def write_graph(arrays, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_graph(path=WALKING_GRAPH_FILE):
+    try:
+        mtime = os.path.getmtime(path)
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+    except (OSError, ValueError) as e:
+        raise WalkingGraphError(f"Cannot open walking graph {path}: {e}")
+    if int(arrays.get('version', -1)) != GRAPH_VERSION:
+        raise WalkingGraphError(f"Walking graph {path} is from another version; rebuild it with walking_graph.py")
+    return WalkingGraph(arrays, path, mtime)
+
+
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_walking_graph(path=WALKING_GRAPH_FILE):
+    """Return the loaded graph, reloading it if the file changed"""
+    global _graph
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        raise WalkingGraphError(f"Walking graph not found: {path}")
+
+    graph = _graph
+    if graph is not None and graph.path == path and graph.mtime == mtime:
+        return graph
+
+    with _graph_lock:
+        graph = _graph
+        if graph is not None and graph.path == path and graph.mtime == mtime:
+            return graph
+        _graph = load_graph(path)
+        print(f"Loaded walking graph {path}: {_graph.node_count} nodes, {_graph.edge_count} edges")
+        return _graph
+
+
+def walking_duration(distance):
+    return distance / WALKING_SPEED * WALKING_DELAY_FACTOR
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit("usage: python walking_graph.py extract.osm[.pbf] [output.npz]")
+    output = sys.argv[2] if len(sys.argv) > 2 else WALKING_GRAPH_FILE
+
+    arrays = build_graph(sys.argv[1])
+    write_graph(arrays, output)
+    print(f"Wrote {output}: {len(arrays['lngs'])} nodes, {len(arrays['targets'])} edges "
+          f"({os.path.getsize(output)} bytes)")